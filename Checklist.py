@@ -51,15 +51,11 @@ class Checklist:
         5. Initiates stitching if the required number of images is detected.
         """
         if result is not None:
-            names = result.names
-            
-            for box in result.boxes:
-                detected_img_id = names[int(box.cls[0].item())]
-                detected_conf_level = box.conf.item()
+            for detected_img_id, detected_conf_level in zip(result.labels, result.conf.tolist()):
                 if detected_img_id in self.IMG_BLACKLIST:
                     continue
             
-                add_to_stitching_dict(self.stitching_img_dict, detected_img_id, detected_conf_level, frame)
+                add_to_stitching_dict(self.stitching_img_dict, detected_img_id, detected_conf_level, result.plot)
                 
                 # Saving the frames into dictionaries
                 last_seen = time_ns()
@@ -39,6 +39,10 @@ class Task1:
         self.segments = []
         self.segments_index = 0
         self.obstacle_order = []
+        self.snap_hints = [] # L, C or R: where each obstacle's card is in view at its SNAP, sent with DETECT
+        # The PC can send the start of the path first; the run only ends once the final path is in
+        self.path_final = True
+        self.waiting_for_path = False
         
         self.directions = []
         self.direction_index = 0
@@ -86,6 +90,13 @@ class Task1:
                         logging.info("Cleared obstacles list.")
                     elif msg_parts[0] == "PATH":
                         self.pc.send("OBSTACLES," + json.dumps(self.obstacles))
+                    elif msg_parts[0] == "RETRY":
+                        # Ask the PC for its next best plan for the same obstacles. It starts from the start
+                        # pose, so it cannot replace a run that has begun
+                        if self.started:
+                            logging.warning("RETRY ignored, the run has already begun.")
+                        else:
+                            self.pc.send("RETRY")
             except OSError as e:
                 print(f"Error: {e}")
                 continue
@@ -95,11 +106,32 @@ class Task1:
             try:
                 pc_msg = self.pc.receive()
                 if pc_msg.startswith("PATH"):
-                    path = json.loads(pc_msg.split("PATH,")[1])
+                    # The start of the path and the final path can arrive in one read; the last one wins
+                    path = json.loads(pc_msg.split("PATH,")[-1])
                     logging.info(f"Received path segments: {path}")
-                    self.segments = path['segments']
-                    self.obstacle_order = path['obstacle_ids']
-                    self.directions = path['dirs']
+                    seg = None
+                    with self._idx_lock:
+                        # Once the run has begun, only the rest of a streamed path is taken. Any other path
+                        # (e.g. the answer to a RETRY sent just before BEGIN) starts from the start pose
+                        if self.started and self.path_final:
+                            logging.warning("Path received after the run began, ignoring it.")
+                            continue
+                        # A later path begins with the segments already received, so the index carries on
+                        self.segments = path['segments']
+                        self.obstacle_order = path['obstacle_ids']
+                        self.snap_hints = path.get('snap_hints', [])
+                        self.directions = path['dirs']
+                        self.path_final = path.get('final', True)
+                        # The robot finished the segments it had and is waiting for these
+                        if self.waiting_for_path and self.segments_index < len(self.segments):
+                            self.waiting_for_path = False
+                            seg = self.segments[self.segments_index]
+                            self.segments_index += 1
+
+                    if seg is not None:
+                        cmd = ",".join(seg) + "\n"
+                        self.stm.send(cmd)
+                        logging.info(f"Sent path segment {self.segments_index}/{len(self.segments)} to STM: {seg}")
                 elif pc_msg.startswith("OBJECT"):
                     self.image_done.set()
                     msg_split = pc_msg.replace("\n", "").split(",")[1:]
@@ -139,22 +171,32 @@ class Task1:
                 elif "OK" in stm_msg:
                     with self._idx_lock:
                         just_finished_idx = self.segments_index - 1
-                        more_to_send = self.segments_index < len(self.segments)
                     
                     if just_finished_idx >= 0 and just_finished_idx < len(self.obstacle_order):
                         self.image_done.clear()
                         message_content = f"DETECT,{self.obstacle_order[just_finished_idx]}"
+                        if just_finished_idx < len(self.snap_hints) and self.snap_hints[just_finished_idx]:
+                            message_content += f",{self.snap_hints[just_finished_idx]}"
                         self.pc.send(message_content)
                         
                         self.image_done.wait(timeout=self.timeout)
                     
-                    if more_to_send:
-                        with self._idx_lock:
+                    # Checked after the picture, as the rest of the path may have come in meanwhile
+                    with self._idx_lock:
+                        more_to_send = self.segments_index < len(self.segments)
+                        if more_to_send:
                             seg = self.segments[self.segments_index]
                             self.segments_index += 1
+                        # Out of segments before the final path came in: pc_receive sends the next one
+                        waiting = not more_to_send and not self.path_final
+                        self.waiting_for_path = waiting
+
+                    if more_to_send:
                         cmd = ",".join(seg) + "\n"
                         self.stm.send(cmd)
                         logging.info(f"Sent path segment {self.segments_index}/{len(self.segments)} to STM: {seg}")
+                    elif waiting:
+                        logging.info("Waiting for the rest of the path from PC.")
                     else:
                         self.pc.send(f'STITCH,{len(self.segments) - 1}') # -1 cause of FIN segment
                         # self.android.disconnect()
@@ -4,11 +4,87 @@ import cv2
 import numpy as np
 import os
 import inspect  # <-- add this
+import threading
+import time
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from ultralytics import YOLO
+from inference import Detections, InferenceScheduler, SceneGate, create_detector
+from tracker import Tracker
+
+MAX_FRAME_SIZE = 50_000_000  # sanity check (50MB cap)
+
+
+class FrameReader:
+    """
+    Reads the stream server's replies and length-prefixed frames without a copy per chunk.
+
+    Reply lines are read through a small buffer instead of one recv per byte; whatever arrived
+    after the line is kept and read first. Frames are read with recv_into straight into reusable
+    bytearrays: read_frame hands out a buffer and the frame size, and the buffer goes back to the
+    pool with release() once decoded. A buffer too small for a frame is replaced by a bigger one,
+    so the pool settles at a few buffers of the largest frame size.
+    """
+    def __init__(self, sock, line_buffer_size=4096):
+        self.sock = sock
+        self.line_buffer_size = line_buffer_size
+        self._pending = b"" # received after the last reply line
+        self._size = bytearray(4)
+        self._size_view = memoryview(self._size)
+        # Buffers free to read into; list append/pop are atomic, the receiver and inference threads share it
+        self._free = []
+
+    def readline(self, maxlen=256):
+        buf = bytearray(self._pending)
+        self._pending = b""
+        while b"\n" not in buf and len(buf) < maxlen:
+            chunk = self.sock.recv(self.line_buffer_size)
+            if not chunk:
+                return None
+            buf += chunk
+        end = buf.find(b"\n") + 1 or maxlen
+        line, self._pending = bytes(buf[:end]), bytes(buf[end:])
+        return line
+
+    def _read_into(self, view):
+        got = 0
+        if self._pending:
+            got = min(len(self._pending), len(view))
+            view[:got] = self._pending[:got]
+            self._pending = self._pending[got:]
+        size = len(view)
+        while got < size:
+            n = self.sock.recv_into(view[got:] if got else view)
+            if not n:
+                return False
+            got += n
+        return True
+
+    def read_frame(self):
+        """Read the next frame
+
+        Returns:
+            (bytearray, int): buffer holding the JPEG bytes at its start, and their size;
+                              None when the stream ends or the size makes no sense
+        """
+        if not self._read_into(self._size_view):
+            return None
+        size = struct.unpack("!I", self._size)[0]
+        if size <= 0 or size > MAX_FRAME_SIZE:
+            return None
+
+        buffer = self._free.pop() if self._free else bytearray(size)
+        if len(buffer) < size:
+            buffer = bytearray(max(size, 2 * len(buffer)))
+        with memoryview(buffer) as view:
+            if not self._read_into(view[:size]):
+                return None
+        return buffer, size
+
+    def release(self, buffer):
+        """Give a buffer from read_frame back, once nothing refers to its bytes anymore"""
+        self._free.append(buffer)
 
 
 class StreamListener:
@@ -21,19 +97,76 @@ class StreamListener:
       - to stop: send 'STOP\\n' and close
 
     Callback signatures supported:
-      (A) on_result(result, annotated_frame, raw_frame)
-      (B) on_result(result, annotated_frame)   # legacy
-          - when there are no detections, annotated_frame will be the raw frame (not None)
+      (A) on_result(detections, annotated_frame, raw_frame)
+          - annotated_frame is detections.plot(), None when there are no detections
+      (B) on_result(detections, frame)
+          - frame is the raw frame; detections.plot() draws the boxes only if called
+      detections is an inference.Detections (NumPy boxes, confidences, classes, names and the frame
+      time), None when there are no detections. Boxes are only drawn for (A) or show_video.
+
+    Threads:
+      - a receiver thread drains the socket into a single "latest frame" slot, so frames never
+        queue up in the TCP buffer while inference is running
+      - the thread calling start_stream_read decodes and runs YOLO on the newest frame only;
+        frames replaced in the slot before inference got to them are counted as dropped
+      - frame_time is the time_ns() the frame being handled was received at
+
+    Scene gate:
+      - frames that look the same as the last one inference ran on (see inference.SceneGate) skip
+        inference; the callbacks get a copy of the last result on the new frame, with its frame_time
+      - thresholds come from the SCENE_* entries in .env, SCENE_GATE=0 or gate=None runs every frame
+
+    Scheduler:
+      - inference only runs on the frames scheduler.due() lets through (see inference.InferenceScheduler);
+        the others are dropped undecoded and never reach the callbacks
+      - the default scheduler is always armed, so every frame goes through
+      - while the scheduler is armed with a SNAP hint, inference looks at that side of the frame first
+      - frames in a window armed with arm(window) (a SNAP) bypass the scene gate and the tracker, so
+        that evidence.EvidenceAccumulator, which only counts real detections, decides fast
+
+    Tracker:
+      - YOLO runs on one frame in detect_every (TRACK_EVERY in .env, 3 if unset); in between, the
+        boxes of the last detection are carried over by tracker.Tracker and handed to the callbacks
+        as if detected
+      - YOLO runs earlier when the tracker degrades (a card lost or not detected for too long)
+      - every Detections has tracked, False for a real detection, and age, the seconds since the
+        last real detection
+      - TRACK_EVERY=1 or tracker=None runs YOLO on every frame
     """
-    def __init__(self, weights):
+    def __init__(self, weights, backend=None, imgsz=None, gate="env", scheduler=None, tracker="env"):
         self.HOST = os.getenv("RPI_HOST")
         self.PORT = os.getenv("STREAM_PORT")
         self.REQ_STREAM = bytes(os.getenv("REQ_STREAM") + "\n", "utf-8")
         self.STOP_STREAM = bytes(os.getenv("STOP_STREAM") + "\n", "utf-8")
         self.PING_STREAM = bytes(os.getenv("PING_STREAM") + "\n", "utf-8")
 
-        self.model = YOLO(weights)
+        # torch, onnx or openvino; None for YOLO_BACKEND from .env, see inference.load_model.
+        # Frames are letterboxed to imgsz (YOLO_IMGSZ from .env when None, "auto" to pick one), see inference.Detector
+        self.detector = create_detector(weights, backend, imgsz)
+        self.model = self.detector.model
+        self.gate = SceneGate.from_env() if gate == "env" else gate
+        self.scheduler = scheduler if scheduler is not None else InferenceScheduler()
+        self.detect_every = int(os.getenv("TRACK_EVERY", 3))
+        self.tracker = (Tracker.from_env() if self.detect_every > 1 else None) if tracker == "env" else tracker
         self.sock = None
+        self.frames = None # FrameReader over sock
+
+        # Latest-frame slot, filled by the receiver thread: (buffer, size, time_ns received) or None
+        self._slot = None
+        self._slot_cond = threading.Condition()
+        self._receiving = False
+        self._receiver = None
+        self.frame_time = None # time_ns() the frame passed to the callbacks was received at
+
+        # Counters, see get_stats
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_processed = 0
+        self.frames_skipped = 0 # processed without inference, the scene had not changed
+        self.frames_idle = 0 # not due while the scheduler was idle
+        self.frames_tracked = 0 # processed by the tracker instead of YOLO
+        self.queue_age = 0.0 # seconds the last processed frame waited in the slot
+        self.max_queue_age = 0.0
 
     # --- low-level helpers ---
     def _connect(self):
@@ -43,29 +176,83 @@ class StreamListener:
         except Exception:
             pass
         self.sock.settimeout(None)
+        self.frames = FrameReader(self.sock)
 
-    def _readline(self, maxlen=256):
-        buf = bytearray()
-        while len(buf) < maxlen:
-            ch = self.sock.recv(1)
-            if not ch:
-                return None
-            buf += ch
-            if ch == b"\n":
-                break
-        return bytes(buf)
-
-    def _recv_exact(self, n):
-        data = bytearray()
-        while len(data) < n:
-            chunk = self.sock.recv(n - len(data))
-            if not chunk:
-                return None
-            data.extend(chunk)
-        return bytes(data)
+    def _disconnect(self):
+        # shutdown first: it wakes up a receiver blocked in a read on another thread
+        try:
+            if self.sock:
+                self.sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        try:
+            if self.sock:
+                self.sock.close()
+        except Exception:
+            pass
+        self.sock = None
+
+    # --- receiver thread: socket -> latest-frame slot ---
+    def _receive_frames(self):
+        try:
+            while True:
+                # 1) length header and JPEG payload, into a buffer from the pool
+                frame = self.frames.read_frame()
+                if frame is None:
+                    break
+                buffer, size = frame
+
+                # 2) replace whatever inference has not picked up yet
+                with self._slot_cond:
+                    if self._slot is not None:
+                        self.frames_dropped += 1
+                        self.frames.release(self._slot[0])
+                    self._slot = (buffer, size, time.time_ns())
+                    self.frames_received += 1
+                    self._slot_cond.notify()
+        except (OSError, ValueError, AttributeError):
+            # socket closed under us (close() or the inference side stopping)
+            pass
+        finally:
+            with self._slot_cond:
+                self._receiving = False
+                self._slot_cond.notify()
+
+    def _next_frame(self):
+        """Block until a frame is in the slot and take it; None once the stream has ended"""
+        with self._slot_cond:
+            while self._slot is None and self._receiving:
+                self._slot_cond.wait()
+            item, self._slot = self._slot, None
+        if item is None:
+            return None
+
+        received = item[2]
+        self.queue_age = (time.time_ns() - received) * 1e-9
+        self.max_queue_age = max(self.max_queue_age, self.queue_age)
+        return item
+
+    def get_stats(self):
+        """
+        Frames received, dropped (replaced before inference), left out by the idle scheduler,
+        processed and skipped by the gate, and how long frames waited
+        """
+        return {
+            "received": self.frames_received,
+            "dropped": self.frames_dropped,
+            "idle": self.frames_idle,
+            "processed": self.frames_processed,
+            "skipped": self.frames_skipped,
+            "skip_rate": self.frames_skipped / self.frames_processed if self.frames_processed else 0.0,
+            "tracked": self.frames_tracked,
+            "roi_hits": self.detector.roi_hits,
+            "roi_fallbacks": self.detector.roi_fallbacks,
+            "queue_age": self.queue_age,
+            "max_queue_age": self.max_queue_age,
+        }
 
     # --- NEW: smart callback invoker (3-arg or 2-arg) ---
-    def _invoke_on_result(self, cb, res, annotated, raw):
+    def _invoke_on_result(self, cb, res, raw):
         if cb is None:
             return
         try:
@@ -76,10 +263,9 @@ class StreamListener:
             params = 3
         try:
             if params >= 3:
-                cb(res, annotated, raw)
+                cb(res, res.plot() if res is not None else None, raw)
             else:
-                # legacy 2-arg: if no detections, send the raw frame instead of None
-                cb(res, annotated if annotated is not None else raw)
+                cb(res, raw)
         except Exception as e:
             print(f"[StreamListener] on_result error: {e}")
 
@@ -87,59 +273,89 @@ class StreamListener:
         if self.sock is None:
             self._connect()
         self.sock.sendall(self.REQ_STREAM)
-        header = self._readline()
+        header = self.frames.readline()
         print(header.decode("utf-8") if header else "NO HEADER")
 
     def start_stream_read(self, on_result, on_disconnect, conf_threshold=0.7, show_video=True):
         """
         Connects, requests stream, and processes frames with YOLO.
         Calls:
-          - on_result(result, annotated_frame, raw_frame)  # preferred
-          - or on_result(result, annotated_frame)          # legacy; raw is used if annotated is None
+          - on_result(detections, annotated_frame, raw_frame)  # draws the boxes on every frame
+          - or on_result(detections, frame)                    # raw frame; call detections.plot() to draw
           - on_disconnect() when the stream ends
         Press ESC to stop (if show_video=True).
         """
         try:
             self.req_stream()
 
-            while True:
-                # 1) read 4-byte length header
-                hdr = self._recv_exact(4)
-                if hdr is None:
-                    break
-                size = struct.unpack("!I", hdr)[0]
-                if size <= 0 or size > 50_000_000:  # sanity check (50MB cap)
-                    break
+            self._slot = None
+            self._receiving = True
+            self._receiver = threading.Thread(target=self._receive_frames, daemon=True)
+            self._receiver.start()
 
-                # 2) read JPEG payload
-                jpg = self._recv_exact(size)
-                if jpg is None:
+            if self.gate is not None:
+                self.gate.reset()
+            if self.tracker is not None:
+                self.tracker.reset()
+            last = None # Detections of the last frame inference or the tracker ran on
+            last_roi = None # SNAP hint it ran with
+            detection = None # (Detections, time_ns) of the last real detection
+            since_detection = 0 # frames the tracker handled since then
+
+            while True:
+                # 1) newest frame from the receiver, older ones were dropped
+                item = self._next_frame()
+                if item is None:
                     break
+                buffer, size, frame_time = item
+                if not self.scheduler.due(frame_time):
+                    self.frames.release(buffer)
+                    self.frames_idle += 1
+                    continue
+                self.frame_time = frame_time
 
-                # 3) decode frame
-                frame = cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                # 2) decode frame, from a view of the receive buffer; the decoded image does not refer to it
+                frame = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8, count=size), cv2.IMREAD_COLOR)
+                self.frames.release(buffer)
                 if frame is None:
                     # corrupted frame; skip but still keep UI responsive
-                    self._invoke_on_result(on_result, None, None, None)
+                    self._invoke_on_result(on_result, None, None)
                     continue
 
-                # 4) YOLO inference
-                res = self.model.predict(
-                    frame, save=False, imgsz=frame.shape[1],
-                    conf=conf_threshold, verbose=False
-                )[0]
-
-                # 5) callbacks + optional display
-                if len(res.boxes) > 0:
-                    annotated = res.plot()
-                    self._invoke_on_result(on_result, res, annotated, frame)
-                    disp = annotated
-                else:
-                    # pass raw frame to callback so recorders can use it
-                    self._invoke_on_result(on_result, None, None, frame)
-                    disp = frame
+                # 3) YOLO inference at the fixed input size, boxes in frame coordinates, unless nothing
+                #    changed since the last frame it ran on with the same ROI, or the tracker can go on
+                self.frames_processed += 1
+                roi = self.scheduler.get_roi(self.frame_time)
+                # In a SNAP window every frame gets a real detection, the evidence only counts those
+                snap = self.scheduler.in_window(self.frame_time)
+                changed = self.gate is None or snap or self.gate.changed(frame, self.frame_time)
+                res = None
+                if not changed and roi == last_roi:
+                    self.frames_skipped += 1
+                    res = last.for_frame(frame, self.frame_time)
+                elif (self.tracker is not None and not snap and detection is not None and roi == last_roi and
+                      since_detection + 1 < self.detect_every and not self.tracker.degraded):
+                    # 3b) carry the last detection over, unless the tracker lost a card on this frame
+                    data = self.tracker.propagate(frame, self.frame_time)
+                    if not self.tracker.degraded:
+                        self.frames_tracked += 1
+                        since_detection += 1
+                        res = Detections(data[:, :4], data[:, 4], data[:, 5], detection[0].names, frame,
+                                         self.frame_time, tracked=True)
+                if res is None:
+                    res = self.detector.predict(frame, conf_threshold, roi=roi, timestamp=self.frame_time)
+                    detection, since_detection = (res, self.frame_time), 0
+                    if self.tracker is not None:
+                        self.tracker.update(res.xyxy, res.conf, res.cls, frame, self.frame_time)
+                res.age = (self.frame_time - detection[1]) * 1e-9
+                last, last_roi = res, roi
+
+                # 4) callbacks + optional display; boxes are drawn only if someone looks at them
+                detections = res if len(res) > 0 else None
+                self._invoke_on_result(on_result, detections, frame)
 
                 if show_video:
+                    disp = detections.plot() if detections is not None else frame
                     cv2.imshow("Stream", disp)
                     key = cv2.waitKey(1) & 0xFF
                     if key == 27:  # ESC
@@ -151,17 +367,12 @@ class StreamListener:
 
         finally:
             # ensure cleanup
-            try:
-                if self.sock:
-                    self.sock.shutdown(socket.SHUT_RDWR)
-            except Exception:
-                pass
-            try:
-                if self.sock:
-                    self.sock.close()
-            except Exception:
-                pass
-            self.sock = None
+            self._disconnect()
+            if self._receiver is not None:
+                self._receiver.join(timeout=1.0)
+                self._receiver = None
+            self.frames = None
+            print(f"[StreamListener] stream ended: {self.get_stats()}")
             if show_video:
                 try:
                     cv2.destroyAllWindows()
@@ -177,9 +388,8 @@ class StreamListener:
                     self.sock.sendall(self.STOP_STREAM)
                 except Exception:
                     pass
-                self.sock.close()
         finally:
-            self.sock = None
+            self._disconnect()
             try:
                 cv2.destroyAllWindows()
             except Exception:
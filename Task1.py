@@ -6,9 +6,15 @@ import logging
 
 logging.basicConfig(level=logging.INFO)
 
-from pathfinding.pathfinding import pathfinding
+from pathfinding.pathfinding import pathfinding, pathfinding_streaming, create_maze_solver, update_obstacles, replan
+from pathfinding.plan_cache import PlanCache
+from pathfinding.symmetry import EdgeCostStore
+from pathfinding.robustness import RobustnessEvaluator
+from pathfinding.validator import PlanValidator
 from stitching import add_to_stitching_dict, stitch_images
 from StreamListener import StreamListener
+from inference import InferenceScheduler
+from evidence import EvidenceAccumulator
 from pathfinding.consts import Direction
 
 PI_IP = "192.168.20.1"
@@ -29,6 +35,9 @@ class Task1:
         self.lag = 1.5e9 # Threshold after the obstacle timestamp to consider a match (in ns)
         self.img_time_dict = {} # Dictionary of image_id -> (first_seen_timestamp, last_seen_timestamp)
         self.pending_obstacles = [] # List of tuples (obstacle_id, timestamp). Represents obstacles waiting to be matched.
+        self.match_lock = threading.Lock() # guards img_time_dict and pending_obstacles, used by the stream and RPI threads
+        # Which images are in view, from the detections of every frame rather than the largest box of one
+        self.evidence = EvidenceAccumulator(ignore=self.IMG_BLACKLIST, hit_conf=self.conf_threshold)
         self.stitching_img_dict = {} # Dictionary of image_id -> (best_confidence_level, frame)
         self.ids_to_stitch = [] # List of image IDs to stitch
         self.should_stitch = False
@@ -36,9 +45,21 @@ class Task1:
         
         self.matched_img_ids = set()
         
+        self.obstacles = [] # Obstacles of the current run, as received from the RPI
+        self.maze_solver = None # Kept between messages so that REPLAN can reuse the previous searches
+        self.plan_cache = PlanCache("plan_cache") # Plans of layouts seen before, kept across runs
+        self.edge_store = EdgeCostStore() # Path costs of obstacle positions seen before, shared by every solve
+        self.alternatives = [] # Next best plans of the last solve, served on RETRY without solving again
+        self.validator = None # Checks every path against the current obstacles before it is sent
+        self.first_leg = None # First leg sent ahead of the rest of the run, until a final path follows it
+        self.num_alternatives = 3
+        
         self.model = "bestv8n.pt"
         self.filename = "stitches/task1"
         
+        # Inference idles at a low rate, and runs on every frame over the lag window of a DETECT still unmatched
+        self.scheduler = InferenceScheduler.from_env(armed=False)
+        
         # Threads
         self.pc_receive_thread = None
         self.stream_listener = None
@@ -48,67 +69,68 @@ class Task1:
         Callback function to handle detection results.
         Processes detected images, updates dictionaries, and matches images to obstacles.
         
-        1. Updates the stitching dictionary with the best confidence level and corresponding frame.
-        2. Updates the image time dictionary with first and last seen timestamps.
-        3. Checks for pending obstacles and matches them with detected images based on time overlap.
-        4. Sends matched image information to the PC via socket.
-        5. Initiates stitching if the required number of images is detected.
+        1. Adds the frame to the evidence of every image, see EvidenceAccumulator.
+        2. Of the images decided and on this frame, takes the largest: the card the robot is facing.
+        3. Updates the stitching dictionary with the best confidence level and corresponding frame.
+        4. Updates the image time dictionary with first and last seen timestamps.
+        5. Checks for pending obstacles and matches them with detected images based on time overlap.
         """
-        if result is not None:
-            names = result.names
-            
-            # 1) Find the single largest box (skip blacklist)
-            max_rec = None  # {"detected_img_id": str, "box": box, "area": float, "conf": float}
-
-            for box in result.boxes:
-                cls_id = int(box.cls[0].item())
-                detected_img_id = names[cls_id]
-                if str(detected_img_id) in self.IMG_BLACKLIST:
-                    continue
+        # When the frame was received, not when inference got to it, for the lead/lag windows
+        last_seen = self.stream_listener.frame_time or time_ns()
 
-                w = float(box.xywh[0][2].item())
-                h = float(box.xywh[0][3].item())
-                area = w * h
-                conf = float(box.conf[0].item()) if getattr(box.conf, "ndim", 0) else float(box.conf.item())
+        # 1) Frames without the image count against it too
+        self.evidence.update(result, last_seen)
+        if result is None:
+            return
 
-                if (max_rec is None or
-                    area > max_rec["area"] or
-                    (area == max_rec["area"] and conf > max_rec["conf"])):
-                    max_rec = {"detected_img_id": detected_img_id, "box": box, "area": area, "conf": conf}
+        # 2) Largest of the images decided on, among those on this frame (skip blacklist)
+        on_frame = [img_id for img_id in self.evidence.get_decided() if self.evidence.get(img_id).last_seen == last_seen]
+        if not on_frame:
+            return
+        detected_img_id = max(on_frame, key=lambda img_id: self.evidence.get(img_id).area)
+        evidence = self.evidence.get(detected_img_id)
 
-            # 2) If found, run the rest on just that one detection
-            if max_rec is not None:
-                detected_img_id = max_rec["detected_img_id"]
-                detected_conf_level = max_rec["conf"]
+        # 3) Best frame of the image for stitching
+        add_to_stitching_dict(self.stitching_img_dict, detected_img_id, evidence.conf, result.plot)
 
-                add_to_stitching_dict(self.stitching_img_dict, detected_img_id, detected_conf_level, frame)
+        with self.match_lock:
+            # Matched to a DETECT on the RPI thread meanwhile
+            if str(detected_img_id) in self.IMG_BLACKLIST:
+                return
 
-                last_seen = time_ns()
-                first_seen = self.img_time_dict.get(detected_img_id, (last_seen, None))[0]
-                self.img_time_dict[detected_img_id] = (first_seen, last_seen)
+            # 4) Seen since the first frame of the evidence, which comes before the decision
+            first_seen = self.img_time_dict.get(detected_img_id, (evidence.first_seen or last_seen, None))[0]
+            self.img_time_dict[detected_img_id] = (first_seen, last_seen)
 
-                # if len(self.pending_obstacles) > 0:
-                #     max_overlap = 0
-                #     max_obstacle_id = None
-                #     best_idx = None
-                #     for i, (obstacle_id, timestamp) in enumerate(self.pending_obstacles):
-                #         overlap = self.get_overlap_interval(detected_img_id, timestamp, first_seen, last_seen)
-                #         if overlap > max_overlap:
-                #             max_overlap = overlap
-                #             max_obstacle_id = obstacle_id
-                #             best_idx = i
+            # 5) Obstacles DETECTed before their image was seen can still be matched within their lag window
+            if len(self.pending_obstacles) > 0:
+                self.match_pending(detected_img_id, first_seen, last_seen)
 
-                #     if max_obstacle_id is not None:
-                #         self.send_matched_pair(max_obstacle_id, detected_img_id)
-                #         self.pending_obstacles.pop(best_idx)
+    
+    def match_pending(self, img_id, first_seen, last_seen):
+        """
+        Match a detected image to the pending obstacle whose search interval it overlaps the most.
+        Obstacles whose lag window is over are dropped; once none is left, inference goes back to idle.
+        Called with match_lock held.
+        """
+        now = time_ns()
+        self.pending_obstacles = [(obstacle_id, timestamp) for obstacle_id, timestamp in self.pending_obstacles
+                                  if now - timestamp <= self.lag]
+        max_overlap = 0
+        best_idx = None
+        for i, (obstacle_id, timestamp) in enumerate(self.pending_obstacles):
+            overlap = self.get_overlap_interval(img_id, timestamp, first_seen, last_seen)
+            if overlap > max_overlap:
+                max_overlap = overlap
+                best_idx = i
 
-                #         if self.should_stitch and len(self.ids_to_stitch) >= self.stitch_len:
-                #             logging.info("Found last image, stitching now...")
-                #             self.stream_listener.close()
-                #             self.should_stitch = False
-                #             stitch_images(self.ids_to_stitch, self.stitching_img_dict, filename=self.filename)
+        if best_idx is not None:
+            obstacle_id, _ = self.pending_obstacles.pop(best_idx)
+            self.send_matched_pair(obstacle_id, img_id)
+            del self.img_time_dict[img_id]
+        if not self.pending_obstacles:
+            self.scheduler.disarm()
 
-    
     def get_overlap_interval(self, img_id, timestamp, first_seen, last_seen):
         """
         Calculate the overlap interval between the search interval and the image's seen interval.
@@ -144,6 +166,61 @@ class Task1:
             if str(k) in self.IMG_BLACKLIST  # keep only those that are matched
         }
         
+    def send_path(self, path, final=True):
+        """
+        Segment the commands of a computed path and send them to the RPI.
+        A path that is not final only covers the start of the run; the RPI can start on it and
+        waits for the final path, which begins with the same segments, before going further.
+        """
+        commands = path['commands']
+        if not final:
+            # The run goes on after this path, so it must not end with the FIN segment
+            commands = [command for command in commands if not command.startswith("FIN")]
+        segments = self._segment_commands(commands)
+        segments['dirs'] = self.get_directions(path)
+        segments['final'] = final
+        logging.info(f"Segmented commands: {segments}")
+
+        # A bad path would otherwise only show when the robot crashes
+        if self.validator is not None:
+            start = path['path'][0]
+            errors = self.validator.validate(segments, final=final, start=(start['x'], start['y'], start['d']))
+            if errors:
+                logging.error(f"Path failed validation, not sending it: {errors}")
+                return False
+        
+        # send path back to server
+        self.sock.send(f"PATH,{json.dumps(segments)}\n".encode("utf-8"))
+        logging.info(f"Sent path back to rpi.")
+        return True
+
+    def send_first_leg(self, path):
+        """
+        Send the first leg of a streamed plan ahead of the rest, see pathfinding_streaming.
+        """
+        if self.send_path(path, final=False):
+            self.first_leg = path
+
+    def send_valid_path(self, path):
+        """
+        Send the path, or else the first of the alternatives that passes validation.
+        If none does after a first leg went out, the RPI is waiting for the rest of the run:
+        the first leg is sent again as the final path, so the run ends after it.
+        """
+        while not self.send_path(path):
+            if not self.alternatives:
+                if self.first_leg is not None:
+                    logging.error("No valid path to send, ending the run after the first leg.")
+                    path, self.first_leg = self.first_leg, None
+                    if not self.send_path(path):
+                        logging.error("First leg failed validation as a final path.")
+                    return
+                logging.error("No valid path to send.")
+                return
+            path = self.alternatives.pop(0)
+            logging.info(f"Trying alternative plan, {len(self.alternatives)} left.")
+        self.first_leg = None
+        
     def pc_receive(self) -> None:
         self.connect()
         logging.info("PC Socket connection started successfully")
@@ -159,37 +236,75 @@ class Task1:
                     logging.info(f"Parsed obstacles: {obstacles}")
                     
                     # call pathfinding
-                    path = pathfinding(obstacles)
+                    self.obstacles = obstacles
+                    if self.maze_solver is None:
+                        self.maze_solver = create_maze_solver(obstacles, big_turn=self.big_turn, engine="incremental",
+                                                              edge_store=self.edge_store, robustness=RobustnessEvaluator())
+                    else:
+                        # Obstacles re-entered or corrected on the Android grid: only repair what changed
+                        update_obstacles(self.maze_solver, obstacles)
+                    self.validator = PlanValidator(self.maze_solver.grid, self.maze_solver.big_turn)
+                    # The first leg is sent as soon as it is chosen, so the robot can start while the rest is solved
+                    self.first_leg = None
+                    path = pathfinding_streaming(obstacles, self.send_first_leg,
+                                                 maze_solver=self.maze_solver, plan_cache=self.plan_cache,
+                                                 alternatives=self.num_alternatives)
+                    self.alternatives = path.get('alternatives', [])
                     # logging.info(f"Computed path: {path}")
                     
-                    commands = path['commands']
-                    segments = self._segment_commands(commands)
-                    segments['dirs'] = self.get_directions(path)
-                    logging.info(f"Segmented commands: {segments}")
+                    self.send_valid_path(path)
+
+                elif data_str.startswith("REPLAN"):
+                    # Format: REPLAN,{"x": <x>, "y": <y>, "d": <d>, "obstacle_ids": [<remaining obstacle ids>]}
+                    pose = json.loads(data_str.split("REPLAN,")[1])
+                    if self.maze_solver is None:
+                        logging.warning("Replan requested before any obstacles were received.")
+                        continue
                     
-                    # send path back to server
-                    self.sock.send(f"PATH,{json.dumps(segments)}\n".encode("utf-8"))
-                    logging.info(f"Sent path back to rpi.")
+                    path = replan(self.maze_solver, self.obstacles, pose, pose['obstacle_ids'],
+                                  alternatives=self.num_alternatives)
+                    self.alternatives = path.get('alternatives', [])
+                    self.send_valid_path(path)
+
+                elif data_str.startswith("RETRY"):
+                    # The last plan was rejected or failed: send the next best one, solving again only when there is none left
+                    if self.alternatives:
+                        path = self.alternatives.pop(0)
+                        logging.info(f"Sending alternative plan, {len(self.alternatives)} left.")
+                    elif self.maze_solver is not None:
+                        path = pathfinding(self.obstacles, retrying=True, maze_solver=self.maze_solver)
+                        self.validator = PlanValidator(self.maze_solver.grid, self.maze_solver.big_turn, retrying=True)
+                    else:
+                        logging.warning("Retry requested before any obstacles were received.")
+                        continue
+                    self.send_valid_path(path)
 
                 elif "DETECT" in data_str:
-                    obstacle_id = data_str.split(",")[1]
+                    # Format: DETECT,<obstacle_id>[,<L|C|R>], the SNAP hint of where the card is in view
+                    parts = data_str.strip().split(",")
+                    obstacle_id = parts[1]
+                    hint = parts[2] if len(parts) > 2 else None
                     timestamp = time_ns()
                     
-                    max_overlap = 0
-                    max_img_id = None
-                    for img_id, (first_seen, last_seen) in self.img_time_dict.items():
-                        overlap = self.get_overlap_interval(img_id, timestamp, first_seen, last_seen)
-                        logging.info(f"Overlap: {overlap}, Max overlap: {max_overlap}")
-                        if overlap > 0 and overlap >= max_overlap:
-                            logging.info(f"Replacing max overlap with {overlap}")
-                            max_overlap = overlap
-                            max_img_id = img_id
-                    
-                    if max_img_id is not None:
-                        self.send_matched_pair(obstacle_id, max_img_id)
-                        del self.img_time_dict[max_img_id]
-                    # else:
-                    #     self.pending_obstacles.append((obstacle_id, timestamp))
+                    with self.match_lock:
+                        max_overlap = 0
+                        max_img_id = None
+                        for img_id, (first_seen, last_seen) in self.img_time_dict.items():
+                            overlap = self.get_overlap_interval(img_id, timestamp, first_seen, last_seen)
+                            logging.info(f"Overlap: {overlap}, Max overlap: {max_overlap}")
+                            if overlap > 0 and overlap >= max_overlap:
+                                logging.info(f"Replacing max overlap with {overlap}")
+                                max_overlap = overlap
+                                max_img_id = img_id
+                        
+                        if max_img_id is not None:
+                            self.send_matched_pair(obstacle_id, max_img_id)
+                            del self.img_time_dict[max_img_id]
+                        else:
+                            # Not seen yet: look at every frame while the lag window lasts, around where
+                            # the card should be first, see match_pending
+                            self.pending_obstacles.append((obstacle_id, timestamp))
+                            self.scheduler.arm(self.lag * 1e-9, roi=hint)
 
                 elif "STITCH" in data_str:
                     self.stitch_len = int(data_str.split(",")[1])
@@ -216,7 +331,9 @@ class Task1:
                 break
             
     def start_stream(self):
-        self.stream_listener = StreamListener(weights=self.model)
+        self.stream_listener = StreamListener(weights=self.model, scheduler=self.scheduler)
+        # A bullseye in the SNAP hint's part of the frame must not keep the card outside it from being searched
+        self.stream_listener.detector.ignore = self.IMG_BLACKLIST
         self.stream_listener.start_stream_read(
             on_result=self.on_result,
             on_disconnect=self.disconnect,
@@ -250,8 +367,8 @@ class Task1:
     def start_task_1(self):        
         self.pc_receive_thread = threading.Thread(target=self.pc_receive, daemon=True)
         print("Starting Task 1 server...")
-        self.stream_listener = threading.Thread(target=self.start_stream, daemon=True)
-        self.stream_listener.start()
+        stream_thread = threading.Thread(target=self.start_stream, daemon=True)
+        stream_thread.start()
         self.pc_receive_thread.start()
         self.pc_receive_thread.join()
                 
@@ -265,6 +382,7 @@ class Task1:
         segments = []
         current_segment = []
         obstacle_ids = []
+        snap_hints = [] # L, C or R from SNAP{id}_{hint}: where the card is in view, None without one
         for cmd in commands:
             dist = cmd[2:]
             if cmd.startswith("BW"):
@@ -282,14 +400,16 @@ class Task1:
             elif cmd.startswith("FIN"):
                 cmd = "S"
             if cmd.startswith("SNAP"):
-                obstacle_ids.append(cmd[4])
+                obstacle_id, _, hint = cmd[4:].partition("_")
+                obstacle_ids.append(obstacle_id)
+                snap_hints.append(hint or None)
                 segments.append(current_segment)
                 current_segment = []
                 continue
             current_segment.append(cmd)
         if current_segment:
             segments.append(current_segment)
-        return {"obstacle_ids": obstacle_ids, "segments": segments}
+        return {"obstacle_ids": obstacle_ids, "snap_hints": snap_hints, "segments": segments}
     
     def direction_to_name(self, d):
         """Return 'NORTH', 'SOUTH', etc. Works if d is an enum, int, or string."""
@@ -53,21 +53,14 @@ class Task1:
         5. Initiates stitching if the required number of images is detected.
         """
         if result is not None:
-            names = result.names
-            
             # 1) Find the single largest box (skip blacklist)
             max_rec = None  # {"detected_img_id": str, "box": box, "area": float, "conf": float}
 
-            for box in result.boxes:
-                cls_id = int(box.cls[0].item())
-                detected_img_id = names[cls_id]
+            for detected_img_id, box, conf in zip(result.labels, result.xyxy.tolist(), result.conf.tolist()):
                 if str(detected_img_id) in self.IMG_BLACKLIST:
                     continue
 
-                w = float(box.xywh[0][2].item())
-                h = float(box.xywh[0][3].item())
-                area = w * h
-                conf = float(box.conf[0].item()) if getattr(box.conf, "ndim", 0) else float(box.conf.item())
+                area = (box[2] - box[0]) * (box[3] - box[1])
 
                 if (max_rec is None or
                     area > max_rec["area"] or
@@ -79,7 +72,7 @@ class Task1:
                 detected_img_id = max_rec["detected_img_id"]
                 detected_conf_level = max_rec["conf"]
 
-                add_to_stitching_dict(self.stitching_img_dict, detected_img_id, detected_conf_level, frame)
+                add_to_stitching_dict(self.stitching_img_dict, detected_img_id, detected_conf_level, result.plot)
 
                 last_seen = time_ns()
                 first_seen = self.img_time_dict.get(detected_img_id, (last_seen, None))[0]
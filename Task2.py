@@ -9,6 +9,8 @@ logging.basicConfig(level=logging.INFO)
 from pathfinding.pathfinding import pathfinding
 from stitching import add_to_stitching_dict, stitch_images, add_to_stitching_dict_2, stitch_images_2
 from StreamListener import StreamListener
+from inference import InferenceScheduler
+from evidence import EvidenceAccumulator
 
 PI_IP = "192.168.20.1"
 PORT = 5000
@@ -28,13 +30,9 @@ class Task2:
 
         # Tunables
         self.cooldown_s = 1.0 # how long to suppress detections after SEEN (non-blocking)
-        self.debounce_hits = 2 # optional: require N consecutive frames for same id
 
         self.obstacle_id = 1
-        self.current_image_id = None
-        self.consecutive_hits = 0 # for debounce
-        
-        self.prev_detected_id = None 
+        self.current_image_id = None # arrow last sent for the current obstacle
 
         self.IMG_BLACKLIST = ["45"]
         self.conf_threshold = 0.7
@@ -45,6 +43,9 @@ class Task2:
         self.model = "bestv8n.pt"
         self.filename = "stitches/task2"
 
+        # Inference runs on every frame while approaching an obstacle, and idles from SEEN until the next approach
+        self.scheduler = InferenceScheduler.from_env(armed=True)
+
         # Threads
         self.pc_receive_thread = None
         self.stream_listener = None
@@ -52,65 +53,57 @@ class Task2:
         self.LEFT_ARROW_ID = "39"
         self.RIGHT_ARROW_ID = "38"
 
+        # Which arrow is in view, from the detections of every frame of the approach; an arrow is
+        # usually decided on its second frame, and a missed frame in between delays it by one
+        self.evidence = EvidenceAccumulator(classes=[self.LEFT_ARROW_ID, self.RIGHT_ARROW_ID], ignore=self.IMG_BLACKLIST,
+                                            hit_conf=self.conf_threshold)
+
         self.last_image = None
 
     def _start_cooldown_and_advance(self):
         """Non-blocking cooldown: suppress detections briefly and advance obstacle_id safely."""
         # Set gate so on_result returns early during cooldown
         self.detection_gate.set()
+        self.scheduler.disarm()
         with self.obstacle_lock:
             self.obstacle_id += 1
             self.current_image_id = None
-            self.consecutive_hits = 0
+            self.evidence.reset()
             logging.info(f"Advanced to obstacle {self.obstacle_id} (cooldown {self.cooldown_s}s).")
 
         # Clear the gate later without blocking recv thread
-        t = threading.Timer(self.cooldown_s, self.detection_gate.clear)
+        t = threading.Timer(self.cooldown_s, self._end_cooldown)
         t.daemon = True
         t.start()
 
+    def _end_cooldown(self):
+        """Approaching the next obstacle: detections matter again"""
+        self.scheduler.arm()
+        self.detection_gate.clear()
+
     def on_result(self, result, frame):
         # If in cooldown, ignore any detections
         if self.detection_gate.is_set():
             return
 
-        message_content = None
-        detected_img_id = None
-
-        if result is not None:
-            cls_idx = int(result.boxes[0].cls[0].item())
-            detected_img_id = result.names[cls_idx]
-            detected_conf_level = result.boxes[0].conf.item()
-
-            # Basic filtering
-            if (
-                detected_img_id not in [self.LEFT_ARROW_ID, self.RIGHT_ARROW_ID] or
-                detected_conf_level < self.conf_threshold or
-                detected_img_id in self.IMG_BLACKLIST
-            ):
-                # reset debounce if irrelevant
-                self.consecutive_hits = 0
-                return
-
-            if detected_img_id == self.prev_detected_id:
-                self.consecutive_hits += 1
-            else:
-                self.consecutive_hits = 1
-            self.prev_detected_id = detected_img_id
-
-            if self.consecutive_hits < self.debounce_hits:
+        timestamp = self.stream_listener.frame_time or time_ns()
+        with self.obstacle_lock:
+            self.evidence.update(result, timestamp)
+            decided = self.evidence.get_decided()
+            if not decided:
                 return
-
-            # Prepare the one-shot "seen" message only once per stable sighting
-            if self.current_image_id is None:
-                message_content = f"{detected_conf_level},{detected_img_id}\n"
+            detected_img_id = decided[0]
+            evidence = self.evidence.get(detected_img_id)
+            obs_id = self.obstacle_id
+
+            # Only a change of mind is sent; the RPI keeps the last arrow it got
+            message_content = None
+            if detected_img_id != self.current_image_id:
+                message_content = f"{evidence.ewma},{detected_img_id}\n"
                 self.current_image_id = detected_img_id
 
-            # Safely snapshot obstacle id
-            with self.obstacle_lock:
-                obs_id = self.obstacle_id
-
-            # Update stitching dict for this obstacle/image pair
+        # Update stitching dict for this obstacle/image pair, with a frame the arrow is on
+        if evidence.last_seen == timestamp:
             with self.stitch_lock:
                 if obs_id not in self.stitching_img_dict:
                     self.stitching_img_dict[obs_id] = {}
@@ -118,11 +111,11 @@ class Task2:
                     self.stitching_img_dict,
                     obs_id,
                     detected_img_id,
-                    detected_conf_level,
-                    frame
+                    evidence.conf,
+                    result.plot
                 )
 
-            self.last_image = detected_img_id
+        self.last_image = detected_img_id
 
         # Emit the message if needed
         if message_content is not None and self.sock:
@@ -131,8 +124,6 @@ class Task2:
                 self.sock.send(message_content.encode("utf-8"))
             except OSError as e:
                 logging.error(f"Send error: {e}")
-            finally:
-                self.current_image_id = None
 
     def pc_receive(self) -> None:
         self.connect()
@@ -149,6 +140,8 @@ class Task2:
                     self._start_cooldown_and_advance()
 
                 elif "STITCH" in data_str:
+                    # Last obstacle passed, nothing left to detect
+                    self.scheduler.disarm()
                     with self.stitch_lock:
                         keys = sorted(self.stitching_img_dict.keys())[-2:] or [1, 2]
                         stitch_images_2(keys, self.stitching_img_dict, self.filename, ncols=2, show=False)
@@ -159,7 +152,8 @@ class Task2:
 
     def start_stream(self):
         self.detection_gate.clear()
-        self.stream_listener = StreamListener(weights=self.model)
+        self.scheduler.arm()
+        self.stream_listener = StreamListener(weights=self.model, scheduler=self.scheduler)
         self.stream_listener.start_stream_read(
             on_result=self.on_result,
             on_disconnect=self.disconnect,
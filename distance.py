@@ -24,12 +24,9 @@ def _center_xyxy(box):
 def _parse_dets(results, min_conf=0.0):
     out = []
     for r in _as_list(results):
-        if r.boxes is None or len(r.boxes) == 0:
+        if r is None or len(r) == 0:
             continue
-        names = r.names
-        xyxy = r.boxes.xyxy.cpu().numpy()
-        cls  = r.boxes.cls.cpu().numpy().astype(int)
-        conf = r.boxes.conf.cpu().numpy().astype(float)
+        names, xyxy, cls, conf = r.names, r.xyxy, r.cls, r.conf
         for (x1,y1,x2,y2), c, p in zip(xyxy, cls, conf):
             if p >= min_conf:
                 name = str(names.get(int(c), int(c))).strip().lower()
@@ -0,0 +1,117 @@
+import math
+
+
+class Evidence:
+    """What the frames so far say about one class"""
+    def __init__(self):
+        self.llr = 0.0 # log-likelihood ratio of "in view" against "not in view"
+        self.ewma = 0.0 # exponentially weighted confidence, 0 on the frames it is missing from
+        self.conf = 0.0 # confidence on the last frame it was seen on
+        self.area = 0.0 # share of the frame its box took on the last frame it was seen on
+        self.decided = False # llr crossed the upper bound and has not fallen to the lower one since
+        self.first_seen = None # time of the first hit since the evidence was last at the lower bound
+        self.last_seen = None # time of the last frame it was seen on, tracked frames included
+
+
+class EvidenceAccumulator:
+    """
+    Decides which classes are in view from the detections of many frames rather than one.
+
+    Every frame is a hit or a miss for each class: a hit when it has a box of at least hit_conf and
+    min_area (share of the frame). The hits feed a sequential probability ratio test per class,
+    with p_hit the chance of a hit on a frame the card is in view and p_false on one it is not; a
+    class is decided as soon as its log-likelihood ratio reaches the upper bound set by the
+    false_alarm and miss rates, and stays so until it falls to the lower one. An exponentially
+    weighted confidence ranks the classes decided at the same time.
+
+    Only real detections are evidence. Boxes the scene gate (result.carried) or the tracker
+    (result.tracked) carry over to a new frame, and a frame handed over again (same timestamp), only
+    move last_seen and area: a single false box must not be counted once per frame it is carried
+    to. StreamListener runs inference on every frame of a SNAP window for decisions to come fast.
+    A frame without detections (None) is a miss.
+    """
+    def __init__(self, classes=None, ignore=(), hit_conf=0.0, min_area=0.0, smoothing=0.5,
+                 p_hit=0.9, p_false=0.05, false_alarm=0.01, miss=0.01):
+        self.classes = None if classes is None else {str(c) for c in classes} # None for every class
+        self.ignore = ignore # checked on every frame, so a list that grows (e.g. a blacklist) is followed
+        self.hit_conf = hit_conf
+        self.min_area = min_area
+        self.smoothing = smoothing
+        self.hit_llr = math.log(p_hit / p_false)
+        self.miss_llr = math.log((1 - p_hit) / (1 - p_false))
+        self.upper = math.log((1 - miss) / false_alarm)
+        self.lower = math.log(miss / (1 - false_alarm))
+        self.evidence = dict() # class name -> Evidence
+        self.last_timestamp = None
+
+    def reset(self):
+        self.evidence = dict()
+        self.last_timestamp = None
+
+    def get(self, name):
+        return self.evidence.get(str(name))
+
+    def get_hits(self, result):
+        """(highest confidence, largest share of the frame) of each class with a box that counts as a hit"""
+        hits = dict()
+        if result is None or len(result) == 0:
+            return hits
+        height, width = result.orig_shape
+        for (x1, y1, x2, y2), conf, name in zip(result.xyxy.tolist(), result.conf.tolist(), result.labels):
+            name = str(name)
+            if (self.classes is not None and name not in self.classes) or name in self.ignore:
+                continue
+            area = (x2 - x1) * (y2 - y1) / (width * height)
+            if conf < self.hit_conf or area < self.min_area:
+                continue
+            best_conf, best_area = hits.get(name, (0.0, 0.0))
+            hits[name] = (max(conf, best_conf), max(area, best_area))
+        return hits
+
+    def update(self, result, timestamp):
+        """
+        Take in the result of a frame
+
+        Inputs
+        ------
+        result: inference.Detections from StreamListener, None for a frame without detections
+        timestamp: time of the frame, e.g. StreamListener.frame_time
+
+        Returns
+        -------
+        Class names decided on this frame, most confident first
+        """
+        hits = self.get_hits(result)
+        carried = result is not None and (result.tracked or result.carried)
+        repeated = carried or timestamp == self.last_timestamp
+        self.last_timestamp = timestamp
+
+        newly_decided = []
+        for name in hits.keys() | self.evidence.keys():
+            evidence = self.evidence.setdefault(name, Evidence())
+            conf, area = hits.get(name, (None, None))
+            if conf is not None:
+                evidence.last_seen = timestamp
+                evidence.area = area
+            if repeated:
+                continue
+
+            evidence.ewma += self.smoothing * ((conf or 0.0) - evidence.ewma)
+            if conf is not None:
+                evidence.conf = conf
+                if evidence.first_seen is None:
+                    evidence.first_seen = timestamp
+            evidence.llr = min(max(evidence.llr + (self.hit_llr if conf is not None else self.miss_llr), self.lower),
+                               self.upper)
+            if evidence.llr >= self.upper and not evidence.decided:
+                evidence.decided = True
+                newly_decided.append(name)
+            elif evidence.llr <= self.lower:
+                evidence.decided = False
+                evidence.first_seen = None
+        return sorted(newly_decided, key=lambda name: -self.evidence[name].ewma)
+
+    def get_decided(self):
+        """Class names decided at the moment, most confident first"""
+        decided = [name for name, evidence in self.evidence.items() if evidence.decided and name not in self.ignore]
+        return sorted(decided, key=lambda name: -self.evidence[name].ewma)
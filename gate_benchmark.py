@@ -0,0 +1,99 @@
+import argparse
+import glob
+import sys
+import time
+
+import cv2
+
+from inference import SceneGate, create_detector
+
+
+def get_cards(result, conf):
+    """Class names detected at or above conf"""
+    if result is None or len(result) == 0:
+        return set()
+    return {name for name, p in zip(result.labels, result.conf.tolist()) if p >= conf}
+
+
+def replay(detector, path, conf):
+    """Every frame of a recording with the time it would have arrived at, its result and its inference time"""
+    capture = cv2.VideoCapture(path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        start = time.perf_counter()
+        result = detector.predict(frame, conf)
+        elapsed = time.perf_counter() - start
+        frames.append((frame, int(len(frames) / fps * 1e9), get_cards(result, conf), elapsed))
+    capture.release()
+    return frames
+
+
+def run_gated(gate, frames):
+    """
+    What StreamListener would have done with the gate: the cards reported for every frame, the
+    frames inference ran on and the time spent, gate included
+    """
+    gate.reset()
+    reported = []
+    inferred = 0
+    spent = 0.0
+    last = set()
+    for frame, timestamp, cards, elapsed in frames:
+        start = time.perf_counter()
+        changed = gate.changed(frame, timestamp)
+        spent += time.perf_counter() - start
+        if changed:
+            last = cards
+            inferred += 1
+            spent += elapsed
+        reported.append(last)
+    return reported, inferred, spent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recordings through the scene gate and compare with inference on every frame")
+    parser.add_argument("--weights", default="bestv8n.pt", help="Path to the .pt weights")
+    parser.add_argument("--videos", nargs="+", default=sorted(glob.glob("out*.mp4")), help="Recordings to replay")
+    parser.add_argument("--backend", default=None, help="Inference backend (defaults to YOLO_BACKEND, else torch)")
+    parser.add_argument("--imgsz", default=None, help="Inference size (defaults to YOLO_IMGSZ, else 640)")
+    parser.add_argument("--conf", type=float, default=0.7, help="Confidence threshold")
+    parser.add_argument("--pixel-thresholds", type=float, nargs="+", default=[8, 12, 20])
+    parser.add_argument("--area-thresholds", type=float, nargs="+", default=[0.005, 0.01, 0.05])
+    parser.add_argument("--max-skip", type=float, default=1.0, help="Seconds between inferences at most")
+    args = parser.parse_args()
+
+    detector = create_detector(args.weights, args.backend, args.imgsz)
+    recordings = {path: replay(detector, path, args.conf) for path in args.videos}
+    total = sum(len(frames) for frames in recordings.values())
+    if not total:
+        print("No frames in the recordings")
+        return 1
+    full_time = sum(elapsed for frames in recordings.values() for *_, elapsed in frames)
+    print(f"{total} frame(s) from {len(recordings)} recording(s), {full_time / total * 1e3:.1f} ms per frame without the gate")
+
+    print(f"{'pixel':>6} {'area':>6} {'skipped':>8} {'ms/frame':>9} {'same cards':>11} {'missed':>7}")
+    for pixel_threshold in args.pixel_thresholds:
+        for area_threshold in args.area_thresholds:
+            gate = SceneGate(pixel_threshold, area_threshold, args.max_skip)
+            inferred = same = 0
+            spent = 0.0
+            missed = set()
+            for path, frames in recordings.items():
+                reported, count, elapsed = run_gated(gate, frames)
+                inferred += count
+                spent += elapsed
+                same += sum(cards == frame[2] for cards, frame in zip(reported, frames))
+                # Cards inference on every frame found in a recording that the gated run never reported
+                seen = set().union(*(frame[2] for frame in frames))
+                missed |= {(path, card) for card in seen - set().union(*reported)}
+            print(f"{pixel_threshold:>6g} {area_threshold:>6g} {1 - inferred / total:>8.0%} {spent / total * 1e3:>9.1f} "
+                  f"{same / total:>11.0%} {len(missed):>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
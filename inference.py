@@ -0,0 +1,456 @@
+import os
+import copy
+import math
+import time
+import glob
+import json
+import logging
+import shutil
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from ultralytics.utils.plotting import Annotator, colors
+
+# Inference backends for the YOLO weights. "torch" runs the .pt as is; the others run a copy of the
+# weights exported once, next to the .pt. Every backend goes through ultralytics, so predict()
+# returns the same Results either way.
+BACKENDS = ("torch", "onnx", "openvino")
+DEFAULT_BACKEND = "torch"
+
+# Square input sizes frames are letterboxed to; "auto" picks one of them, see select_imgsz
+INFERENCE_SIZES = (320, 416, 640)
+DEFAULT_IMGSZ = 640
+VALIDATION_PHOTOS = os.path.join("RPI", "photos")
+
+# Part of the frame width, (left, right), the card is expected in for each SNAP hint (SNAP{id}_L/_C/_R):
+# the obstacle is a cell to the robot's left, straight ahead or a cell to its right
+SNAP_ROIS = {"L": (0.0, 0.6), "C": (0.2, 0.8), "R": (0.4, 1.0)}
+
+
+def get_backend(backend=None):
+    """Backend to use: the argument, else YOLO_BACKEND from the environment, else torch"""
+    backend = (backend or os.getenv("YOLO_BACKEND") or DEFAULT_BACKEND).strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend} (expected one of {', '.join(BACKENDS)})")
+    return backend
+
+
+def get_exported_path(weights, backend, imgsz=DEFAULT_IMGSZ):
+    """Where the weights exported for a backend and input size are kept"""
+    root, _ = os.path.splitext(weights)
+    if backend == "onnx":
+        return f"{root}_{imgsz}.onnx"
+    if backend == "openvino":
+        return f"{root}_{imgsz}_openvino_model"
+    return weights
+
+
+def export_weights(weights, backend, imgsz=640):
+    """
+    Export the weights for a backend, unless an export newer than the weights is already there
+
+    Inputs
+    ------
+    weights: path of the .pt weights
+    backend: one of BACKENDS
+    imgsz: input size the exported model is built for
+
+    Returns
+    -------
+    Path of the weights to load for the backend
+    """
+    backend = get_backend(backend)
+    exported = get_exported_path(weights, backend, imgsz)
+    if backend == "torch":
+        return weights
+
+    if os.path.exists(exported) and os.path.getmtime(exported) >= os.path.getmtime(weights):
+        return exported
+
+    logging.info(f"Exporting {weights} for {backend} at {imgsz}, this only happens once...")
+    path = YOLO(weights).export(format=backend, imgsz=imgsz)
+    # Exported models only take the size they were exported at, so each size gets its own copy
+    if os.path.isdir(exported):
+        shutil.rmtree(exported)
+    os.replace(str(path), exported)
+    return exported
+
+
+def load_model(weights, backend=None, imgsz=640):
+    """
+    Load YOLO weights on the chosen backend
+
+    Inputs
+    ------
+    weights: path of the .pt weights
+    backend: one of BACKENDS, None for YOLO_BACKEND from the environment (torch if unset)
+    imgsz: input size of exported models
+
+    Returns
+    -------
+    ultralytics YOLO model, whose predict() returns Results whatever the backend
+    """
+    backend = get_backend(backend)
+    model = YOLO(export_weights(weights, backend, imgsz), task="detect")
+    logging.info(f"Loaded {weights} on {backend}")
+    return model
+
+
+class Letterbox:
+    """
+    Fits frames into a fixed square input, keeping their aspect ratio and padding the rest.
+
+    The padded input is allocated once and the frame is resized straight into it; the scale and
+    offsets are worked out once per frame shape and used to map boxes back onto the frame.
+    """
+    def __init__(self, size=DEFAULT_IMGSZ, color=114):
+        self.size = size
+        self.color = color
+        self.buffer = np.full((size, size, 3), color, dtype=np.uint8)
+        self.frame_shape = None
+
+    def fit(self, frame_shape):
+        height, width = frame_shape[:2]
+        self.scale = min(self.size / height, self.size / width)
+        self.new_width, self.new_height = round(width * self.scale), round(height * self.scale)
+        self.left = (self.size - self.new_width) // 2
+        self.top = (self.size - self.new_height) // 2
+        self.buffer[:] = self.color
+        self.region = self.buffer[self.top:self.top + self.new_height, self.left:self.left + self.new_width]
+        self.frame_shape = (height, width)
+
+    def __call__(self, frame):
+        """Letterbox a frame. The returned input is reused by the next call."""
+        if frame.shape[:2] != self.frame_shape:
+            self.fit(frame.shape)
+        if self.frame_shape == (self.new_height, self.new_width):
+            self.region[:] = frame
+        else:
+            cv2.resize(frame, (self.new_width, self.new_height), dst=self.region, interpolation=cv2.INTER_LINEAR)
+        return self.buffer
+
+    def map_boxes(self, boxes):
+        """Map (N, 4+) boxes, x1 y1 x2 y2 first, from the letterboxed input back onto the frame, in place"""
+        height, width = self.frame_shape
+        boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - self.left) / self.scale, 0, width)
+        boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - self.top) / self.scale, 0, height)
+        return boxes
+
+
+class Detections:
+    """
+    Detections on one frame, as NumPy arrays built once from the model's output.
+
+    xyxy: (N, 4) float32 boxes in frame pixels
+    conf: (N,) float32 confidences
+    cls: (N,) int class indices, names: class index -> name, labels: the name of each box
+    frame: BGR frame the boxes are on, orig_shape: its (height, width)
+    timestamp: time_ns() the frame was received at, None outside StreamListener
+    tracked, age: whether the boxes come from the tracker, and the seconds since the last real
+                  detection, see StreamListener
+    carried: whether the boxes were carried over from another frame by for_frame()
+
+    plot() draws the boxes on a copy of the frame the first time it is called, and only then.
+    for_frame() carries the boxes over to a later frame, e.g. one the scene gate skipped.
+    """
+    def __init__(self, xyxy, conf, cls, names, frame, timestamp=None, tracked=False, age=0.0, carried=False):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.cls = np.asarray(cls).astype(int).reshape(-1)
+        self.names = names
+        self.labels = [names[c] for c in self.cls.tolist()]
+        self.frame = frame
+        self.orig_shape = frame.shape[:2]
+        self.timestamp = timestamp
+        self.tracked = tracked
+        self.age = age
+        self.carried = carried
+        self._annotated = None
+
+    def __len__(self):
+        return len(self.cls)
+
+    @property
+    def data(self):
+        """(N, 6) array of x1 y1 x2 y2 conf cls"""
+        return np.column_stack([self.xyxy, self.conf, self.cls]).astype(np.float32)
+
+    def for_frame(self, frame, timestamp=None):
+        """Shallow copy with the same boxes on another frame; the arrays are shared, not copied"""
+        detections = copy.copy(self)
+        detections.frame = frame
+        detections.orig_shape = frame.shape[:2]
+        detections.timestamp = timestamp
+        detections.carried = True
+        detections._annotated = None
+        return detections
+
+    def plot(self):
+        """Frame with the boxes drawn on, as ultralytics draws them"""
+        if self._annotated is None:
+            annotator = Annotator(self.frame.copy(), example=str(self.names))
+            for box, conf, cls, label in zip(self.xyxy.tolist(), self.conf.tolist(), self.cls.tolist(), self.labels):
+                annotator.box_label(box, f"{label} {conf:.2f}", color=colors(cls, True))
+            self._annotated = annotator.result()
+        return self._annotated
+
+
+class Detector:
+    """
+    Runs a model at a fixed input size, whatever the camera's resolution.
+
+    Frames are letterboxed to imgsz x imgsz, and the Detections handed back are those of the
+    original frame: the boxes are mapped back onto it and plot() draws on it.
+
+    Boxes of the classes in ignore (e.g. the bullseye the tasks blacklist) do not count as finding
+    the card in an ROI, so the whole frame is still searched.
+    """
+    def __init__(self, model, imgsz=DEFAULT_IMGSZ, ignore=()):
+        self.model = model
+        self.imgsz = imgsz
+        self.ignore = ignore
+        self.letterbox = Letterbox(imgsz)
+        self.roi_letterbox = Letterbox(imgsz) # kept apart, so that neither refits when switching
+        self.roi_hits = 0 # predictions answered from the ROI alone
+        self.roi_fallbacks = 0 # predictions with an ROI that found no card in it and ran on the whole frame
+
+    def _predict(self, frame, conf, letterbox, left=0, right=None, timestamp=None):
+        image = frame if left == 0 and right is None else frame[:, left:right]
+        result = self.model.predict(letterbox(image), save=False, imgsz=self.imgsz, conf=conf, verbose=False)[0]
+        # The only copy out of the model's tensors
+        data = result.boxes.data.cpu().numpy()
+        boxes = letterbox.map_boxes(data[:, :4].copy())
+        boxes[:, [0, 2]] += left
+        return Detections(boxes, data[:, 4], data[:, 5], result.names, frame, timestamp)
+
+    def predict(self, frame, conf=0.7, roi=None, timestamp=None):
+        """
+        Detect on a frame
+
+        Inputs
+        ------
+        frame: BGR frame
+        conf: confidence threshold
+        roi: SNAP hint, one of SNAP_ROIS: that part of the frame is searched first, filling the whole
+             input so small cards get more pixels; the whole frame only when nothing but the classes
+             in ignore is found there
+        timestamp: time_ns() the frame was received at, kept in the Detections
+
+        Returns
+        -------
+        Detections, boxes in frame coordinates
+        """
+        if roi in SNAP_ROIS:
+            width = frame.shape[1]
+            left, right = (round(edge * width) for edge in SNAP_ROIS[roi])
+            detections = self._predict(frame, conf, self.roi_letterbox, left, right, timestamp)
+            if any(label not in self.ignore for label in detections.labels):
+                self.roi_hits += 1
+                return detections
+            self.roi_fallbacks += 1
+        return self._predict(frame, conf, self.letterbox, timestamp=timestamp)
+
+
+def get_top_detection(detections):
+    """Class name of the most confident box, None without any"""
+    if detections is None or len(detections) == 0:
+        return None
+    return detections.labels[int(detections.conf.argmax())]
+
+
+def select_imgsz(weights, backend=None, photos=VALIDATION_PHOTOS, sizes=INFERENCE_SIZES, target=0.95, conf=0.7):
+    """
+    Pick the smallest input size that keeps the detections of the largest one
+
+    The photos carry no labels, so the accuracy of a size is the share of photos whose most
+    confident detection (or lack of one) is the same as at the largest size. The choice is kept in
+    a .json next to the weights, per backend, photo set and target.
+
+    Inputs
+    ------
+    weights, backend: as for load_model
+    photos: directory of validation JPEGs
+    sizes: sizes to try
+    target: share of photos that has to agree
+    conf: confidence threshold
+
+    Returns
+    -------
+    Chosen size
+    """
+    backend = get_backend(backend)
+    sizes = sorted(sizes)
+    cache_path = os.path.splitext(weights)[0] + "_imgsz.json"
+    key = f"{backend},{os.path.abspath(photos)},{','.join(map(str, sizes))},{target},{conf}"
+    cache = dict()
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(weights):
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if key in cache:
+            return cache[key]["imgsz"]
+
+    frames = [frame for frame in (cv2.imread(path) for path in sorted(glob.glob(os.path.join(photos, "*.jpg"))))
+              if frame is not None]
+    if not frames:
+        logging.warning(f"No validation photos in {photos}, using {sizes[-1]}")
+        return sizes[-1]
+
+    tops = dict()
+    for imgsz in reversed(sizes):
+        detector = Detector(load_model(weights, backend, imgsz), imgsz)
+        tops[imgsz] = [get_top_detection(detector.predict(frame, conf)) for frame in frames]
+
+    agreement = {imgsz: float(np.mean([a == b for a, b in zip(tops[imgsz], tops[sizes[-1]])])) for imgsz in sizes}
+    chosen = next(imgsz for imgsz in sizes if agreement[imgsz] >= target)
+    logging.info(f"Inference size {chosen}, agreement with {sizes[-1]} per size: {agreement}")
+
+    cache[key] = {"imgsz": chosen, "agreement": agreement}
+    with open(cache_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    return chosen
+
+
+def get_imgsz(imgsz=None):
+    """Input size to use: the argument, else YOLO_IMGSZ from the environment, else 640. May be "auto"."""
+    imgsz = imgsz or os.getenv("YOLO_IMGSZ") or DEFAULT_IMGSZ
+    if str(imgsz).strip().lower() == "auto":
+        return "auto"
+    return int(imgsz)
+
+
+def create_detector(weights, backend=None, imgsz=None):
+    """
+    Load the weights on a backend, at a fixed input size
+
+    Inputs
+    ------
+    weights: path of the .pt weights
+    backend: one of BACKENDS, None for YOLO_BACKEND from the environment (torch if unset)
+    imgsz: input size, "auto" for select_imgsz, None for YOLO_IMGSZ from the environment (640 if unset)
+
+    Returns
+    -------
+    Detector
+    """
+    imgsz = get_imgsz(imgsz)
+    if imgsz == "auto":
+        imgsz = select_imgsz(weights, backend)
+    return Detector(load_model(weights, backend, imgsz), imgsz)
+
+
+class SceneGate:
+    """
+    Tells whether a frame shows anything new since the last frame inference ran on.
+
+    Frames are compared as small grayscale thumbnails: the scene has changed when more than
+    area_threshold of the thumbnail's pixels differ from the reference by more than pixel_threshold
+    (0-255). The reference only moves when inference runs, so a slow drift still adds up to a
+    change, and inference runs at least every max_skip_time seconds whatever the frames look like.
+    """
+    def __init__(self, pixel_threshold=12, area_threshold=0.01, max_skip_time=1.0, size=(32, 24)):
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.max_skip_time = max_skip_time
+        self.size = size
+        self.thumbnail = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self.gray = np.empty((size[1], size[0]), dtype=np.uint8)
+        self.diff = np.empty_like(self.gray)
+        self.reference = None
+        self.reference_time = None
+
+    @classmethod
+    def from_env(cls):
+        """Gate with the SCENE_* thresholds from the environment, None when SCENE_GATE is 0"""
+        if os.getenv("SCENE_GATE", "1").strip() == "0":
+            return None
+        return cls(pixel_threshold=float(os.getenv("SCENE_PIXEL_THRESHOLD", 12)),
+                   area_threshold=float(os.getenv("SCENE_AREA_THRESHOLD", 0.01)),
+                   max_skip_time=float(os.getenv("SCENE_MAX_SKIP", 1.0)))
+
+    def reset(self):
+        """Forget the reference, so that the next frame goes through"""
+        self.reference = None
+
+    def changed(self, frame, timestamp):
+        """
+        Whether inference should run on a frame; if so, the frame becomes the reference
+
+        Inputs
+        ------
+        frame: BGR frame
+        timestamp: time_ns() of the frame
+
+        Returns
+        -------
+        False when the frame can reuse the result of the reference frame
+        """
+        cv2.resize(frame, self.size, dst=self.thumbnail, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.thumbnail, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        if self.reference is not None and (timestamp - self.reference_time) * 1e-9 < self.max_skip_time:
+            cv2.absdiff(self.gray, self.reference, dst=self.diff)
+            if np.count_nonzero(self.diff > self.pixel_threshold) <= self.area_threshold * self.diff.size:
+                return False
+
+        if self.reference is None:
+            self.reference = self.gray.copy()
+        else:
+            np.copyto(self.reference, self.gray)
+        self.reference_time = timestamp
+        return True
+
+
+class InferenceScheduler:
+    """
+    Decides which frames inference runs on: every frame while armed, otherwise one frame every
+    idle_interval seconds.
+
+    The tasks arm it around the moments detections matter and disarm it after, from their message
+    thread, while the stream thread asks due() about every frame. Frames that are not due are
+    dropped before they are even decoded.
+    """
+    def __init__(self, idle_interval=0.25, armed=True):
+        self.idle_interval = idle_interval
+        self.armed_until = math.inf if armed else 0 # time_ns() up to which every frame is due
+        self.last_time = None # time_ns() of the last frame that was due
+        self.roi = None # SNAP hint for Detector.predict while armed
+
+    @classmethod
+    def from_env(cls, armed=True):
+        """Scheduler idling at INFERENCE_IDLE_FPS from the environment, 4 fps if unset"""
+        return cls(idle_interval=1 / float(os.getenv("INFERENCE_IDLE_FPS", 4)), armed=armed)
+
+    def arm(self, window=None, roi=None):
+        """
+        Run inference on every frame for the next window seconds, or until disarm() when None,
+        looking around roi first (a SNAP hint, see Detector.predict) if given
+        """
+        self.roi = roi
+        if window is None:
+            self.armed_until = math.inf
+        else:
+            self.armed_until = max(self.armed_until, time.time_ns() + int(window * 1e9))
+
+    def disarm(self):
+        """Go back to idle rate, over the whole frame"""
+        self.armed_until = 0
+        self.roi = None
+
+    def in_window(self, timestamp):
+        """Whether the frame received at timestamp falls in a window armed with arm(window), e.g. at a SNAP"""
+        return self.armed_until != math.inf and timestamp < self.armed_until
+
+    def get_roi(self, timestamp):
+        """SNAP hint for the frame received at timestamp, None once the window it was armed with is over"""
+        return self.roi if timestamp < self.armed_until else None
+
+    def is_armed(self):
+        return time.time_ns() < self.armed_until
+
+    def due(self, timestamp):
+        """Whether inference should run on the frame received at timestamp, a time_ns()"""
+        if (timestamp < self.armed_until or self.last_time is None or
+                (timestamp - self.last_time) * 1e-9 >= self.idle_interval):
+            self.last_time = timestamp
+            return True
+        return False
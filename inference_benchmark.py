@@ -0,0 +1,80 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from inference import BACKENDS, Detector, get_top_detection, load_model
+
+
+def load_frames(photos, width, height):
+    """The photos at the stream resolution, as StreamListener gets them after decoding"""
+    frames = []
+    for path in sorted(glob.glob(os.path.join(photos, "*.jpg"))):
+        image = cv2.imread(path)
+        if image is not None:
+            frames.append(cv2.resize(image, (width, height)))
+    return frames
+
+
+def run(detector, frames, conf, runs, warmup):
+    for frame in frames[:warmup]:
+        detector.predict(frame, conf)
+
+    latencies = []
+    top = []
+    for _ in range(runs):
+        for frame in frames:
+            start = time.perf_counter()
+            result = detector.predict(frame, conf)
+            latencies.append(time.perf_counter() - start)
+            if len(top) < len(frames):
+                top.append(get_top_detection(result))
+    return np.array(latencies), top
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the YOLO inference backends and sizes on the saved photos")
+    parser.add_argument("--weights", default="bestv8n.pt", help="Path to the .pt weights")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS, help="Backends to compare")
+    parser.add_argument("--photos", default=os.path.join("RPI", "photos"), help="Directory of JPEGs to run on")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[640], help="Inference sizes frames are letterboxed to")
+    parser.add_argument("--conf", type=float, default=0.7, help="Confidence threshold")
+    parser.add_argument("--runs", type=int, default=1, help="Passes over the photos")
+    parser.add_argument("--warmup", type=int, default=5, help="Frames run before timing")
+    args = parser.parse_args()
+
+    frames = load_frames(args.photos, args.width, args.height)
+    if not frames:
+        print(f"No images in {args.photos}")
+        return 1
+    print(f"{len(frames)} image(s) at {args.width}x{args.height}, {args.runs} run(s)")
+
+    results = dict()
+    for backend in args.backends:
+        for imgsz in args.imgsz:
+            start = time.perf_counter()
+            detector = Detector(load_model(args.weights, backend, imgsz=imgsz), imgsz)
+            load_time = time.perf_counter() - start
+            latencies, top = run(detector, frames, args.conf, args.runs, args.warmup)
+            results[(backend, imgsz)] = (load_time, latencies, top)
+
+    baseline_top = next(iter(results.values()))[2]
+    print(f"{'backend':<10} {'imgsz':>5} {'load (s)':>9} {'fps':>7} {'mean (ms)':>10} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+          f"{'same top':>9}")
+    for (backend, imgsz), (load_time, latencies, top) in results.items():
+        # Share of images whose most confident detection (or lack of one) matches the first backend and size
+        agreement = np.mean([a == b for a, b in zip(top, baseline_top)])
+        print(f"{backend:<10} {imgsz:>5} {load_time:>9.2f} {1 / latencies.mean():>7.1f} {latencies.mean() * 1e3:>10.1f} "
+              f"{np.percentile(latencies, 50) * 1e3:>9.1f} {np.percentile(latencies, 95) * 1e3:>9.1f} "
+              f"{agreement:>9.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,11 +4,14 @@ from typing import List
 import numpy as np
 from pathfinding.entities.Robot import Robot
 from pathfinding.entities.Entity import Obstacle, CellState, Grid
-from pathfinding.consts import Direction, MOVE_DIRECTION, TURN_FACTOR, ITERATIONS, TURN_RADIUS, SAFE_COST
-from python_tsp.exact import solve_tsp_dynamic_programming
-
-turn_wrt_big_turns = [[3 * TURN_RADIUS, TURN_RADIUS],
-                  [4 * TURN_RADIUS, 2 * TURN_RADIUS]]
+from pathfinding.entities.PackedPath import PackedPath
+from pathfinding.consts import Direction, MOVE_DIRECTION, ITERATIONS, SAFE_COST, \
+    ROBUST_TIE_MARGIN, ROBUST_CANDIDATES, STREAM_EPSILON, STREAM_ATTEMPTS
+from pathfinding.primitives import turn_wrt_big_turns, get_primitives, TURN, PRE_TURN
+from pathfinding.symmetry import is_reversible, get_free_costs
+from pathfinding.helper import command_generator
+from pathfinding.incremental import IncrementalPlanner
+from pathfinding.wavefront import WavefrontPlanner
 
 
 class MazeSolver:
@@ -20,7 +23,10 @@ class MazeSolver:
             robot_y: int,
             robot_direction: Direction,
             big_turn=None, # the big_turn here is to allow 3-1 turn(0 - by default) | 4-2 turn(1)
-            allow_45 = True
+            allow_45 = True,
+            engine = "astar", # "astar" - one A* search per pair of states | "incremental" - LPA* trees kept between solves | "wavefront" - vectorized sweeps from all sources at once
+            edge_store = None, # EdgeCostStore shared between solvers, to reuse path costs of earlier layouts
+            robustness = None # RobustnessEvaluator to break near-ties between tours, None to keep the cheapest
     ):
         # Initialize a Grid object for the arena representation
         self.grid = Grid(size_x, size_y)
@@ -29,11 +35,35 @@ class MazeSolver:
         # Create tables for paths and costs
         self.path_table = dict()
         self.cost_table = dict()
+        # (start, end) pairs that A* found no path between
+        self.unreachable = set()
+        # View states per `retrying` flag. The tables above are keyed by CellState objects,
+        # so the same objects have to be reused for earlier searches to be picked up again
+        self.view_positions = dict()
         if big_turn is None:
             self.big_turn = 0
         else:
             self.big_turn = int(big_turn)
         self.allow_45 = allow_45
+        # Moves of the robot from each heading, shared by every solver with the same turn model
+        self.primitives = get_primitives(self.big_turn, self.allow_45)
+
+        self.edge_store = edge_store
+        self.robustness = robustness
+        # (path, cost) of the next best plans of the last solve, see get_optimal_order_dp
+        self.alternatives = []
+        # Number of searches run by astar_path_cost_generator
+        self.searches = 0
+
+        # Planner that fills the cost and path tables, None for the A* search below
+        if engine == "astar":
+            self.planner = None
+        elif engine == "incremental":
+            self.planner = IncrementalPlanner(self)
+        elif engine == "wavefront":
+            self.planner = WavefrontPlanner(self)
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
 
     def add_obstacle(self, x: int, y: int, direction: Direction, obstacle_id: int):
         """Add obstacle to MazeSolver object
@@ -48,9 +78,71 @@ class MazeSolver:
         obstacle = Obstacle(x, y, direction, obstacle_id)
         # Add created obstacle to grid object
         self.grid.add_obstacle(obstacle)
+        self.on_obstacles_changed([(x, y)])
+
+    def remove_obstacle(self, obstacle_id: int):
+        """Remove obstacle from MazeSolver object
+
+        Args:
+            obstacle_id (int): ID of obstacle
+        """
+        obstacle = self.grid.remove_obstacle(obstacle_id)
+        if obstacle is not None:
+            self.on_obstacles_changed([(obstacle.x, obstacle.y)])
+
+    def move_obstacle(self, obstacle_id: int, x: int, y: int, direction: Direction):
+        """Move an obstacle to a new position and/or direction
+
+        Args:
+            obstacle_id (int): ID of obstacle
+            x (int): new x coordinate of obstacle
+            y (int): new y coordinate of obstacle
+            direction (Direction): new direction of obstacle
+        """
+        old_obstacle = self.grid.move_obstacle(obstacle_id, x, y, direction)
+        if old_obstacle is None:
+            self.add_obstacle(x, y, direction, obstacle_id)
+            return
+        self.on_obstacles_changed([(old_obstacle.x, old_obstacle.y), (x, y)])
 
     def reset_obstacles(self):
+        positions = [(ob.x, ob.y) for ob in self.grid.obstacles]
         self.grid.reset_obstacles()
+        self.on_obstacles_changed(positions)
+
+    def on_obstacles_changed(self, positions):
+        """Invalidate search results after obstacles changed at the given positions
+
+        Args:
+            positions (List[Tuple[int, int]]): (x, y) of the changed obstacles
+        """
+        # The planner repairs or drops what it keeps, the tables are refilled from it on the next solve
+        if self.planner is not None:
+            self.planner.repair(positions)
+        # Previous search results may now run through the changed obstacles
+        self.clear_tables()
+
+    def clear_tables(self):
+        """Drop all cached view states, paths, costs and unreachable pairs"""
+        self.path_table = dict()
+        self.cost_table = dict()
+        self.unreachable = set()
+        self.view_positions = dict()
+
+    def get_view_positions(self, retrying):
+        """Get the view states of every obstacle, reusing the CellState objects from previous calls
+
+        Args:
+            retrying (bool): whether to use the view states for retrying
+
+        Returns:
+            Tuple[List[int], List[List[CellState]]]: obstacle ids, and the view states of each of those obstacles
+        """
+        if retrying not in self.view_positions:
+            # Obstacles facing SKIP are left out by get_view_obstacle_positions as well
+            obstacle_ids = [ob.obstacle_id for ob in self.grid.obstacles if ob.direction != Direction.SKIP]
+            self.view_positions[retrying] = (obstacle_ids, self.grid.get_view_obstacle_positions(retrying))
+        return self.view_positions[retrying]
 
     @staticmethod
     def compute_coord_distance(x1: int, y1: int, x2: int, y2: int, level=1):
@@ -108,13 +200,39 @@ class MazeSolver:
         s.sort(key=lambda x: x.count('1'), reverse=True)
         return s
 
-    def get_optimal_order_dp(self, retrying) -> List[CellState]:
+    def get_optimal_order_dp(self, retrying, start_state: CellState = None, obstacle_ids=None, k=1) -> List[CellState]:
+        """Find the cheapest order to visit the obstacles and the path to do so
+
+        The order and view states come from get_alternative_orders, which also gives the next cheapest
+        plans and, with a robustness evaluator, the near-ties it re-ranks.
+
+        Args:
+            retrying (bool): whether to use the view states for retrying
+            start_state (CellState, optional): state to start from. Defaults to the robot's start state.
+            obstacle_ids (Iterable[int], optional): obstacles to visit. Defaults to all obstacles.
+            k (int, optional): number of plans to find. The k - 1 next cheapest plans, each visiting the
+                obstacles in another order, are left in self.alternatives as (path, cost). Defaults to 1.
+
+        Returns:
+            Tuple[List[CellState], float]: optimal path and its cost
+        """
         distance = 1e9
-        optimal_path = []
+        optimal_tour = []
+        tours = []
+        self.alternatives = []
+        # The near-ties re-ranked by robustness come from the same search as the next cheapest plans
+        count = max(k, ROBUST_CANDIDATES) if self.robustness is not None else k
+
+        if start_state is None:
+            start_state = self.robot.get_start_state()
 
         #print(f"Inside get_optimal_order_dp: retrying = {retrying}")
         # Get all possible positions that can view the obstacles
-        all_view_positions = self.grid.get_view_obstacle_positions(retrying)
+        view_obstacle_ids, all_view_positions = self.get_view_positions(retrying)
+        if obstacle_ids is not None:
+            obstacle_ids = set(obstacle_ids)
+            all_view_positions = [view_positions for obstacle_id, view_positions in zip(view_obstacle_ids, all_view_positions)
+                                  if obstacle_id in obstacle_ids]
         #print(f"all_view_positions: {all_view_positions}")
         #print(f"All view position: {all_view_positions}")
 
@@ -122,15 +240,10 @@ class MazeSolver:
             # op is binary string of length len(all_view_positions) == len(obstacles)
             # If index == 1 means the view_positions[index] is selected to visit, otherwise drop
 
-            # Calculate optimal_cost table
-
             # Initialize `items` to be a list containing the robot's start state as the first item
-            items = [self.robot.get_start_state()]
+            items = [start_state]
             # Initialize `cur_view_positions` to be an empty list
             cur_view_positions = []
-            
-            # print(f"===================\nop = {op}")
-            # print("List of obstacle visited: \n")
 
             # For each obstacle
             for idx in range(len(all_view_positions)):
@@ -140,74 +253,364 @@ class MazeSolver:
                     items = items + all_view_positions[idx]
                     # Add possible cells to `cur_view_positions`
                     cur_view_positions.append(all_view_positions[idx])
-                    #print("obstacle: {}\n".format(self.grid.obstacles[idx]))
 
             # Generate the path cost for the items
             self.path_cost_generator(items)
-            combination = []
-            self.generate_combination(cur_view_positions, 0, [], combination, [ITERATIONS])
-
-            for c in combination: # run the algo some times ->
-                visited_candidates = [0] # add the start state of the robot
-
-                cur_index = 1
-                fixed_cost = 0 # the cost applying for the position taking obstacle pictures
-                for index, view_position in enumerate(cur_view_positions):
-                    visited_candidates.append(cur_index + c[index])
-                    fixed_cost += view_position[c[index]].penalty
-                    cur_index += len(view_position)
-                
-                cost_np = np.zeros((len(visited_candidates), len(visited_candidates)))
-
-                for s in range(len(visited_candidates) - 1):
-                    for e in range(s + 1, len(visited_candidates)):
-                        u = items[visited_candidates[s]]
-                        v = items[visited_candidates[e]]
-                        if (u, v) in self.cost_table.keys():
-                            cost_np[s][e] = self.cost_table[(u, v)]
-                        else:
-                            cost_np[s][e] = 1e9
-                        cost_np[e][s] = cost_np[s][e]
-                cost_np[:, 0] = 0
-                _permutation, _distance = solve_tsp_dynamic_programming(cost_np)
-                # print(f"fixed_cost = {fixed_cost}")
-                # print(f"distance = {_distance}")
-                if _distance + fixed_cost >= distance:
-                    continue
 
-                optimal_path = [items[0]]
-                distance = _distance + fixed_cost
+            # One DP over every view state finds the best combination and order at once
+            tours = self.get_alternative_orders(start_state, cur_view_positions, count)
+            if tours:
+                # if found optimal path, return
+                distance, optimal_tour = tours[0]
+                break
 
-                for i in range(len(_permutation) - 1):
-                    from_item = items[visited_candidates[_permutation[i]]]
-                    to_item = items[visited_candidates[_permutation[i + 1]]]
+        if len(optimal_tour) - 1 < len(all_view_positions):
+            print(f"No tour visits all {len(all_view_positions)} obstacles, dropping {len(all_view_positions) - max(len(optimal_tour) - 1, 0)} of them")
 
-                    cur_path = self.path_table[(from_item, to_item)]
-                    for j in range(1, len(cur_path)):
-                        optimal_path.append(CellState(cur_path[j][0], cur_path[j][1], cur_path[j][2]))
+        if self.robustness is not None and optimal_tour:
+            optimal_tour, distance = self.get_robust_tour(tours, distance)
 
-                    optimal_path[-1].set_screenshot(to_item.screenshot_id)
+        optimal_path = self.expand_tour(optimal_tour)
+        self.alternatives = [(self.expand_tour(tour), cost) for cost, tour in tours if tour is not optimal_tour][:k - 1]
 
-            if optimal_path:
-                # if found optimal path, return
-                break
+        if self.planner is not None:
+            self.planner.end_solve()
 
         return optimal_path, distance
 
+    def replan(self, current_x: int, current_y: int, current_direction: Direction, remaining_obstacle_ids, retrying=False, k=1):
+        """Plan the rest of the run from where the robot currently is.
+
+        Paths and costs between view states are kept from the previous solve, so only the
+        searches from the new pose have to be run.
+
+        Args:
+            current_x (int): x coordinate of the robot
+            current_y (int): y coordinate of the robot
+            current_direction (Direction): direction the robot is facing
+            remaining_obstacle_ids (Iterable[int]): obstacles that still have to be visited
+            retrying (bool, optional): whether to use the view states for retrying. Defaults to False.
+            k (int, optional): number of plans to find, see get_optimal_order_dp. Defaults to 1.
+
+        Returns:
+            Tuple[List[CellState], float]: optimal path and its cost
+        """
+        current_state = CellState(current_x, current_y, Direction(current_direction))
+        return self.get_optimal_order_dp(retrying, start_state=current_state, obstacle_ids=remaining_obstacle_ids, k=k)
+
+    def get_first_target(self, retrying, epsilon=STREAM_EPSILON):
+        """Commit to the first view state to visit without solving the whole tour
+
+        Each view state gets a lower bound on the best tour that starts with it: the searched path
+        to it, then the best tour over the other obstacles with the cost of each path between two
+        view states taken from the tables, or else bounded by its cost without obstacles (see
+        get_free_costs) and the safe cost of its end. The best tour costs at least the
+        smallest of these bounds. A view state is only committed to once a tour through it, built
+        by going to the nearest obstacle left, costs at most (1 + epsilon) times that: the best
+        tour through it costs no more, so it is within (1 + epsilon) of the best tour. View states
+        are tried from the smallest bound up, at most STREAM_ATTEMPTS of them, and the paths each
+        try searches tighten the bounds for the next.
+
+        Args:
+            retrying (bool): whether to use the view states for retrying
+            epsilon (float, optional): how far above the best tour the tour through the chosen view state may be. Defaults to STREAM_EPSILON.
+
+        Returns:
+            Tuple[List[CellState], float, float, int]: path to the chosen view state, its cost, the lower
+            bound on the cost of any tour, and the id of the chosen obstacle. The path is empty if
+            no view state can be committed to, and the whole tour has to be solved first.
+        """
+        start_state = self.robot.get_start_state()
+        obstacle_ids, all_view_positions = self.get_view_positions(retrying)
+        for view_positions in all_view_positions:
+            for view_state in view_positions:
+                self.path_cost_generator([start_state, view_state])
+        # A view state the start cannot reach is in no tour, and neither is an obstacle without any
+        all_view_positions = [[view_state for view_state in view_positions if (start_state, view_state) in self.cost_table]
+                              for view_positions in all_view_positions]
+        visitable = [(obstacle_id, view_positions) for obstacle_id, view_positions in zip(obstacle_ids, all_view_positions) if view_positions]
+        if not visitable:
+            if self.planner is not None:
+                self.planner.end_solve()
+            return [], 0, 0, -1
+        obstacle_ids = [obstacle_id for obstacle_id, _ in visitable]
+        all_view_positions = [view_positions for _, view_positions in visitable]
+
+        # Least any path between two view states costs
+        states = [view_state for view_positions in all_view_positions for view_state in view_positions]
+        size_x, size_y = self.grid.size_x, self.grid.size_y
+        xs = np.array([view_state.x for view_state in states])
+        ys = np.array([view_state.y for view_state in states])
+        directions = np.array([int(view_state.direction) for view_state in states])
+        free = get_free_costs(self)[directions[:, None], xs[None, :] - xs[:, None] + size_x - 1,
+                                    ys[None, :] - ys[:, None] + size_y - 1, directions[None, :]]
+        safe_costs = np.array([self.get_safe_cost(view_state.x, view_state.y) for view_state in states], dtype=float)
+        free_bounds = np.where(free > 0, free + safe_costs[None, :], 0)
+        penalties = np.array([view_state.penalty for view_state in states], dtype=float)
+        first_costs = np.array([self.cost_table[(start_state, view_state)] for view_state in states]) + penalties
+        indices = []
+        for view_positions in all_view_positions:
+            first = sum(len(indexed) for indexed in indices)
+            indices.append(np.arange(first, first + len(view_positions)))
+        owners = np.concatenate([np.full(len(indexed), index) for index, indexed in enumerate(indices)])
+        everything = (1 << len(all_view_positions)) - 1
+
+        def get_bounds():
+            costs = np.array([[self.cost_table.get((u, v), free_bounds[i, j]) for j, v in enumerate(states)]
+                              for i, u in enumerate(states)])
+            rest = self.get_rest_costs(costs, penalties, indices)
+            return first_costs + rest[everything ^ (1 << owners), np.arange(len(states))]
+
+        bounds = get_bounds()
+        tried = set()
+        chosen = None
+        for _ in range(STREAM_ATTEMPTS):
+            limit = (1 + epsilon) * np.min(bounds)
+            untried = [i for i in np.argsort(bounds, kind="stable") if i not in tried and bounds[i] <= limit]
+            if not untried:
+                break
+            i = int(untried[0])
+            tried.add(i)
+            others = [view_positions for index, view_positions in enumerate(all_view_positions) if index != owners[i]]
+            upper_bound = first_costs[i] + self.get_greedy_cost(states[i], others, limit - first_costs[i])
+            # The searched paths may raise the bounds, and the best tour's cost with them
+            bounds = get_bounds()
+            if upper_bound <= (1 + epsilon) * np.min(bounds):
+                chosen = i
+                break
+
+        if self.planner is not None:
+            self.planner.end_solve()
+        lower_bound = float(np.min(bounds))
+        if chosen is None:
+            return [], 0, lower_bound, -1
+        first_path = self.expand_tour([start_state, states[chosen]])
+        return first_path, float(first_costs[chosen]), lower_bound, obstacle_ids[owners[chosen]]
+
+    def get_greedy_cost(self, start_state: CellState, view_positions, limit=np.inf):
+        """Get the cost of the tour that always goes to the nearest obstacle left
+
+        Args:
+            start_state (CellState): state the tour starts from
+            view_positions (List[List[CellState]]): view states of each obstacle to visit
+            limit (float, optional): cost above which the tour is given up. Defaults to no limit.
+
+        Returns:
+            float: cost of the tour, inf if an obstacle cannot be reached or the limit is passed
+        """
+        left = list(view_positions)
+        current = start_state
+        total = 0
+        while left and total <= limit:
+            best = None
+            for index, positions in enumerate(left):
+                for view_state in positions:
+                    self.path_cost_generator([current, view_state])
+                    if (current, view_state) not in self.cost_table:
+                        continue
+                    cost = self.cost_table[(current, view_state)] + view_state.penalty
+                    if best is None or cost < best[0]:
+                        best = (cost, view_state, index)
+            if best is None:
+                return np.inf
+            total += best[0]
+            current = best[1]
+            left.pop(best[2])
+        return total if total <= limit else np.inf
+
+    def get_alternative_orders(self, start_state: CellState, view_positions, count, exclude=None):
+        """Get the cheapest tours that visit the obstacles in different orders
+
+        Each order takes the view states that make it cheapest. A DP over the obstacles left to visit
+        gives the exact cost of the best rest of a tour from every view state, so a best-first search
+        over the orders, from the start state, completes them cheapest first.
+
+        Args:
+            start_state (CellState): state the tours start from
+            view_positions (List[List[CellState]]): view states of each obstacle, with their paths in the tables
+            count (int): number of tours to get
+            exclude (List[CellState], optional): tour whose order to leave out
+
+        Returns:
+            List[Tuple[float, List[CellState]]]: up to `count` tours, cheapest first
+        """
+        # An obstacle that cannot be seen from anywhere cannot be part of a tour
+        view_positions = [positions for positions in view_positions if positions]
+        states = [start_state] + [view_state for positions in view_positions for view_state in positions]
+        penalties = np.array([0] + [view_state.penalty for view_state in states[1:]], dtype=float)
+        indices = []
+        for positions in view_positions:
+            first = 1 + sum(len(indexed) for indexed in indices)
+            indices.append(np.arange(first, first + len(positions)))
+        costs = np.array([[self.cost_table.get((u, v), np.inf) for v in states] for u in states])
+
+        n = len(view_positions)
+        rest = self.get_rest_costs(costs, penalties, indices)
+
+        excluded = None if exclude is None else tuple(view_state.screenshot_id for view_state in exclude[1:])
+        start_costs = np.full(len(states), np.inf)
+        start_costs[0] = 0
+        # (lower bound, tie breaker, order, cost to each state after each obstacle of the order)
+        heap = [(rest[(1 << n) - 1][0], 0, (), [start_costs])]
+        pushed = 1
+        tours = []
+        # The first tour is always found, as the cheapest. Only the search for the next ones is capped
+        while heap and len(tours) < count and (not tours or pushed < ITERATIONS):
+            bound, _, order, layers = heapq.heappop(heap)
+            if len(order) == n:
+                # Walk back through the layers for the view states the cost came from
+                tour = []
+                v = int(np.argmin(layers[-1]))
+                for layer in reversed(layers[:-1]):
+                    tour.append(states[v])
+                    v = int(np.argmin(layer + costs[:, v]))
+                tour.reverse()
+                if tuple(view_state.screenshot_id for view_state in tour) != excluded:
+                    tours.append((float(bound), [start_state] + tour))
+                continue
+
+            left = (1 << n) - 1 - sum(1 << j for j in order)
+            for j in range(n):
+                if not left & (1 << j):
+                    continue
+                to = indices[j]
+                layer = np.full(len(states), np.inf)
+                layer[to] = np.min(layers[-1][:, None] + costs[:, to], axis=0) + penalties[to]
+                next_bound = np.min(layer[to] + rest[left ^ (1 << j)][to])
+                if next_bound < np.inf:
+                    heapq.heappush(heap, (next_bound, pushed, order + (j,), layers + [layer]))
+                    pushed += 1
+        return tours
+
     @staticmethod
-    def generate_combination(view_positions, index, current, result, iteration_left):
-        if index == len(view_positions):
-            result.append(current[:])
-            return
+    def get_rest_costs(costs, penalties, indices):
+        """Get the cost of the cheapest way to visit every subset of the obstacles from every state
 
-        if iteration_left[0] == 0:
-            return
+        Args:
+            costs (np.ndarray): cost[u, v] of the path from state u to state v, inf if there is none
+            penalties (np.ndarray): penalty of each state
+            indices (List[np.ndarray]): states of each obstacle
 
-        iteration_left[0] -= 1
-        for j in range(len(view_positions[index])):
-            current.append(j)
-            MazeSolver.generate_combination(view_positions, index + 1, current, result, iteration_left)
-            current.pop()
+        Returns:
+            np.ndarray: rest[mask, v], cost of visiting the obstacles in mask from state v
+        """
+        n = len(indices)
+        rest = np.full((1 << n, len(penalties)), np.inf)
+        rest[0] = 0
+        for mask in range(1, 1 << n):
+            for j in range(n):
+                if mask & (1 << j):
+                    to = indices[j]
+                    rest[mask] = np.minimum(rest[mask], np.min(costs[:, to] + penalties[to] + rest[mask ^ (1 << j)][to], axis=1))
+        return rest
+
+    @staticmethod
+    def get_distinct_tours(candidates, count, exclude=None):
+        """Get the cheapest tours that differ in their order or view states
+
+        Args:
+            candidates (List[Tuple[float, List[CellState]]]): cost and tour of each candidate
+            count (int): number of tours to get
+            exclude (List[CellState], optional): tour to leave out
+
+        Returns:
+            List[Tuple[float, List[CellState]]]: up to `count` tours, cheapest first
+        """
+        seen = set()
+        if exclude is not None:
+            seen.add(tuple(id(state) for state in exclude))
+
+        tours = []
+        for cost, tour in sorted(candidates, key=lambda candidate: candidate[0]):
+            if len(tours) == count:
+                break
+            key = tuple(id(state) for state in tour)
+            if key not in seen:
+                seen.add(key)
+                tours.append((cost, tour))
+        return tours
+
+    def get_robust_tour(self, candidates, distance):
+        """Pick the most robust of the tours that cost about as much as the cheapest one
+
+        Args:
+            candidates (List[Tuple[float, List[CellState]]]): cost and tour of each candidate
+            distance (float): cost of the cheapest tour
+
+        Returns:
+            Tuple[List[CellState], float]: chosen tour and its cost
+        """
+        from pathfinding.simulator import Simulator
+
+        near_ties = [(cost, tour) for cost, tour in self.get_distinct_tours(candidates, ROBUST_CANDIDATES)
+                     if cost <= distance + ROBUST_TIE_MARGIN]
+
+        obstacles = [{'x': ob.x, 'y': ob.y, 'd': ob.direction, 'id': ob.obstacle_id} for ob in self.grid.obstacles]
+        simulator = Simulator(self.grid, big_turn=self.big_turn)
+        best = None
+        for cost, tour in near_ties:
+            commands, _ = command_generator(self.expand_tour(tour), obstacles)
+            score = self.robustness.evaluate(simulator, commands, (tour[0].x, tour[0].y, tour[0].direction))['score']
+            # Cheaper tours come first, so a later one has to be strictly more robust
+            if best is None or score > best[0]:
+                best = (score, tour, cost)
+
+        return best[1], best[2]
+
+    def expand_tour(self, tour: List[CellState]) -> List[CellState]:
+        """Expand the paths between consecutive states of a tour into a list of CellStates
+
+        Args:
+            tour (List[CellState]): start state followed by the view states in visiting order
+
+        Returns:
+            List[CellState]: every state along the tour, with the screenshot ids set on the view states
+        """
+        if not tour:
+            return []
+
+        optimal_path = [tour[0]]
+        for from_item, to_item in zip(tour, tour[1:]):
+            cur_path = self.get_path(from_item, to_item)
+            for j in range(1, len(cur_path)):
+                optimal_path.append(CellState(cur_path[j][0], cur_path[j][1], cur_path[j][2]))
+
+            optimal_path[-1].set_screenshot(to_item.screenshot_id)
+
+        return optimal_path
+
+    def record_path(self, start: CellState, end: CellState, cost, path, reverse=True):
+        """Record the cost and path between two states, for both directions
+
+        The path is packed once, for the (start, end) direction only. See get_path. Driven backwards,
+        it pays the safe cost of its start instead of that of its end.
+
+        Args:
+            start (CellState): start state
+            end (CellState): end state
+            cost (float): cost of the path
+            path (List[Tuple]): (x, y, direction) states from start to end
+            reverse (bool, optional): whether the path also stands for the (end, start) direction, see
+                is_reversible. Defaults to True.
+        """
+        self.cost_table[(start, end)] = cost
+        if reverse:
+            self.cost_table[(end, start)] = cost - self.get_safe_cost(end.x, end.y) + self.get_safe_cost(start.x, start.y)
+        self.path_table[(start, end)] = PackedPath.encode(path)
+
+    def has_path(self, start: CellState, end: CellState) -> bool:
+        return (start, end) in self.path_table or (end, start) in self.path_table
+
+    def get_path(self, start: CellState, end: CellState):
+        """Get the path between two states, decoding it backwards if it was recorded the other way
+
+        Returns:
+            List[Tuple]: (x, y, direction) states from start to end
+        """
+        packed_path = self.path_table.get((start, end))
+        if packed_path is not None:
+            return packed_path.decode()
+        return self.path_table[(end, start)].decode(reverse=True)
 
     def get_safe_cost(self, x, y):
         """Get the safe cost of a particular x,y coordinate wrt obstacles that are exactly 2 units away from it in both x and y directions
@@ -350,88 +753,54 @@ class MazeSolver:
 
     #     return neighbors
 
+    def get_turn_displacement(self):
+        """Get the displacement of a 90 degree turn
+
+        Returns:
+            Tuple[int, int]: (bigger_change, smaller_change)
+        """
+        return turn_wrt_big_turns[self.big_turn][0], turn_wrt_big_turns[self.big_turn][1]
+
     def get_neighbors(self, x, y, direction):
-        neighbors = []
-
-        # --- Straight Forward / Backward ---
-        for dx, dy, md in MOVE_DIRECTION:
-            if md == direction:
-                if self.grid.reachable(x + dx, y + dy):
-                    safe_cost = self.get_safe_cost(x + dx, y + dy)
-                    neighbors.append((x + dx, y + dy, md, safe_cost))
-                if self.grid.reachable(x - dx, y - dy):
-                    safe_cost = self.get_safe_cost(x - dx, y - dy)
-                    neighbors.append((x - dx, y - dy, md, safe_cost))
-
-        # --- 45° Diagonals ---
-        if self.allow_45:
-            for dx, dy, md in MOVE_DIRECTION:
-                diff = (int(md) - int(direction)) % 8
-                if diff in [1, 7]:  # ±45°
-                    if self.grid.reachable(x + dx, y + dy, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(x + dx, y + dy)
-                        # add small penalty so A* doesn’t overuse diagonals
-                        neighbors.append((x + dx, y + dy, md, safe_cost + 5))
-
-        # --- 90° Arcs ---
-        bigger_change = turn_wrt_big_turns[self.big_turn][0]
-        smaller_change = turn_wrt_big_turns[self.big_turn][1]
-
-        # north <-> east
-        if direction == Direction.NORTH:
-            if self.grid.reachable(x + bigger_change, y + smaller_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x + bigger_change, y + smaller_change)
-                neighbors.append((x + bigger_change, y + smaller_change, Direction.EAST, safe_cost + 10))
-            if self.grid.reachable(x - smaller_change, y - bigger_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x - smaller_change, y - bigger_change)
-                neighbors.append((x - smaller_change, y - bigger_change, Direction.EAST, safe_cost + 10))
-
-        elif direction == Direction.EAST:
-            if self.grid.reachable(x + smaller_change, y + bigger_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x + smaller_change, y + bigger_change)
-                neighbors.append((x + smaller_change, y + bigger_change, Direction.NORTH, safe_cost + 10))
-            if self.grid.reachable(x - bigger_change, y - smaller_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x - bigger_change, y - smaller_change)
-                neighbors.append((x - bigger_change, y - smaller_change, Direction.NORTH, safe_cost + 10))
-
-            if self.grid.reachable(x + smaller_change, y - bigger_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x + smaller_change, y - bigger_change)
-                neighbors.append((x + smaller_change, y - bigger_change, Direction.SOUTH, safe_cost + 10))
-            if self.grid.reachable(x - bigger_change, y + smaller_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x - bigger_change, y + smaller_change)
-                neighbors.append((x - bigger_change, y + smaller_change, Direction.SOUTH, safe_cost + 10))
-
-        elif direction == Direction.SOUTH:
-            if self.grid.reachable(x + bigger_change, y - smaller_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x + bigger_change, y - smaller_change)
-                neighbors.append((x + bigger_change, y - smaller_change, Direction.EAST, safe_cost + 10))
-            if self.grid.reachable(x - smaller_change, y + bigger_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x - smaller_change, y + bigger_change)
-                neighbors.append((x - smaller_change, y + bigger_change, Direction.EAST, safe_cost + 10))
-
-            if self.grid.reachable(x - bigger_change, y - smaller_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x - bigger_change, y - smaller_change)
-                neighbors.append((x - bigger_change, y - smaller_change, Direction.WEST, safe_cost + 10))
-            if self.grid.reachable(x + smaller_change, y + bigger_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x + smaller_change, y + bigger_change)
-                neighbors.append((x + smaller_change, y + bigger_change, Direction.WEST, safe_cost + 10))
-
-        elif direction == Direction.WEST:
-            if self.grid.reachable(x - smaller_change, y - bigger_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x - smaller_change, y - bigger_change)
-                neighbors.append((x - smaller_change, y - bigger_change, Direction.SOUTH, safe_cost + 10))
-            if self.grid.reachable(x + bigger_change, y + smaller_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x + bigger_change, y + smaller_change)
-                neighbors.append((x + bigger_change, y + smaller_change, Direction.SOUTH, safe_cost + 10))
-
-            if self.grid.reachable(x - smaller_change, y + bigger_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x - smaller_change, y + bigger_change)
-                neighbors.append((x - smaller_change, y + bigger_change, Direction.NORTH, safe_cost + 10))
-            if self.grid.reachable(x + bigger_change, y - smaller_change, turn=True) and self.grid.reachable(x, y, preTurn=True):
-                safe_cost = self.get_safe_cost(x + bigger_change, y - smaller_change)
-                neighbors.append((x + bigger_change, y - smaller_change, Direction.NORTH, safe_cost + 10))
-
-        return neighbors
+        """Get the states reachable in one move, from the primitive library of the solver
+
+        Returns:
+            List[Tuple[int, int, Direction, float]]: (next_x, next_y, new_direction, safe_cost), the safe cost
+            including the penalty of the move
+        """
+        return [(x + primitive.dx, y + primitive.dy, primitive.new_direction,
+                 self.get_safe_cost(x + primitive.dx, y + primitive.dy) + primitive.penalty)
+                for primitive in self.get_primitives(x, y, direction)]
+
+    def get_primitives(self, x, y, direction, primitives=None):
+        """Get the primitives that can be taken from a state, i.e. whose footprint is clear
+
+        Args:
+            primitives (List[Primitive], optional): primitives to check. Defaults to all those of the heading.
+        """
+        clear = []
+        for primitive in self.primitives[int(direction)] if primitives is None else primitives:
+            if all(self.grid.reachable(x + fx, y + fy, turn=kind == TURN, preTurn=kind == PRE_TURN)
+                   for fx, fy, kind in primitive.footprint):
+                clear.append(primitive)
+        return clear
+
+    def get_successors(self, x, y, direction, primitives=None):
+        """Get the states reachable in one move and the cost of that move
+
+        Args:
+            primitives (List[Primitive], optional): moves to take. Defaults to all those of the heading.
+
+        Returns:
+            List[Tuple[int, int, Direction, float]]: (next_x, next_y, new_direction, move_cost)
+        """
+        successors = []
+        for primitive in self.get_primitives(x, y, direction, primitives):
+            next_x, next_y = x + primitive.dx, y + primitive.dy
+            # rotation and step (straight (1) or diagonal (sqrt(2))), then how close the end is to obstacles
+            move_cost = primitive.base_cost + (self.get_safe_cost(next_x, next_y) + primitive.penalty)
+            successors.append((next_x, next_y, primitive.new_direction, move_cost))
+        return successors
 
     def path_cost_generator(self, states: List[CellState]):
         """Generate the path cost between the input states and update the tables accordingly
@@ -439,11 +808,32 @@ class MazeSolver:
         Args:
             states (List[CellState]): cell states to visit
         """
-        def record_path(start, end, parent: dict, cost: int):
+        if self.edge_store is not None:
+            missing = self.edge_store.load(self, states)
+
+        if self.planner is not None:
+            self.planner.path_cost_generator(states)
+        else:
+            self.astar_path_cost_generator(states)
+
+        if self.edge_store is not None:
+            self.edge_store.save(self, missing)
 
-            # Update cost table for the (start,end) and (end,start) edges
-            self.cost_table[(start, end)] = cost
-            self.cost_table[(end, start)] = cost
+    def astar_path_cost_generator(self, states: List[CellState]):
+        """Run A* searches until every pair of the input states is in the tables
+
+        One search is run from each state, towards all the states it has no path to yet: it carries on
+        after reaching each of them, with the heuristic taken to the nearest target left. When the
+        motion model is reversible (see is_reversible), the path to a later state also gives the path
+        back from it, so a state only searches for the states after it. Otherwise every state searches
+        for all the others.
+
+        Args:
+            states (List[CellState]): cell states to visit
+        """
+        reversible = is_reversible(self)
+
+        def record_path(start, end, parent: dict, cost: int):
 
             path = []
             cursor = (end.x, end.y, end.direction)
@@ -454,63 +844,64 @@ class MazeSolver:
 
             path.append(cursor)
 
-            # Update path table for the (start,end) and (end,start) edges, with the (start,end) edge being the reversed path
-            self.path_table[(start, end)] = path[::-1]
-            self.path_table[(end, start)] = path
+            # Update cost and path tables for the (start,end) and (end,start) edges, with the (start,end) edge being the reversed path
+            self.record_path(start, end, cost, path[::-1], reverse=reversible)
 
-        def astar_search(start: CellState, end: CellState):
+        def astar_search(start: CellState, ends: List[CellState]):
             # astar search algo with three states: x, y, direction
 
-            # If it is already done before, return
-            if (start, end) in self.path_table:
+            # Targets that are not done before
+            targets = dict()
+            for end in ends:
+                if self.has_path(start, end) if reversible else (start, end) in self.path_table:
+                    continue
+                if (start, end) in self.unreachable:
+                    continue
+                targets[(end.x, end.y, end.direction)] = end
+            if not targets:
                 return
+            self.searches += 1
+
+            def heuristic(x, y):
+                return min(self.compute_coord_distance(x, y, end.x, end.y, level=2) for end in targets.values())
 
             # Heuristic to guide the search: 'distance' is calculated by f = g + h
             # g is the actual distance moved so far from the start node to current node
-            # h is the heuristic distance from current node to end node
+            # h is the heuristic distance from current node to the nearest end node
             g_distance = {(start.x, start.y, start.direction): 0}
 
             # format of each item in heap: (f_distance of node, x coord of node, y coord of node)
             # heap in Python is a min-heap
-            heap = [(self.compute_state_distance(start, end), start.x, start.y, start.direction)]
+            heap = [(heuristic(start.x, start.y), start.x, start.y, start.direction)]
             parent = dict()
             visited = set()
 
             while heap:
                 # Pop the node with the smallest distance
                 _, cur_x, cur_y, cur_direction = heapq.heappop(heap)
-                
+
                 if (cur_x, cur_y, cur_direction) in visited:
                     continue
 
-                if end.is_eq(cur_x, cur_y, cur_direction):
+                end = targets.pop((cur_x, cur_y, cur_direction), None)
+                if end is not None:
                     record_path(start, end, parent, g_distance[(cur_x, cur_y, cur_direction)])
-                    return
+                    if not targets:
+                        return
+                    # The heuristic to the targets left is still consistent, so the visited states keep their costs
+                    heap = [(g_distance[(x, y, d)] + heuristic(x, y), x, y, d) for _, x, y, d in heap]
+                    heapq.heapify(heap)
 
                 visited.add((cur_x, cur_y, cur_direction))
                 cur_distance = g_distance[(cur_x, cur_y, cur_direction)]
 
-                for next_x, next_y, new_direction, safe_cost in self.get_neighbors(cur_x, cur_y, cur_direction):
+                for next_x, next_y, new_direction, move_cost in self.get_successors(cur_x, cur_y, cur_direction):
                     if (next_x, next_y, new_direction) in visited:
                         continue
-                    
-                    #step cost = straight (1) or diagaonal (sqrt(2))
-                    step_cost = math.sqrt((next_x - cur_x) ** 2 + (next_y - cur_y) ** 2)
-                    move_cost = Direction.rotation_cost(new_direction, cur_direction) * TURN_FACTOR + step_cost + safe_cost
-
-                    #move_cost = Direction.rotation_cost(new_direction, cur_direction) * TURN_FACTOR + 1 + safe_cost
-
-                    # the cost to check if any obstacles that considered too near the robot; if it
-                    # safe_cost =
 
                     # new cost is calculated by the cost to reach current state + cost to move from
-                    # current state to new state + heuristic cost from new state to end state
-                    # next_cost = cur_distance + move_cost + \
-                    #             self.compute_coord_distance(next_x, next_y, end.x, end.y)
-
-                    next_cost = cur_distance + move_cost + \
-                                self.compute_coord_distance(next_x, next_y, end.x, end.y, level=2)
-
+                    # current state to new state + heuristic cost from new state to the nearest end state
+                    next_cost = cur_distance + move_cost + heuristic(next_x, next_y)
 
                     if (next_x, next_y, new_direction) not in g_distance or \
                             g_distance[(next_x, next_y, new_direction)] > cur_distance + move_cost:
@@ -519,10 +910,14 @@ class MazeSolver:
 
                         heapq.heappush(heap, (next_cost, next_x, next_y, new_direction))
 
-        # Nested loop through all the state pairings
-        for i in range(len(states) - 1):
-            for j in range(i + 1, len(states)):
-                astar_search(states[i], states[j])
+            # Every state reachable from the start is visited: the targets left cannot be reached, so they are not searched again.
+            # They may still reach the start, with moves the planner does not take from it (see is_reversible)
+            for end in targets.values():
+                self.unreachable.add((start, end))
+
+        # One search per state, for the states after it, or for all the others if paths cannot be reversed
+        for i in range(len(states)):
+            astar_search(states[i], states[i + 1:] if reversible else states[:i] + states[i + 1:])
 
 if __name__ == "__main__":
     pass
\ No newline at end of file
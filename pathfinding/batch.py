@@ -0,0 +1,127 @@
+import contextlib
+import io
+import time
+from multiprocessing import Pool
+import numpy as np
+from pathfinding.pathfinding import pathfinding, create_maze_solver, update_obstacles
+from pathfinding.symmetry import EdgeCostStore
+
+
+class BatchWorker:
+    """
+    Solves layouts one after another, keeping its solver and path costs between them.
+
+    The solver is brought in line with each new layout by update_obstacles instead of being built
+    again, and an EdgeCostStore carries the costs of obstacle positions seen in earlier layouts.
+    """
+
+    def __init__(self, engine="wavefront", big_turn=None, retrying=False):
+        self.engine = engine
+        self.big_turn = big_turn
+        self.retrying = retrying
+        self.maze_solver = None
+        self.edge_store = EdgeCostStore()
+
+    def solve(self, item):
+        """Solve one layout
+
+        Args:
+            item (Tuple[int, List[dict]]): index of the layout and its obstacles
+
+        Returns:
+            dict: the index, the results of pathfinding() (empty on failure), the solve time in seconds
+                  and the error message if the layout could not be solved
+        """
+        index, obstacles = item
+        start = time.perf_counter()
+        try:
+            # pathfinding() prints its timings, which would flood the output of a sweep
+            with contextlib.redirect_stdout(io.StringIO()):
+                if self.maze_solver is None:
+                    self.maze_solver = create_maze_solver(obstacles, big_turn=self.big_turn, engine=self.engine,
+                                                          edge_store=self.edge_store)
+                else:
+                    update_obstacles(self.maze_solver, obstacles)
+                result = pathfinding(obstacles, big_turn=self.big_turn, retrying=self.retrying, maze_solver=self.maze_solver)
+            error = None
+        except Exception as e:
+            # Start the next layout from a clean solver
+            self.maze_solver = None
+            result = dict()
+            error = f"{type(e).__name__}: {e}"
+
+        return {'index': index, **result, 'solve_time': time.perf_counter() - start, 'error': error}
+
+
+# Worker of the current process, when running in a Pool
+_worker = None
+
+
+def _init_worker(engine, big_turn, retrying):
+    global _worker
+    _worker = BatchWorker(engine, big_turn, retrying)
+
+
+def _solve(item):
+    return _worker.solve(item)
+
+
+def pathfinding_batch(layouts, workers=1, engine="wavefront", big_turn=None, retrying=False, output=None, chunksize=4):
+    """
+    Solve many layouts, yielding the results in order as they come in
+
+    Inputs
+    ------
+    layouts: iterable of layouts, each a list of obstacles as for pathfinding()
+    workers: number of processes; 1 solves everything in this process
+    engine, big_turn, retrying: solver options, as for create_maze_solver() and pathfinding()
+    output: optional .npz file the results are written to, once every layout is solved
+    chunksize: number of layouts handed to a worker at a time
+
+    Returns
+    -------
+    Generator of dictionaries, see BatchWorker.solve
+    """
+    rows = []
+    if workers <= 1:
+        worker = BatchWorker(engine, big_turn, retrying)
+        results = map(worker.solve, enumerate(layouts))
+        pool = None
+    else:
+        pool = Pool(workers, initializer=_init_worker, initargs=(engine, big_turn, retrying))
+        results = pool.imap(_solve, enumerate(layouts), chunksize)
+
+    try:
+        for result in results:
+            if output is not None:
+                rows.append(result)
+            yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    if output is not None:
+        write_batch_results(output, rows)
+
+
+def write_batch_results(output, rows):
+    """
+    Write batch results as one NumPy array per column
+
+    Inputs
+    ------
+    output: path of the .npz file
+    rows: results from pathfinding_batch
+    """
+    columns = {
+        'index': np.array([row['index'] for row in rows], dtype=np.int64),
+        'distance': np.array([row.get('distance', np.nan) for row in rows], dtype=np.float64),
+        'solve_time': np.array([row['solve_time'] for row in rows], dtype=np.float64),
+        'run_time': np.array([sum(row.get('time', [])) for row in rows], dtype=np.float64),
+        'n_commands': np.array([len(row.get('commands', [])) for row in rows], dtype=np.int64),
+        'n_snaps': np.array([sum(command.startswith("SNAP") for command in row.get('commands', [])) for row in rows],
+                            dtype=np.int64),
+        'commands': np.array([",".join(row.get('commands', [])) for row in rows], dtype=str),
+        'error': np.array([row['error'] or "" for row in rows], dtype=str),
+    }
+    np.savez_compressed(output, **columns)
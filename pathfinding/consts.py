@@ -41,4 +41,20 @@ ITERATIONS = 2000
 TURN_RADIUS = 1
 
 SAFE_COST = 1000 # the cost for the turn in case there is a chance that the robot is touch some obstacle
-SCREENSHOT_COST = 50 # the cost for the place where the picture is taken
\ No newline at end of file
+SCREENSHOT_COST = 50 # the cost for the place where the picture is taken
+
+ROBUST_TIE_MARGIN = 10 # tours costing at most this much more than the cheapest are re-ranked by robustness
+ROBUST_CANDIDATES = 5 # at most this many of them
+
+STREAM_EPSILON = 0.2 # the first obstacle is committed early when the tour through it is within this fraction of the best tour
+STREAM_ATTEMPTS = 3 # at most this many first view states are checked for it, see MazeSolver.get_first_target
+
+# Peephole pass over the planner's commands, see helper.compact_commands. Off until the STM has fused turns:
+# command_generator already merges FW/BW runs, so with FUSED_TURNS empty it changes nothing
+COMPACT_COMMANDS = False
+MAX_STRAIGHT = 180 # longest FW/BW distance, in cm, the STM takes as one command
+# Consecutive turns the STM can run as one command, e.g. {("FR90", "FR90"): "FR180"}, once its firmware has them
+FUSED_TURNS = dict()
+COMMAND_OVERHEAD = 1 # seconds the STM spends ramping up and down for every movement command
+
+PLANNER_VERSION = 8 # bump whenever a change to the planner changes its output, so that cached plans are not reused
@@ -310,6 +310,38 @@ class Grid:
         if to_add:
             self.obstacles.append(obstacle)
 
+    def remove_obstacle(self, obstacle_id: int):
+        """Remove the obstacle with the given id from the Grid object
+
+        Args:
+            obstacle_id (int): ID of obstacle to be removed
+
+        Returns:
+            Obstacle: the removed obstacle, or None if there is no obstacle with that id
+        """
+        for i, ob in enumerate(self.obstacles):
+            if ob.obstacle_id == obstacle_id:
+                return self.obstacles.pop(i)
+        return None
+
+    def move_obstacle(self, obstacle_id: int, x: int, y: int, direction: Direction):
+        """Move the obstacle with the given id, keeping its place in the list of obstacles
+
+        Args:
+            obstacle_id (int): ID of obstacle to be moved
+            x (int): new x coordinate of obstacle
+            y (int): new y coordinate of obstacle
+            direction (Direction): new direction of obstacle
+
+        Returns:
+            Obstacle: the obstacle before the move, or None if there is no obstacle with that id
+        """
+        for i, ob in enumerate(self.obstacles):
+            if ob.obstacle_id == obstacle_id:
+                self.obstacles[i] = Obstacle(x, y, direction, obstacle_id)
+                return ob
+        return None
+
     def reset_obstacles(self):
         """
         Resets the obstacles in the grid
@@ -340,7 +372,7 @@ class Grid:
 
         for ob in self.obstacles:
             # print(f"Looking at position x:{x} y:{y} against ob: {ob.x} {ob.y}")
-            if ob.x == 4 and ob.y <= 4 and x < 4 and y < 4:
+            if self.is_start_zone_exception(ob.x, ob.y, x, y):
                 # print(f"ob.x: {ob.x} ob.y: {ob.y} x: {x} y:{y} Triggered four bypass")
                 continue
 
@@ -370,6 +402,21 @@ class Grid:
 
         return True
 
+    @staticmethod
+    def is_start_zone_exception(ob_x: int, ob_y: int, x: int, y: int) -> bool:
+        """Checks if an obstacle right next to the start zone is ignored for the given position
+
+        Args:
+            ob_x (int): x-coordinate of the obstacle
+            ob_y (int): y-coordinate of the obstacle
+            x (int): x-coordinate
+            y (int): y-coordinate
+
+        Returns:
+            bool: True if the obstacle is ignored, False otherwise
+        """
+        return ob_x == 4 and ob_y <= 4 and x < 4 and y < 4
+
     def is_valid_coord(self, x: int, y: int) -> bool:
         """Checks if given position is within bounds
 
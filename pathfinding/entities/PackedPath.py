@@ -0,0 +1,76 @@
+from typing import List, Tuple
+from pathfinding.consts import Direction
+
+
+class PackedPath:
+    """Path stored as its start state and one uint8 code per move.
+
+    A code stands for a move (dx, dy, new_direction). Codes are handed out the first time a move
+    is seen and shared by every path, so there are only as many as the motion model has moves.
+    """
+
+    __slots__ = ("start", "codes")
+
+    # code -> (dx, dy, new_direction), and the other way around
+    _moves: List[Tuple[int, int, Direction]] = []
+    _codes = dict()
+
+    def __init__(self, start: Tuple, codes: bytes):
+        """
+        Args:
+            start (Tuple): (x, y, direction) of the first state of the path
+            codes (bytes): one move code per step
+        """
+        self.start = start
+        self.codes = codes
+
+    def __len__(self):
+        """Number of states in the path"""
+        return len(self.codes) + 1
+
+    @classmethod
+    def get_code(cls, move) -> int:
+        code = cls._codes.get(move)
+        if code is None:
+            code = len(cls._moves)
+            if code > 255:
+                raise Exception(f"Too many distinct moves to pack into uint8 codes: {move}")
+            cls._moves.append(move)
+            cls._codes[move] = code
+        return code
+
+    @classmethod
+    def encode(cls, path: List[Tuple]):
+        """Pack a list of (x, y, direction) states
+
+        Args:
+            path (List[Tuple]): states of the path, in order
+
+        Returns:
+            PackedPath: the packed path
+        """
+        codes = bytearray()
+        for (x, y, _), (next_x, next_y, next_direction) in zip(path, path[1:]):
+            codes.append(cls.get_code((next_x - x, next_y - y, next_direction)))
+        return cls(path[0], bytes(codes))
+
+    def decode(self, reverse=False) -> List[Tuple]:
+        """Unpack into a list of (x, y, direction) states
+
+        Args:
+            reverse (bool, optional): whether to return the path from its end to its start. Defaults to False.
+
+        Returns:
+            List[Tuple]: states of the path
+        """
+        x, y, direction = self.start
+        path = [self.start]
+        for code in self.codes:
+            dx, dy, direction = self._moves[code]
+            x += dx
+            y += dy
+            path.append((x, y, direction))
+
+        if reverse:
+            path.reverse()
+        return path
@@ -1,4 +1,5 @@
-from pathfinding.consts import WIDTH, HEIGHT, Direction, MOVE_DIRECTION
+from pathfinding.consts import WIDTH, HEIGHT, Direction, MOVE_DIRECTION, MAX_STRAIGHT, FUSED_TURNS, COMMAND_OVERHEAD
+from pathfinding.primitives import get_command
 
 
 def is_valid(center_x: int, center_y: int):
@@ -268,7 +269,7 @@ def is_valid(center_x: int, center_y: int):
 def command_generator(states, obstacles):
     """
     Generate movement + turn + SNAP commands for the robot.
-    Handles straight, 45° diagonals, and 90° arcs consistently with get_neighbors.
+    Handles straight, 45° diagonals, and 90° arcs, using the commands of the primitive library.
     """
 
     obstacles_dict = {ob['id']: ob for ob in obstacles}
@@ -294,57 +295,21 @@ def command_generator(states, obstacles):
         #     else:
         #         commands.append("BW10")
 
-        # === Case 1: Straight ===
-        if curr.direction == prev.direction:
-            # Get the canonical (dx, dy) for this direction
-            expected_dx, expected_dy, _ = MOVE_DIRECTION[int(curr.direction)]
-
-            if (dx, dy) == (expected_dx, expected_dy):
-                commands.append("FW10")
-            elif (dx, dy) == (-expected_dx, -expected_dy):
-                commands.append("BW10")
-            else:
-                raise Exception(
-                    f"Unexpected straight movement: dir={curr.direction}, "
-                    f"expected ({expected_dx},{expected_dy}) or opposite, got ({dx},{dy})"
-                )
-        # === Case 2: 45° Diagonal Turns ===
-        elif diff == 1:   # +45° clockwise
-            # forward if movement is in same general quadrant
-            expected_dx, expected_dy, _ = MOVE_DIRECTION[int(curr.direction)]
-            new_dx,new_dy = expected_dx * dx, expected_dy * dy
-            if new_dx > 0 or new_dy > 0:
-                commands.append("FR45")
-            else:
-                commands.append("BL45")
-        elif diff == 7:  # -45° counter-clockwise
-            expected_dx, expected_dy, _ = MOVE_DIRECTION[int(curr.direction)]
-            new_dx,new_dy = expected_dx * dx, expected_dy * dy
-            if new_dx > 0 or new_dy > 0:
-                commands.append("FL45")
-            else:
-                commands.append("BR45")
-
-        # === Case 3: 90° Arcs ===
-        elif diff == 2:  # clockwise (FR90 or BL90)
-            expected_dx, expected_dy, _ = MOVE_DIRECTION[int(curr.direction)]
-            new_dx,new_dy = expected_dx * dx, expected_dy * dy
-            if new_dx > 0 or new_dy > 0:
-                commands.append("FR90")
-            else:
-                commands.append("BL90")
-        elif diff == 6:  # counter-clockwise (FL90 or BR90)
-            expected_dx, expected_dy, _ = MOVE_DIRECTION[int(curr.direction)]
-            new_dx,new_dy = expected_dx * dx, expected_dy * dy
-            if new_dx > 0 or new_dy > 0:
-                commands.append("FL90")
-            else:
-                commands.append("BR90")
+        # === Cases 1-3: Straight, 45° diagonal turns and 90° arcs, as in the primitive library ===
+        command = get_command(old_dir, dx, dy, new_dir)
+        if command is not None:
+            commands.append(command)
 
         # === Case 4: 180° Turn ===
         elif diff == 4:
             commands.extend(["FR90", "FR90"])
 
+        elif curr.direction == prev.direction:
+            expected_dx, expected_dy, _ = MOVE_DIRECTION[int(curr.direction)]
+            raise Exception(
+                f"Unexpected straight movement: dir={curr.direction}, "
+                f"expected ({expected_dx},{expected_dy}) or opposite, got ({dx},{dy})"
+            )
         else:
             raise Exception(f"Unexpected turn diff: {diff} from {old_dir} -> {new_dir}")
 
@@ -381,12 +346,12 @@ def command_generator(states, obstacles):
     for i in range(1, len(commands)):
         if commands[i].startswith("FW") and compressed[-1].startswith("FW"):
             steps = int(compressed[-1][2:])
-            if steps != 180:
+            if steps + 10 <= MAX_STRAIGHT:
                 compressed[-1] = f"FW{steps + 10}"
                 continue
         elif commands[i].startswith("BW") and compressed[-1].startswith("BW"):
             steps = int(compressed[-1][2:])
-            if steps != 180:
+            if steps + 10 <= MAX_STRAIGHT:
                 compressed[-1] = f"BW{steps + 10}"
                 continue
         compressed.append(commands[i])
@@ -467,6 +432,11 @@ def time_generator(compressed_commands: list):
              or command.startswith("BR90") or command.startswith("BL90"):
             time.append(8)
 
+        # Turns fused by the STM take as long as their parts
+        elif command in FUSED_TURNS.values():
+            parts = next(parts for parts, fused in FUSED_TURNS.items() if fused == command)
+            time.append(sum(time_generator(list(parts))))
+
         # SNAP (picture taking)
         elif command.startswith("SNAP"):
             time.append(0)
@@ -480,3 +450,74 @@ def time_generator(compressed_commands: list):
             raise Exception(f"Unknown command in time_generator: {command}")
     
     return time
+
+
+def compact_commands(commands: list, ends: list = None):
+    """
+    Peephole pass over the commands of command_generator, to send the STM fewer commands.
+
+    Working back from each new command to the last one kept:
+    - FW/BW runs are merged up to MAX_STRAIGHT
+    - a FW followed by a BW (or the other way around) cancel out, fully or in part
+    - consecutive turns listed in FUSED_TURNS become the single command the STM has for them
+
+    Inputs
+    ------
+    commands: list of commands
+    ends: optional index, for each command, of the path state the robot is in after it
+
+    Returns
+    -------
+    compacted: list of commands
+    ends: index of the path state after each compacted command (None if no ends were given)
+    report: number of commands before and after, and the time saved in seconds
+    """
+    if ends is None:
+        kept = [[command, None] for command in commands]
+    else:
+        kept = [[command, end] for command, end in zip(commands, ends)]
+
+    compacted = []
+    for command, end in kept:
+        while compacted:
+            last, last_end = compacted[-1]
+            if last[:2] in ("FW", "BW") and command[:2] in ("FW", "BW"):
+                last_steps, steps = int(last[2:]), int(command[2:])
+                if last[:2] == command[:2]:
+                    if last_steps + steps > MAX_STRAIGHT:
+                        break
+                    compacted.pop()
+                    command = f"{command[:2]}{last_steps + steps}"
+                    continue
+
+                # Opposite directions: what is left is the longer move, shortened by the other one
+                compacted.pop()
+                if last_steps == steps:
+                    command = None
+                elif last_steps > steps:
+                    command = f"{last[:2]}{last_steps - steps}"
+                    # The robot stops where the first move was `steps` short of its end
+                    end = None if end is None else last_end - steps // 10
+                else:
+                    command = f"{command[:2]}{steps - last_steps}"
+                break
+
+            if (last, command) in FUSED_TURNS:
+                compacted.pop()
+                command = FUSED_TURNS[(last, command)]
+                continue
+            break
+
+        if command is not None:
+            compacted.append([command, end])
+
+    compacted_commands = [command for command, _ in compacted]
+    moves_before = sum(1 for command in commands if not command.startswith(("SNAP", "FIN")))
+    moves_after = sum(1 for command in compacted_commands if not command.startswith(("SNAP", "FIN")))
+    report = {
+        'before': len(commands),
+        'after': len(compacted_commands),
+        'time_saved': sum(time_generator(commands)) - sum(time_generator(compacted_commands)) +
+                      (moves_before - moves_after) * COMMAND_OVERHEAD,
+    }
+    return compacted_commands, None if ends is None else [end for _, end in compacted], report
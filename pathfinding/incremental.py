@@ -0,0 +1,272 @@
+import heapq
+from typing import Dict, List, Tuple
+from pathfinding.consts import Direction, EXPANDED_CELL
+from pathfinding.entities.Entity import CellState
+
+INF = float('inf')
+
+
+class StateGraph:
+    """Explicit graph over the (x, y, direction) states of a MazeSolver.
+
+    Successors and their costs come from MazeSolver.get_successors, so the graph follows
+    exactly the same motion model as the A* search. Predecessors are kept as well so that
+    the search trees can be repaired when an edge changes.
+    """
+
+    def __init__(self, maze_solver):
+        self.maze_solver = maze_solver
+        self.succ: Dict[Tuple, Dict[Tuple, float]] = dict()
+        self.pred: Dict[Tuple, Dict[Tuple, float]] = dict()
+
+        directions = list(Direction)[:8] if maze_solver.allow_45 else \
+            [Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST]
+        for x in range(1, maze_solver.grid.size_x - 1):
+            for y in range(1, maze_solver.grid.size_y - 1):
+                for direction in directions:
+                    self.add_state((x, y, direction))
+
+    def add_state(self, state):
+        """Add a state and its outgoing edges to the graph, if it is not there yet
+
+        Args:
+            state (Tuple): (x, y, direction)
+        """
+        if state in self.succ:
+            return
+        self.succ[state] = dict()
+        self.pred.setdefault(state, dict())
+        self.set_successors(state, self.get_successors(state))
+
+    def get_successors(self, state, primitives=None) -> Dict[Tuple, float]:
+        successors = dict()
+        for next_x, next_y, new_direction, move_cost in self.maze_solver.get_successors(*state, primitives):
+            next_state = (next_x, next_y, new_direction)
+            if move_cost < successors.get(next_state, INF):
+                successors[next_state] = move_cost
+        return successors
+
+    def set_successors(self, state, successors: Dict[Tuple, float]):
+        for next_state in self.succ[state]:
+            del self.pred[next_state][state]
+        self.succ[state] = successors
+        for next_state, move_cost in successors.items():
+            self.pred.setdefault(next_state, dict())[state] = move_cost
+
+    def update(self, positions: List[Tuple[int, int]]):
+        """Recompute the edges around the given positions after an obstacle was added, moved or removed there
+
+        Args:
+            positions (List[Tuple[int, int]]): (x, y) of the changed obstacles
+
+        Returns:
+            set: states whose incoming edges changed
+        """
+        # An edge depends on the obstacles around the cells its move checks, and the ends of a turn
+        # are at most `bigger_change` apart
+        reach = EXPANDED_CELL * 2
+        radius = self.maze_solver.get_turn_displacement()[0] + reach
+        states = {(x, y, direction) for ox, oy in positions
+                  for x in range(ox - radius, ox + radius + 1) for y in range(oy - radius, oy + radius + 1)
+                  for direction in list(Direction)[:8]}
+
+        changed = set()
+        for state in states & self.succ.keys():
+            x, y, direction = state
+            moves = [primitive for primitive in self.maze_solver.primitives[int(direction)]
+                     if any(abs(x + fx - ox) <= reach and abs(y + fy - oy) <= reach
+                            for fx, fy, _ in primitive.footprint for ox, oy in positions)]
+            if not moves:
+                continue
+
+            # Only those moves are checked again. The moves from a heading all end in different states
+            old_successors = self.succ[state]
+            new_successors = dict(old_successors)
+            for primitive in moves:
+                new_successors.pop((x + primitive.dx, y + primitive.dy, primitive.new_direction), None)
+            new_successors.update(self.get_successors(state, moves))
+            if new_successors == old_successors:
+                continue
+
+            for next_state in old_successors.keys() | new_successors.keys():
+                if old_successors.get(next_state) != new_successors.get(next_state):
+                    changed.add(next_state)
+            self.set_successors(state, new_successors)
+
+        return changed
+
+
+class SearchTree:
+    """Lifelong Planning A* (LPA*) tree rooted at a single source state.
+
+    There is no single goal: every view state is a target, so the heuristic is dropped and
+    the tree holds the exact cost from the source to every state. After the graph changes,
+    only the states whose cost is affected are expanded again, and only the paths through them
+    are traced again.
+    """
+
+    def __init__(self, graph: StateGraph, source):
+        self.graph = graph
+        self.source = source
+        self.g = dict()
+        self.rhs = {source: 0}
+        self.queue = [(0, source)]
+        # Paths traced by get_path, per target
+        self.paths = dict()
+        # States whose cost or incoming edges changed since the last repair
+        self.touched = set()
+
+        graph.add_state(source)
+        self.compute()
+        self.touched = set()
+
+    def get_cost(self, state):
+        return self.g.get(state, INF)
+
+    def update_state(self, state):
+        if state != self.source:
+            best = INF
+            for prev_state, move_cost in self.graph.pred.get(state, {}).items():
+                cost = self.g.get(prev_state, INF) + move_cost
+                if cost < best:
+                    best = cost
+            self.rhs[state] = best
+
+        g = self.g.get(state, INF)
+        rhs = self.rhs.get(state, INF)
+        if g != rhs:
+            heapq.heappush(self.queue, (min(g, rhs), state))
+
+    def compute(self):
+        """Expand inconsistent states until every state holds its exact cost"""
+        while self.queue:
+            key, state = heapq.heappop(self.queue)
+            g = self.g.get(state, INF)
+            rhs = self.rhs.get(state, INF)
+
+            # Stale entry, the state was already made consistent or got a new key
+            if g == rhs or key != min(g, rhs):
+                continue
+
+            self.touched.add(state)
+            if g > rhs:
+                # Cost went down: settle it and relax the successors
+                self.g[state] = rhs
+                for next_state, move_cost in self.graph.succ[state].items():
+                    cost = rhs + move_cost
+                    if cost < self.rhs.get(next_state, INF):
+                        self.rhs[next_state] = cost
+                        heapq.heappush(self.queue, (min(self.g.get(next_state, INF), cost), next_state))
+            else:
+                # Cost went up: invalidate it and let the state and the successors whose cost came
+                # through it find new parents
+                self.g[state] = INF
+                self.update_state(state)
+                for next_state, move_cost in self.graph.succ[state].items():
+                    if self.rhs.get(next_state, INF) == g + move_cost:
+                        self.update_state(next_state)
+
+    def repair(self, changed_states):
+        """Fix the tree after the incoming edges of `changed_states` changed"""
+        self.touched = set(changed_states)
+        for state in changed_states:
+            self.update_state(state)
+        self.compute()
+
+        # A path whose edges and costs are all unchanged is still a cheapest one
+        self.paths = {target: path for target, path in self.paths.items() if self.touched.isdisjoint(path)}
+        self.touched = set()
+
+    def get_path(self, target) -> List[Tuple]:
+        """Get the path from the source to the target by following the cheapest predecessors back
+
+        Returns:
+            List[Tuple]: (x, y, direction) states from source to target
+        """
+        if target in self.paths:
+            return self.paths[target]
+
+        path = [target]
+        cursor = target
+        while cursor != self.source:
+            cost = self.g[cursor]
+            for prev_state, move_cost in self.graph.pred[cursor].items():
+                if abs(self.g.get(prev_state, INF) + move_cost - cost) < 1e-9:
+                    cursor = prev_state
+                    break
+            path.append(cursor)
+        self.paths[target] = path[::-1]
+        return self.paths[target]
+
+
+class IncrementalPlanner:
+    """Keeps one LPA* tree per source state of a MazeSolver between solves.
+
+    When an obstacle is added, moved or removed, the edges around it are recomputed and each
+    tree only repairs the region whose costs changed, instead of running every search again.
+    Trees are repaired when they are next used, so those of view states that are gone are not.
+    """
+
+    def __init__(self, maze_solver):
+        self.maze_solver = maze_solver
+        self.graph = None
+        self.trees: Dict[Tuple, SearchTree] = dict()
+        # States whose incoming edges changed since each tree was last repaired
+        self.pending: Dict[Tuple, set] = dict()
+        # Sources used in the current solve, see end_solve
+        self.used_sources = set()
+
+    def get_tree(self, state: CellState) -> SearchTree:
+        if self.graph is None:
+            self.graph = StateGraph(self.maze_solver)
+
+        source = (state.x, state.y, state.direction)
+        self.used_sources.add(source)
+        if source not in self.trees:
+            self.trees[source] = SearchTree(self.graph, source)
+        elif self.pending.get(source):
+            self.trees[source].repair(self.pending.pop(source))
+        return self.trees[source]
+
+    def path_cost_generator(self, states: List[CellState]):
+        """Fill the cost and path tables of the solver for every pair of the input states
+
+        Args:
+            states (List[CellState]): cell states to visit
+        """
+        for i in range(len(states) - 1):
+            tree = None
+            for j in range(i + 1, len(states)):
+                start, end = states[i], states[j]
+                if self.maze_solver.has_path(start, end):
+                    continue
+
+                if tree is None:
+                    tree = self.get_tree(start)
+                target = (end.x, end.y, end.direction)
+                cost = tree.get_cost(target)
+                if cost == INF:
+                    continue
+
+                self.maze_solver.record_path(start, end, cost, tree.get_path(target))
+
+    def repair(self, positions: List[Tuple[int, int]]):
+        """Update the graph after obstacles changed at the given positions, and mark the kept trees for repair
+
+        Args:
+            positions (List[Tuple[int, int]]): (x, y) of the obstacles before and after the change
+        """
+        if self.graph is None:
+            return
+
+        changed_states = self.graph.update(positions)
+        if not changed_states:
+            return
+        for source in self.trees:
+            self.pending.setdefault(source, set()).update(changed_states)
+
+    def end_solve(self):
+        """Drop the trees whose source was not used in the solve that just ended, so they are not repaired needlessly"""
+        self.trees = {source: tree for source, tree in self.trees.items() if source in self.used_sources}
+        self.pending = {source: states for source, states in self.pending.items() if source in self.trees}
+        self.used_sources = set()
@@ -1,41 +1,208 @@
 from pathfinding.algo import MazeSolver
 import time
-from pathfinding.helper import command_generator
+from pathfinding.helper import command_generator, compact_commands, time_generator
+from pathfinding.plan_cache import plan_key
+from pathfinding.consts import COMPACT_COMMANDS
 
-def pathfinding(obstacles, robot_x = 1, robot_y = 1, robot_direction = 0, big_turn = None, retrying = False, mode = 0):
+def create_maze_solver(obstacles, robot_x = 1, robot_y = 1, robot_direction = 0, big_turn = None, engine = "astar", edge_store = None, robustness = None):
 
     # Initialize MazeSolver object with robot size of 20x20, bottom left corner of robot at (1,1), facing north, and whether to use a big turn or not.
-    maze_solver = MazeSolver(20, 20, robot_x, robot_y, robot_direction, big_turn=big_turn, allow_45=False)
+    maze_solver = MazeSolver(20, 20, robot_x, robot_y, robot_direction, big_turn=big_turn, allow_45=False,
+                             engine=engine, edge_store=edge_store, robustness=robustness)
 
     # Add each obstacle into the MazeSolver. Each obstacle is defined by its x,y positions, its direction, and its id
     for ob in obstacles:
         maze_solver.add_obstacle(ob['x'], ob['y'], ob['d'], ob['id'])
 
+    return maze_solver
+
+def update_obstacles(maze_solver, obstacles):
+    """
+    Bring the obstacles of an existing solver in line with the given list, one add/move/remove at a time.
+    With the "incremental" engine, each change only repairs the searches it affects.
+
+    Inputs
+    ------
+    maze_solver: MazeSolver to update
+    obstacles: list of obstacles, each obstacle is a dictionary with keys "x", "y", "d", and "id"
+    """
+    current = {ob.obstacle_id: ob for ob in maze_solver.grid.obstacles}
+    new_ids = {ob['id'] for ob in obstacles}
+
+    for obstacle_id in current:
+        if obstacle_id not in new_ids:
+            maze_solver.remove_obstacle(obstacle_id)
+
+    for ob in obstacles:
+        if ob['id'] not in current:
+            maze_solver.add_obstacle(ob['x'], ob['y'], ob['d'], ob['id'])
+            continue
+        old = current[ob['id']]
+        if (old.x, old.y, old.direction) != (ob['x'], ob['y'], ob['d']):
+            maze_solver.move_obstacle(ob['id'], ob['x'], ob['y'], ob['d'])
+
+def pathfinding(obstacles, robot_x = 1, robot_y = 1, robot_direction = 0, big_turn = None, retrying = False, mode = 0, maze_solver = None, plan_cache = None, alternatives = 0):
+
+    # A solver can be passed in (and kept by the caller) so that later replans can reuse its search results
+    if maze_solver is None:
+        maze_solver = create_maze_solver(obstacles, robot_x, robot_y, robot_direction, big_turn)
+
+    # Layouts are often entered again during practice runs, so look for an earlier result first
+    key = None
+    if plan_cache is not None:
+        start_state = maze_solver.robot.get_start_state()
+        key = plan_key(obstacles, start_state.x, start_state.y, start_state.direction,
+                       maze_solver.big_turn, maze_solver.allow_45, retrying, maze_solver.robustness is not None)
+        start = time.time()
+        cached = plan_cache.get(key)
+        # A plan cached without its alternatives has to be solved again when they are asked for
+        if cached is not None and (alternatives == 0 or 'alternatives' in cached):
+            print(f"Time taken to load cached path: {time.time() - start}s")
+            return cached
+
     start = time.time()
-    # Get shortest path
-    optimal_path, distance = maze_solver.get_optimal_order_dp(retrying=retrying)
+    # Get shortest path, and the next best ones from the same tables if asked for
+    optimal_path, distance = maze_solver.get_optimal_order_dp(retrying=retrying, k=alternatives + 1)
     print(f"Time taken to find shortest path using A* search: {time.time() - start}s")
     print(f"Distance to travel: {distance} units")
-    
+
+    results = get_path_results(optimal_path, distance, obstacles)
+    if alternatives > 0:
+        results['alternatives'] = [get_path_results(path, cost, obstacles) for path, cost in maze_solver.alternatives]
+    if plan_cache is not None:
+        plan_cache.put(key, results)
+    return results
+
+def pathfinding_streaming(obstacles, on_first, retrying = False, maze_solver = None, plan_cache = None, alternatives = 0):
+    """
+    Like pathfinding(), but hands the path to the first obstacle to `on_first` as soon as it is chosen,
+    so the robot can start while the rest of the tour is solved. The first obstacle is only committed to
+    when the tour through it is within STREAM_EPSILON of the best one, see MazeSolver.get_first_target.
+    Otherwise the whole tour is solved first.
+
+    Inputs
+    ------
+    obstacles: list of obstacles, each obstacle is a dictionary with keys "x", "y", "d", and "id"
+    on_first: called with the results (same keys as pathfinding()) of the path to the first obstacle.
+              Not called when the whole plan is ready at once, e.g. from the plan cache.
+
+    alternatives: number of next best plans to add to the results. They share the first leg, which
+                  may already be under way.
+
+    Returns
+    -------
+    Same dictionary as pathfinding(), for the whole run. Its first leg is the one given to `on_first`.
+    """
+    if maze_solver is None:
+        maze_solver = create_maze_solver(obstacles)
+
+    # A cached plan is ready to be sent whole. Streamed plans are kept apart from the optimal ones
+    # that pathfinding() caches, as they may cost up to STREAM_EPSILON more
+    if plan_cache is not None:
+        start_state = maze_solver.robot.get_start_state()
+        keys = [plan_key(obstacles, start_state.x, start_state.y, start_state.direction, maze_solver.big_turn,
+                         maze_solver.allow_45, retrying, maze_solver.robustness is not None, streamed)
+                for streamed in (False, True)]
+        for key in keys:
+            cached = plan_cache.get(key)
+            if cached is not None and (alternatives == 0 or 'alternatives' in cached):
+                return cached
+
+    obstacle_ids, _ = maze_solver.get_view_positions(retrying)
+    if len(obstacle_ids) < 2:
+        return pathfinding(obstacles, retrying=retrying, maze_solver=maze_solver, plan_cache=plan_cache,
+                           alternatives=alternatives)
+
+    start = time.time()
+    first_path, first_distance, _, first_id = maze_solver.get_first_target(retrying)
+    if not first_path:
+        return pathfinding(obstacles, retrying=retrying, maze_solver=maze_solver, plan_cache=plan_cache,
+                           alternatives=alternatives)
+    print(f"Time taken to choose the first obstacle: {time.time() - start}s")
+    on_first(get_path_results(first_path, first_distance, obstacles))
+
+    # The rest of the tour starts where the first leg ends
+    last = first_path[-1]
+    rest_path, rest_distance = maze_solver.replan(last.x, last.y, last.direction,
+                                                  [ob_id for ob_id in obstacle_ids if ob_id != first_id],
+                                                  retrying=retrying, k=alternatives + 1)
+    distance = first_distance + rest_distance
+    print(f"Time taken to find the rest of the path: {time.time() - start}s")
+    print(f"Distance to travel: {distance} units")
+
+    results = get_path_results(first_path + rest_path[1:], distance, obstacles)
+    if alternatives > 0:
+        results['alternatives'] = [get_path_results(first_path + path[1:], first_distance + cost, obstacles)
+                                   for path, cost in maze_solver.alternatives]
+    if plan_cache is not None:
+        plan_cache.put(keys[1], results)
+    return results
+
+def replan(maze_solver, obstacles, current_pose, remaining_obstacle_ids, retrying = False, alternatives = 0):
+    """
+    Plan the rest of the run from the robot's current pose, reusing the searches of the previous solve
+
+    Inputs
+    ------
+    maze_solver: MazeSolver used for the previous solve (see create_maze_solver)
+    obstacles: list of obstacles, each obstacle is a dictionary with keys "x", "y", "d", and "id"
+    current_pose: dictionary with keys "x", "y" and "d"
+    remaining_obstacle_ids: ids of the obstacles still to be visited
+    alternatives: number of next best plans to add to the results, under "alternatives"
+
+    Returns
+    -------
+    Same dictionary as pathfinding()
+    """
+    start = time.time()
+    optimal_path, distance = maze_solver.replan(current_pose['x'], current_pose['y'], current_pose['d'],
+                                                [int(ob_id) for ob_id in remaining_obstacle_ids], retrying=retrying,
+                                                k=alternatives + 1)
+    print(f"Time taken to replan: {time.time() - start}s")
+    print(f"Distance to travel: {distance} units")
+
+    results = get_path_results(optimal_path, distance, obstacles)
+    if alternatives > 0:
+        results['alternatives'] = [get_path_results(path, cost, obstacles) for path, cost in maze_solver.alternatives]
+    return results
+
+def get_path_results(optimal_path, distance, obstacles):
+
     # Based on the shortest path, generate commands for the robot
     commands,time_list = command_generator(optimal_path, obstacles)
 
-    # Get the starting location and add it to path_results
-    path_results = [optimal_path[0].get_dict()]
-    # Process each command individually and append the location the robot should be after executing that command to path_results
+    # Index of the state the robot should be in after executing each command
+    ends = []
     i = 0
     for command in commands:
         if command.startswith("SNAP"):
-            continue
-        if command.startswith("FIN"):
-            continue
+            pass
+        elif command.startswith("FIN"):
+            pass
         elif command.startswith("FW") or command.startswith("FS"):
             i += int(command[2:]) // 10
         elif command.startswith("BW") or command.startswith("BS"):
             i += int(command[2:]) // 10
         else:
             i += 1
-        path_results.append(optimal_path[i].get_dict())
+        ends.append(i)
+
+    # Every command the STM runs costs a ramp up and down, so send as few as possible
+    if COMPACT_COMMANDS:
+        commands, ends, report = compact_commands(commands, ends)
+        if report['after'] < report['before']:
+            time_list = time_generator(commands)
+            print(f"Compacted commands: {report['before']} -> {report['after']}, saving {report['time_saved']}s")
+
+    # Get the starting location and add it to path_results
+    path_results = [optimal_path[0].get_dict()]
+    # Append the location the robot should be after executing each command to path_results
+    for command, end in zip(commands, ends):
+        if command.startswith("SNAP"):
+            continue
+        if command.startswith("FIN"):
+            continue
+        path_results.append(optimal_path[end].get_dict())
     return {
             'distance': distance,
             'path': path_results,
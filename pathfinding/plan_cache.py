@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from pathfinding.consts import PLANNER_VERSION
+
+
+def plan_key(obstacles, robot_x, robot_y, robot_direction, big_turn, allow_45, retrying, robust=False, streamed=False):
+    """
+    Canonical hash of everything that decides the result of pathfinding()
+
+    Inputs
+    ------
+    obstacles: list of obstacles, each obstacle is a dictionary with keys "x", "y", "d", and "id"
+    robot_x, robot_y, robot_direction: start pose of the robot
+    big_turn, allow_45, retrying: solver options
+    robust: whether near-ties are broken by robustness
+    streamed: whether the first leg was committed before the whole tour was solved, see pathfinding_streaming()
+
+    Returns
+    -------
+    key: hex digest, the same for any ordering of the obstacles
+    """
+    layout = sorted((int(ob['id']), float(ob['x']), float(ob['y']), int(ob['d'])) for ob in obstacles)
+    canonical = {
+        'obstacles': layout,
+        'start': [float(robot_x), float(robot_y), int(robot_direction)],
+        'big_turn': int(big_turn or 0),
+        'allow_45': bool(allow_45),
+        'retrying': bool(retrying),
+        'robust': bool(robust),
+        'streamed': bool(streamed),
+        'version': PLANNER_VERSION,
+    }
+    return hashlib.sha1(json.dumps(canonical, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class PlanCache:
+    """
+    On-disk cache of pathfinding() results, one compact JSON file per plan.
+
+    The least recently used plans are evicted once the store grows past `max_bytes`.
+    An index of the files is kept in memory so a hit is a single small file read.
+    """
+
+    def __init__(self, directory="plan_cache", max_bytes=16 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # key -> size of its file, from least to most recently used
+        self.index = OrderedDict()
+
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for filename in os.listdir(directory):
+            if not filename.endswith(".json"):
+                continue
+            stat = os.stat(os.path.join(directory, filename))
+            entries.append((stat.st_mtime, filename[:-len(".json")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.index[key] = size
+            self.total_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached result for the key, or None on a miss"""
+        if key not in self.index:
+            return None
+
+        try:
+            with open(self._path(key), "rb") as f:
+                result = json.loads(f.read())
+        except (OSError, ValueError):
+            # Removed or corrupted behind our back
+            self._remove(key)
+            return None
+
+        self.index.move_to_end(key)
+        try:
+            # mtime is the recency used to rebuild the index on the next start
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, result):
+        """Store a result, evicting the least recently used plans if the store is full"""
+        data = json.dumps(result, separators=(',', ':')).encode('utf-8')
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+        if key in self.index:
+            self.total_bytes -= self.index.pop(key)
+        self.index[key] = len(data)
+        self.total_bytes += len(data)
+
+        while self.total_bytes > self.max_bytes and len(self.index) > 1:
+            oldest_key = next(iter(self.index))
+            self._remove(oldest_key)
+
+    def _remove(self, key):
+        self.total_bytes -= self.index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
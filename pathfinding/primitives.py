@@ -0,0 +1,151 @@
+import math
+from typing import Dict, List, NamedTuple, Tuple
+from pathfinding.consts import Direction, MOVE_DIRECTION, TURN_FACTOR, TURN_RADIUS
+
+turn_wrt_big_turns = [[3 * TURN_RADIUS, TURN_RADIUS],
+                      [4 * TURN_RADIUS, 2 * TURN_RADIUS]]
+
+# Kinds of clearance check of a footprint cell, see Grid.reachable
+STRAIGHT, TURN, PRE_TURN = range(3)
+
+# 90 degree arcs the planner may take from each heading. There are no arcs from NORTH to WEST.
+PLANNER_ARCS = {
+    Direction.NORTH: ("FR90", "BL90"),
+    Direction.EAST: ("FL90", "BR90", "FR90", "BL90"),
+    Direction.SOUTH: ("FL90", "BR90", "FR90", "BL90"),
+    Direction.WEST: ("FL90", "BR90", "FR90", "BL90"),
+}
+
+# Every command a move between two states can be turned into
+COMMANDS = ("FW10", "BW10", "FR90", "FL90", "BR90", "BL90", "FR45", "FL45", "BR45", "BL45")
+
+ARC_PENALTY = 10 # added to the cost of a 90 degree arc
+DIAGONAL_PENALTY = 5 # added to the cost of a 45 degree turn, so that diagonals are not overused
+
+
+class Primitive(NamedTuple):
+    """One move of the robot, relative to where it starts"""
+    dx: int
+    dy: int
+    new_direction: Direction
+    base_cost: float # rotation and distance
+    penalty: int # added to the safe cost of the end cell
+    command: str # command from command_generator
+    footprint: Tuple[Tuple[int, int, int], ...] # (dx, dy, kind of check) of the cells that must be clear
+
+
+def get_displacement(command: str, direction, big_turn=0):
+    """Where a command takes the robot from a given heading
+
+    Args:
+        command (str): FW10/BW10 or a turn, e.g. FR90 or BL45
+        direction (Direction): heading of the robot
+        big_turn (int, optional): 0 for 3-1 turns, 1 for 4-2 turns. Defaults to 0.
+
+    Returns:
+        Tuple[int, int, Direction]: dx, dy and the new heading
+    """
+    bigger_change, smaller_change = turn_wrt_big_turns[int(big_turn or 0)]
+    direction = int(direction)
+
+    def vector(d):
+        dx, dy, _ = MOVE_DIRECTION[d % 8]
+        return dx, dy
+
+    forward, right, left = vector(direction), vector(direction + 2), vector(direction - 2)
+    # command -> (coefficient of forward, side vector, coefficient of side, change of heading)
+    moves = {
+        "FW10": (1, right, 0, 0),
+        "BW10": (-1, right, 0, 0),
+        "FR90": (smaller_change, right, bigger_change, 2),
+        "FL90": (smaller_change, left, bigger_change, -2),
+        "BR90": (-bigger_change, left, -smaller_change, -2),
+        "BL90": (-bigger_change, right, -smaller_change, 2),
+    }
+    if command in moves:
+        along, side, across, turn = moves[command]
+        dx, dy = along * forward[0] + across * side[0], along * forward[1] + across * side[1]
+        return dx, dy, Direction((direction + turn) % 8)
+
+    # 45 degree turns move one cell along the new heading (forward) or back along it
+    diagonals = {"FR45": (1, 1), "FL45": (1, -1), "BR45": (-1, -1), "BL45": (-1, 1)}
+    if command in diagonals:
+        sign, turn = diagonals[command]
+        new_direction = (direction + turn) % 8
+        dx, dy = vector(new_direction)
+        return sign * dx, sign * dy, Direction(new_direction)
+
+    raise Exception(f"Unknown command for displacement: {command}")
+
+
+def get_penalty(command: str) -> int:
+    """Penalty of a command on top of the safe cost of where it ends"""
+    if command.endswith("90"):
+        return ARC_PENALTY
+    if command.endswith("45"):
+        return DIAGONAL_PENALTY
+    return 0
+
+
+def make_primitive(command: str, direction, big_turn=0):
+    dx, dy, new_direction = get_displacement(command, direction, big_turn)
+    penalty = get_penalty(command)
+    base_cost = Direction.rotation_cost(new_direction, direction) * TURN_FACTOR + math.sqrt(dx ** 2 + dy ** 2)
+    if new_direction == direction:
+        footprint = ((dx, dy, STRAIGHT),)
+    else:
+        footprint = ((dx, dy, TURN), (0, 0, PRE_TURN))
+    return Primitive(dx, dy, new_direction, base_cost, penalty, command, footprint)
+
+
+# (big_turn, allow_45) -> heading -> primitives
+_libraries = dict()
+
+
+def get_primitives(big_turn=0, allow_45=True) -> Dict[int, List[Primitive]]:
+    """Get the moves the planner may take from each heading, built once per configuration
+
+    Args:
+        big_turn (int, optional): 0 for 3-1 turns, 1 for 4-2 turns. Defaults to 0.
+        allow_45 (bool, optional): whether 45 degree turns and diagonal headings are used. Defaults to True.
+
+    Returns:
+        Dict[int, List[Primitive]]: primitives of each heading, in the order the searches try them
+    """
+    config = (int(big_turn or 0), bool(allow_45))
+    if config in _libraries:
+        return _libraries[config]
+
+    library = dict()
+    for direction in range(8):
+        primitives = [make_primitive("FW10", direction, big_turn), make_primitive("BW10", direction, big_turn)]
+        if allow_45:
+            for _, _, md in MOVE_DIRECTION:
+                diff = (int(md) - direction) % 8
+                if diff in [1, 7]:
+                    primitives.append(make_primitive("FR45" if diff == 1 else "FL45", direction, big_turn))
+        for command in PLANNER_ARCS.get(Direction(direction), ()):
+            primitives.append(make_primitive(command, direction, big_turn))
+        library[direction] = primitives
+
+    _libraries[config] = library
+    return library
+
+
+# (direction, dx, dy, new_direction) -> command, for both turn models
+_commands = dict()
+
+
+def get_command(direction, dx, dy, new_direction):
+    """Get the command of a move between two states, None if no command makes it
+
+    Paths recorded in reverse hold moves the planner does not take forward, e.g. BR90 from NORTH,
+    so every command is looked up, not only the planner's primitives.
+    """
+    if not _commands:
+        for big_turn in range(len(turn_wrt_big_turns)):
+            for direction_from in range(8):
+                for command in COMMANDS:
+                    move_dx, move_dy, direction_to = get_displacement(command, direction_from, big_turn)
+                    _commands[(direction_from, move_dx, move_dy, int(direction_to))] = command
+    return _commands.get((int(direction), dx, dy, int(new_direction)))
@@ -0,0 +1,126 @@
+from typing import List
+import numpy as np
+from pathfinding.consts import Direction
+from pathfinding.entities.Entity import Grid
+from pathfinding.simulator import Simulator, parse_commands, NOP, FW, BW, TURNS_90
+
+
+class RobustnessEvaluator:
+    """
+    Monte Carlo replay of a command list under odometry noise.
+
+    Each particle follows the nominal moves of the Simulator, rotated by its own heading error and
+    scaled by a sampled distance error, with fresh noise drawn for every unit move. All particles
+    are advanced together as NumPy arrays. A particle collides when the cell it rounds to fails the
+    same clearance checks as the planner, and a SNAP succeeds when the obstacle is in the camera's
+    view and its face is seen at a shallow enough angle.
+    """
+
+    def __init__(self, particles=200, distance_noise=0.02, heading_noise=0.1, turn_noise=1.0,
+                 half_fov=25.0, max_view_distance=6.0, max_view_angle=35.0, seed=0):
+        """
+        Args:
+            particles (int, optional): number of particles. Defaults to 200.
+            distance_noise (float, optional): relative standard deviation of each move's length. Defaults to 0.02.
+            heading_noise (float, optional): heading drift in degrees per straight 10cm. Defaults to 0.1.
+            turn_noise (float, optional): heading error in degrees per 90 degree turn. Defaults to 1.0.
+            half_fov (float, optional): half the camera's horizontal field of view, in degrees. Defaults to 25.0.
+            max_view_distance (float, optional): furthest a symbol can be read from, in cells. Defaults to 6.0.
+            max_view_angle (float, optional): largest angle between the robot and the face of the obstacle. Defaults to 35.0.
+            seed (int, optional): seed of the noise, so the same plan always gets the same score. Defaults to 0.
+        """
+        self.particles = particles
+        self.distance_noise = distance_noise
+        self.heading_noise = np.radians(heading_noise)
+        self.turn_noise = np.radians(turn_noise)
+        self.half_fov = np.radians(half_fov)
+        self.max_view_distance = max_view_distance
+        self.max_view_angle = np.radians(max_view_angle)
+        self.seed = seed
+
+    def evaluate(self, simulator: Simulator, commands: List[str], start=(1, 1, Direction.NORTH)):
+        """Replay a command list across all particles
+
+        Args:
+            simulator (Simulator): simulator of the arena the plan was made for
+            commands (List[str]): commands from command_generator
+            start (Tuple, optional): (x, y, direction) start pose. Defaults to (1, 1, NORTH).
+
+        Returns:
+            dict: collision probability, SNAP success probability per obstacle id, and a score -
+                  the mean SNAP success probability, scaled down by the collision probability
+        """
+        rng = np.random.default_rng(self.seed)
+        n = self.particles
+        size_x, size_y = simulator.grid.size_x, simulator.grid.size_y
+
+        x = np.full(n, float(start[0]))
+        y = np.full(n, float(start[1]))
+        error = np.zeros(n) # heading error, radians, clockwise
+        direction = int(start[2]) # nominal heading, shared by every particle
+        collided = np.zeros(n, dtype=bool)
+        snaps = dict()
+
+        for code, _, obstacle_id, _ in parse_commands(commands):
+            if code == NOP:
+                if obstacle_id >= 0:
+                    snaps[obstacle_id] = self.get_snap_success(simulator, obstacle_id, x, y, direction, error) & ~collided
+                continue
+
+            # Nominal move, rotated by each particle's heading error and stretched by its distance error
+            dx, dy = simulator.move_dx[code, direction], simulator.move_dy[code, direction]
+            scale = 1 + rng.normal(0, self.distance_noise, n)
+            cos, sin = np.cos(error), np.sin(error)
+            new_x = x + scale * (dx * cos + dy * sin)
+            new_y = y + scale * (dy * cos - dx * sin)
+
+            cell_x, cell_y = np.rint(new_x).astype(np.int64), np.rint(new_y).astype(np.int64)
+            inside = (cell_x >= 0) & (cell_x < size_x) & (cell_y >= 0) & (cell_y < size_y)
+            cell_x, cell_y = np.clip(cell_x, 0, size_x - 1), np.clip(cell_y, 0, size_y - 1)
+            if code in (FW, BW):
+                ok = simulator.clear[cell_x, cell_y]
+                error = error + rng.normal(0, self.heading_noise, n)
+            else:
+                start_x = np.clip(np.rint(x).astype(np.int64), 0, size_x - 1)
+                start_y = np.clip(np.rint(y).astype(np.int64), 0, size_y - 1)
+                ok = simulator.turn_clear[cell_x, cell_y] & simulator.pre_turn_clear[start_x, start_y]
+                error = error + rng.normal(0, self.turn_noise if code in TURNS_90 else self.turn_noise / 2, n)
+
+            collided |= ~(ok & inside)
+            x, y = new_x, new_y
+            direction = int((direction + simulator.move_turn[code, direction]) % 8)
+
+        snap_success = {obstacle_id: float(success.mean()) for obstacle_id, success in snaps.items()}
+        collision = float(collided.mean())
+        return {
+            'collision': collision,
+            'snaps': snap_success,
+            'score': (float(np.mean(list(snap_success.values()))) if snap_success else 1.0) * (1 - collision),
+        }
+
+    def get_snap_success(self, simulator: Simulator, obstacle_id, x, y, direction, error):
+        """Whether each particle sees the obstacle's symbol from where it stands"""
+        ob = simulator.obstacles.get(obstacle_id)
+        if ob is None:
+            return np.zeros(len(x), dtype=bool)
+
+        # Headings as clockwise angles from north, so the unit vector is (sin, cos)
+        heading = direction * np.pi / 4 + error
+        rel_x, rel_y = ob.x - x, ob.y - y
+        distance = np.hypot(rel_x, rel_y)
+        bearing = np.arctan2(rel_x, rel_y) - heading
+        bearing = (bearing + np.pi) % (2 * np.pi) - np.pi
+
+        # The robot should look against the direction the face points to
+        view_angle = heading - (int(ob.direction) + 4) * np.pi / 4
+        view_angle = (view_angle + np.pi) % (2 * np.pi) - np.pi
+
+        return (np.abs(bearing) <= self.half_fov) & (distance <= self.max_view_distance) & \
+            (np.abs(view_angle) <= self.max_view_angle)
+
+    def evaluate_batch(self, grid: Grid, big_turn, plans: List[List[str]], starts=None):
+        """Evaluate several plans for the same arena, see evaluate"""
+        simulator = Simulator(grid, big_turn=big_turn)
+        if starts is None:
+            starts = [(1, 1, Direction.NORTH)] * len(plans)
+        return [self.evaluate(simulator, commands, start) for commands, start in zip(plans, starts)]
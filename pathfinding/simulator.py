@@ -0,0 +1,267 @@
+from functools import lru_cache
+from itertools import chain
+from typing import List
+import numpy as np
+from pathfinding.consts import Direction, MOVE_DIRECTION, FUSED_TURNS
+from pathfinding.entities.Entity import Grid
+from pathfinding.primitives import get_displacement
+
+# Unit moves the commands are expanded into. SNAP and FIN do not move the robot.
+NOP, FW, BW, FR90, FL90, BR90, BL90, FR45, FL45, BR45, BL45 = range(11)
+MOVE_CODES = {
+    "FW": FW, "BW": BW,
+    "FR90": FR90, "FL90": FL90, "BR90": BR90, "BL90": BL90,
+    "FR45": FR45, "FL45": FL45, "BR45": BR45, "BL45": BL45,
+}
+TURNS_90 = (FR90, FL90, BR90, BL90)
+TURNS_45 = (FR45, FL45, BR45, BL45)
+
+# Seconds per unit move, same as time_generator
+MOVE_TIME = np.zeros(len(MOVE_CODES) + 1)
+MOVE_TIME[[FW, BW]] = 3
+MOVE_TIME[list(TURNS_90)] = 8
+MOVE_TIME[list(TURNS_45)] = 4
+
+DIRECTIONS = list(Direction)
+# Unit vector of each heading
+HEADING_VECTORS = np.array([(dx, dy) for dx, dy, _ in MOVE_DIRECTION], dtype=np.int64)
+
+
+@lru_cache(maxsize=None)
+def parse_command(command: str):
+    """Expand one command into unit moves, see parse_commands
+
+    Returns
+    -------
+    codes: tuple of move codes
+    obstacle_id: snap obstacle id, -1 if the command is not a SNAP
+    hint: snap hint or None
+    """
+    if command.startswith("SNAP"):
+        obstacle_id, _, hint = command[4:].partition("_")
+        return (NOP,), int(obstacle_id), hint or None
+    if command.startswith("FIN"):
+        return (NOP,), -1, None
+    if command[:2] in ("FW", "BW"):
+        return (MOVE_CODES[command[:2]],) * (int(command[2:]) // 10), -1, None
+    if command in MOVE_CODES:
+        return (MOVE_CODES[command],), -1, None
+    if command in FUSED_TURNS.values():
+        parts = next(parts for parts, fused in FUSED_TURNS.items() if fused == command)
+        return tuple(MOVE_CODES[part] for part in parts), -1, None
+    raise Exception(f"Unknown command in simulator: {command}")
+
+
+def parse_commands(commands: List[str]):
+    """Expand a command list into unit moves
+
+    Inputs
+    ------
+    commands: commands from command_generator, e.g. ["FW30", "FR90", "SNAP1_C", "FIN"]
+
+    Returns
+    -------
+    moves: list of (move code, index of the command it came from, snap obstacle id or -1, snap hint or None)
+    """
+    moves = []
+    for i, command in enumerate(commands):
+        codes, obstacle_id, hint = parse_command(command)
+        moves.extend((code, i, obstacle_id, hint) for code in codes)
+        if command.startswith("FIN"):
+            break
+    return moves
+
+
+class Simulator:
+    """
+    Offline kinematic simulator for the command lists sent to the robot.
+
+    Poses are integrated cell by cell with the displacements of the primitive library, and every
+    pose is checked against clearance maps built from Grid.reachable, the same checks the planner
+    uses. Plans are run as a batch: one row of NumPy arrays per plan, and every unit move of every
+    plan is stepped at once, as running sums of the turns and displacements.
+    """
+
+    def __init__(self, grid: Grid, big_turn=0):
+        self.grid = grid
+        self.obstacles = {ob.obstacle_id: ob for ob in grid.obstacles}
+
+        # Clearance maps: straight moves, the end of a turn and the start of a turn
+        self.clear = np.zeros((grid.size_x, grid.size_y), dtype=bool)
+        self.turn_clear = np.zeros((grid.size_x, grid.size_y), dtype=bool)
+        self.pre_turn_clear = np.zeros((grid.size_x, grid.size_y), dtype=bool)
+        for x in range(grid.size_x):
+            for y in range(grid.size_y):
+                self.clear[x, y] = grid.reachable(x, y)
+                self.turn_clear[x, y] = grid.reachable(x, y, turn=True)
+                self.pre_turn_clear[x, y] = grid.reachable(x, y, preTurn=True)
+
+        # (move code, heading) -> displacement and new heading
+        self.move_dx = np.zeros((len(MOVE_TIME), 8), dtype=np.int64)
+        self.move_dy = np.zeros((len(MOVE_TIME), 8), dtype=np.int64)
+        self.move_turn = np.zeros((len(MOVE_TIME), 8), dtype=np.int64)
+        for command, code in MOVE_CODES.items():
+            for heading in range(8):
+                dx, dy, new_heading = get_displacement(command + "10" if code in (FW, BW) else command, heading, big_turn)
+                self.move_dx[code, heading], self.move_dy[code, heading] = dx, dy
+                self.move_turn[code, heading] = (int(new_heading) - heading + 4) % 8 - 4
+        # Every move turns the robot by the same amount from any heading, so headings are a running sum
+        assert (self.move_turn == self.move_turn[:, :1]).all()
+        self.code_turn = self.move_turn[:, 0]
+
+    def simulate(self, commands: List[str], start=(1, 1, Direction.NORTH)):
+        """Simulate a single command list, see simulate_batch
+
+        Returns:
+            dict: time, final pose, collision (bool), collision_index (command index or -1) and snaps
+        """
+        result = self.simulate_batch([commands], [start])
+        return {
+            'time': float(result['time'][0]),
+            'final': {'x': int(result['x'][0]), 'y': int(result['y'][0]), 'd': Direction(int(result['d'][0]))},
+            'collision': bool(result['collision'][0]),
+            'collision_index': int(result['collision_index'][0]),
+            'snaps': result['snaps'][0],
+        }
+
+    def simulate_batch(self, plans: List[List[str]], starts=None):
+        """Simulate many command lists at once
+
+        Args:
+            plans (List[List[str]]): command lists from command_generator
+            starts (List[Tuple], optional): (x, y, direction) start pose of each plan. Defaults to (1, 1, NORTH).
+
+        Returns:
+            dict: NumPy arrays with one entry per plan - time, final x/y/d, collision and collision_index
+                  (index of the first colliding command, -1 if none) - and `snaps`, a list per plan of
+                  the viewing geometry at each SNAP
+        """
+        n = len(plans)
+        # Commands up to FIN, expanded, and (plan, unit move, obstacle id, hint) of every SNAP
+        parsed = []
+        snap_moves = []
+        for i, commands in enumerate(plans):
+            expanded = []
+            for command in commands:
+                expanded.append(parse_command(command))
+                if command.startswith("FIN"):
+                    break
+            parsed.append(expanded)
+        length = max([sum(len(codes) for codes, _, _ in expanded) for expanded in parsed] + [1])
+
+        codes = np.zeros((n, length), dtype=np.int64)
+        command_index = np.full((n, length), -1, dtype=np.int64)
+        for i, expanded in enumerate(parsed):
+            if not expanded:
+                continue
+            counts = [len(move_codes) for move_codes, _, _ in expanded]
+            total = sum(counts)
+            codes[i, :total] = list(chain.from_iterable(move_codes for move_codes, _, _ in expanded))
+            command_index[i, :total] = np.repeat(np.arange(len(expanded)), counts)
+            t = 0
+            for (_, obstacle_id, hint), count in zip(expanded, counts):
+                if obstacle_id >= 0:
+                    snap_moves.append((i, t, obstacle_id, hint))
+                t += count
+
+        if starts is None:
+            starts = [(1, 1, Direction.NORTH)] * n
+        x = np.array([int(start[0]) for start in starts], dtype=np.int64)
+        y = np.array([int(start[1]) for start in starts], dtype=np.int64)
+        d = np.array([int(start[2]) for start in starts], dtype=np.int64)
+
+        # Pose after each unit move, all at once: the heading before each move is a running sum of the
+        # turns, which gives each displacement, and the positions are running sums of those
+        ds = (d[:, None] + np.cumsum(self.code_turn[codes], axis=1)) % 8
+        before = np.concatenate([d[:, None], ds[:, :-1]], axis=1)
+        xs = x[:, None] + np.cumsum(self.move_dx[codes, before], axis=1)
+        ys = y[:, None] + np.cumsum(self.move_dy[codes, before], axis=1)
+        prev_x = np.concatenate([x[:, None], xs[:, :-1]], axis=1)
+        prev_y = np.concatenate([y[:, None], ys[:, :-1]], axis=1)
+
+        size_x, size_y = self.grid.size_x, self.grid.size_y
+        inside = (xs >= 0) & (xs < size_x) & (ys >= 0) & (ys < size_y)
+        cx, cy = np.clip(xs, 0, size_x - 1), np.clip(ys, 0, size_y - 1)
+        turns = np.isin(codes, TURNS_90 + TURNS_45)
+        ok = np.where(turns,
+                      self.turn_clear[cx, cy] & self.pre_turn_clear[np.clip(prev_x, 0, size_x - 1), np.clip(prev_y, 0, size_y - 1)],
+                      self.clear[cx, cy])
+        ok = (codes == NOP) | (ok & inside)
+
+        # Index of the command of the first unit move that collides
+        collided = ~ok.all(axis=1)
+        first = np.argmin(ok, axis=1)
+        collision_index = np.where(collided, command_index[np.arange(n), first], -1)
+        x, y, d = xs[:, -1], ys[:, -1], ds[:, -1]
+
+        snaps = [[] for _ in range(n)]
+        if snap_moves:
+            plan, t, obstacle_ids, hints = zip(*snap_moves)
+            plan, t = np.array(plan), np.array(t)
+            geometries = self.get_view_geometries(obstacle_ids, xs[plan, t], ys[plan, t], ds[plan, t])
+            for i, hint, geometry in zip(plan, hints, geometries):
+                geometry['hint'] = hint
+                snaps[i].append(geometry)
+
+        return {
+            'time': MOVE_TIME[codes].sum(axis=1),
+            'x': x,
+            'y': y,
+            'd': d,
+            'collision': collision_index >= 0,
+            'collision_index': collision_index,
+            'snaps': snaps,
+        }
+
+    def get_view_geometries(self, obstacle_ids, x, y, d):
+        """get_view_geometry for many snaps at once, without their hints
+
+        Args:
+            obstacle_ids (List[int]): obstacle of each snap
+            x, y, d (np.ndarray): pose of the robot at each snap
+
+        Returns:
+            List[dict]: viewing geometry of each snap
+        """
+        known = np.array([obstacle_id in self.obstacles for obstacle_id in obstacle_ids])
+        ob_x = np.array([self.obstacles[obstacle_id].x if obstacle_id in self.obstacles else 0 for obstacle_id in obstacle_ids])
+        ob_y = np.array([self.obstacles[obstacle_id].y if obstacle_id in self.obstacles else 0 for obstacle_id in obstacle_ids])
+        ob_d = np.array([int(self.obstacles[obstacle_id].direction) if obstacle_id in self.obstacles else -1 for obstacle_id in obstacle_ids])
+
+        forward, right = HEADING_VECTORS[d], HEADING_VECTORS[(d + 2) % 8]
+        rel_x, rel_y = ob_x - x, ob_y - y
+        distance = np.hypot(rel_x, rel_y)
+        ahead = rel_x * forward[:, 0] + rel_y * forward[:, 1]
+        lateral = rel_x * right[:, 0] + rel_y * right[:, 1]
+        facing = (d + 4) % 8 == ob_d
+
+        records = []
+        for j, obstacle_id in enumerate(obstacle_ids):
+            record = {'id': obstacle_id, 'hint': None, 'x': int(x[j]), 'y': int(y[j]), 'd': DIRECTIONS[d[j]]}
+            if known[j]:
+                record.update({
+                    'distance': float(distance[j]),
+                    'ahead': float(ahead[j]),
+                    'lateral': float(lateral[j]),
+                    'facing': bool(facing[j]),
+                })
+            records.append(record)
+        return records
+
+    def get_view_geometry(self, obstacle_id, hint, x, y, d):
+        """Where the obstacle is as seen from the robot when the picture is taken"""
+        record = {'id': obstacle_id, 'hint': hint, 'x': int(x), 'y': int(y), 'd': Direction(int(d))}
+        ob = self.obstacles.get(obstacle_id)
+        if ob is None:
+            return record
+
+        forward_x, forward_y, _ = MOVE_DIRECTION[int(d)]
+        right_x, right_y, _ = MOVE_DIRECTION[(int(d) + 2) % 8]
+        rel_x, rel_y = ob.x - x, ob.y - y
+        record.update({
+            'distance': float(np.hypot(rel_x, rel_y)),
+            'ahead': float(rel_x * forward_x + rel_y * forward_y),
+            'lateral': float(rel_x * right_x + rel_y * right_y), # positive to the right of the robot
+            'facing': (int(d) + 4) % 8 == int(ob.direction), # robot looks straight at the symbol
+        })
+        return record
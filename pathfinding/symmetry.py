@@ -0,0 +1,372 @@
+import heapq
+from collections import OrderedDict
+from typing import List
+import numpy as np
+from pathfinding.consts import Direction, MOVE_DIRECTION, EXPANDED_CELL
+from pathfinding.entities.Entity import CellState, Grid
+from pathfinding.entities.PackedPath import PackedPath
+from pathfinding.primitives import get_command, make_primitive
+
+# Symmetries of a rectangle/square, as 2x2 matrices (a, b, c, d): (x, y) -> (a*x + b*y, c*x + d*y)
+TRANSFORMS = {
+    "identity": (1, 0, 0, 1),
+    "rotate_90": (0, -1, 1, 0),
+    "rotate_180": (-1, 0, 0, -1),
+    "rotate_270": (0, 1, -1, 0),
+    "mirror_x": (-1, 0, 0, 1),
+    "mirror_y": (1, 0, 0, -1),
+    "transpose": (0, 1, 1, 0),
+    "anti_transpose": (0, -1, -1, 0),
+}
+
+
+class Symmetry:
+    """A symmetry of the arena, mapping positions about its centre and directions accordingly"""
+
+    def __init__(self, name: str, size_x: int, size_y: int, matrix=None):
+        self.name = name
+        self.size_x = size_x
+        self.size_y = size_y
+        self.matrix = TRANSFORMS[name] if matrix is None else matrix
+
+        a, b, c, d = self.matrix
+        # Direction -> direction, by transforming its unit vector
+        by_vector = {(dx, dy): md for dx, dy, md in MOVE_DIRECTION}
+        self.direction_map = {md: by_vector[(a * dx + b * dy, c * dx + d * dy)] for dx, dy, md in MOVE_DIRECTION}
+        self.direction_map[Direction.SKIP] = Direction.SKIP
+
+    def is_valid_for(self, size_x: int, size_y: int) -> bool:
+        """Only symmetries that keep the x and y axes map a non-square arena onto itself"""
+        a, b, c, d = self.matrix
+        return size_x == size_y or (b == 0 and c == 0)
+
+    def inverse(self):
+        # The matrices are orthogonal, so the inverse is the transpose
+        a, b, c, d = self.matrix
+        return Symmetry(self.name + "_inverse", self.size_x, self.size_y, (a, c, b, d))
+
+    def apply_position(self, x, y):
+        a, b, c, d = self.matrix
+        # Transform about the centre of the arena, (size - 1) / 2, keeping everything integral
+        rel_x, rel_y = 2 * x - (self.size_x - 1), 2 * y - (self.size_y - 1)
+        new_x = (a * rel_x + b * rel_y + (self.size_x - 1)) / 2
+        new_y = (c * rel_x + d * rel_y + (self.size_y - 1)) / 2
+        return type(x)(new_x), type(y)(new_y)
+
+    def apply_state(self, state):
+        """Transform an (x, y, direction) tuple"""
+        x, y = self.apply_position(state[0], state[1])
+        return (x, y, self.direction_map[Direction(state[2])])
+
+
+# (size_x, size_y, big_turn, allow_45) -> symmetries of the motion model
+_symmetry_groups = dict()
+
+
+def get_symmetry_group(maze_solver) -> List[Symmetry]:
+    """Find the symmetries of the arena under which the motion model of the solver is invariant
+
+    Each candidate is checked on an arena without obstacles: every state must have exactly the
+    transformed successors (and costs) of its transformed state. The planner's primitives have no
+    arcs from NORTH to WEST, so only the identity is left with them.
+
+    Returns:
+        List[Symmetry]: the valid symmetries, always starting with the identity
+    """
+    from pathfinding.algo import MazeSolver
+
+    size_x, size_y = maze_solver.grid.size_x, maze_solver.grid.size_y
+    config = (size_x, size_y, maze_solver.big_turn, maze_solver.allow_45)
+    if config in _symmetry_groups:
+        return _symmetry_groups[config]
+
+    empty_solver = MazeSolver(size_x, size_y, 1, 1, Direction.NORTH,
+                              big_turn=maze_solver.big_turn, allow_45=maze_solver.allow_45)
+    directions = list(Direction)[:8] if maze_solver.allow_45 else \
+        [Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST]
+
+    group = []
+    for name in TRANSFORMS:
+        symmetry = Symmetry(name, size_x, size_y)
+        if not symmetry.is_valid_for(size_x, size_y):
+            continue
+
+        invariant = True
+        for x in range(1, size_x - 1):
+            for y in range(1, size_y - 1):
+                for direction in directions:
+                    successors = {(symmetry.apply_state((nx, ny, nd)), cost)
+                                  for nx, ny, nd, cost in empty_solver.get_successors(x, y, direction)}
+                    transformed = symmetry.apply_state((x, y, direction))
+                    if successors != {((nx, ny, nd), cost) for nx, ny, nd, cost in empty_solver.get_successors(*transformed)}:
+                        invariant = False
+                        break
+                if not invariant:
+                    break
+            if not invariant:
+                break
+
+        if invariant:
+            group.append(symmetry)
+
+    _symmetry_groups[config] = group
+    return group
+
+
+# (size_x, size_y, big_turn, allow_45) -> whether the motion model is reversible
+_reversible = dict()
+
+
+def is_reversible(maze_solver) -> bool:
+    """Check that every path of the solver can be driven backwards, from its end to its start
+
+    A path is reversed move by move, so each primitive has to be undone by a command of the robot
+    from where it ends (FW10 by BW10, a forward arc by the backward arc on the same side), with the
+    same rotation, length and penalty. The reversed move checks the same two cells, with the turn and
+    pre-turn checks swapped, and a straight move checks its start instead of its end, so the three
+    clearance checks of the grid must agree; this is checked around an obstacle.
+
+    The reversed path then costs the same, but for the safe costs of its two ends, which
+    MazeSolver.record_path accounts for. One search from a state gives paths to and from it. The path
+    back may take moves the planner does not (there are no arcs from NORTH to WEST, so none back
+    from WEST to NORTH either), so it is only the best one when the primitives are undone by each other.
+    45 degree turns are not reversible: undoing FR45 would move back along the old heading.
+
+    Returns:
+        bool: whether the path from a to b, reversed, is a path from b to a
+    """
+    from pathfinding.algo import MazeSolver
+
+    size_x, size_y = maze_solver.grid.size_x, maze_solver.grid.size_y
+    config = (size_x, size_y, maze_solver.big_turn, maze_solver.allow_45)
+    if config in _reversible:
+        return _reversible[config]
+
+    directions = list(Direction)[:8] if maze_solver.allow_45 else \
+        [Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST]
+
+    reversible = True
+    for direction in directions:
+        for primitive in maze_solver.primitives[int(direction)]:
+            command = get_command(primitive.new_direction, -primitive.dx, -primitive.dy, direction)
+            if command is None:
+                reversible = False
+                break
+            reverse = make_primitive(command, primitive.new_direction, maze_solver.big_turn)
+            if abs(reverse.base_cost - primitive.base_cost) > 1e-9 or reverse.penalty != primitive.penalty:
+                reversible = False
+                break
+        if not reversible:
+            break
+
+    if reversible:
+        obstacle_solver = MazeSolver(size_x, size_y, 1, 1, Direction.NORTH,
+                                     big_turn=maze_solver.big_turn, allow_45=maze_solver.allow_45)
+        obstacle_solver.add_obstacle(size_x // 2, size_y // 2, Direction.NORTH, 1)
+        grid = obstacle_solver.grid
+        reversible = all(grid.reachable(x, y) == grid.reachable(x, y, turn=True) == grid.reachable(x, y, preTurn=True)
+                         for x in range(size_x) for y in range(size_y))
+
+    _reversible[config] = reversible
+    return reversible
+
+
+# (size_x, size_y, big_turn, allow_45) -> costs of the moves between relative states without obstacles
+_free_costs = dict()
+
+
+def get_free_costs(maze_solver):
+    """Get the cost of the best path between any two states of the arena, were there no obstacles
+
+    Walls are ignored too, which only makes paths cheaper, so every cost is a lower bound on the
+    cost of the same path in any layout. When paths are recorded both ways (see is_reversible), the
+    tables also hold paths driven backwards, whose moves the planner may not take forward, so the
+    reverse of every primitive is a move here too.
+
+    Returns:
+        np.ndarray: cost[d1, dx, dy, d2] from a state facing d1 to the state (dx, dy) away facing d2,
+        with dx and dy offset by size - 1
+    """
+    size_x, size_y = maze_solver.grid.size_x, maze_solver.grid.size_y
+    config = (size_x, size_y, maze_solver.big_turn, maze_solver.allow_45)
+    if config in _free_costs:
+        return _free_costs[config]
+
+    # (dx, dy, new direction, cost) of the moves from each heading
+    moves = {direction: [] for direction in range(8)}
+    reversible = is_reversible(maze_solver)
+    for direction, primitives in maze_solver.primitives.items():
+        for primitive in primitives:
+            cost = primitive.base_cost + primitive.penalty
+            moves[int(direction)].append((primitive.dx, primitive.dy, int(primitive.new_direction), cost))
+            if reversible:
+                moves[int(primitive.new_direction)].append((-primitive.dx, -primitive.dy, int(direction), cost))
+
+    # Relative moves within the arena never go further than its size
+    width, height = 2 * size_x - 1, 2 * size_y - 1
+    costs = np.full((8, width, height, 8), np.inf)
+    for start_direction in range(8):
+        cost = costs[start_direction]
+        cost[size_x - 1, size_y - 1, start_direction] = 0
+        queue = [(0, size_x - 1, size_y - 1, start_direction)]
+        while queue:
+            g, x, y, direction = heapq.heappop(queue)
+            if g > cost[x, y, direction]:
+                continue
+            for dx, dy, next_direction, move_cost in moves[direction]:
+                next_x, next_y = x + dx, y + dy
+                if not (0 <= next_x < width and 0 <= next_y < height):
+                    continue
+                next_g = g + move_cost
+                if next_g < cost[next_x, next_y, next_direction]:
+                    cost[next_x, next_y, next_direction] = next_g
+                    heapq.heappush(queue, (next_g, next_x, next_y, next_direction))
+
+    _free_costs[config] = costs
+    return costs
+
+
+class EdgeCostStore:
+    """
+    Pairwise path costs shared across solves, stored in a canonical frame.
+
+    A path only passes through states that some path of its cost could reach, and get_free_costs
+    bounds which those are: the states x with free(start, x) + free(x, end) <= cost. An obstacle
+    only changes the cells within EXPANDED_CELL * 2 of it, on both axes (see Grid.reachable and
+    MazeSolver.get_safe_cost), so the best path between two states, and its cost, stay the same
+    in any layout with the same obstacles around those states. Each entry is keyed by (start, end)
+    and holds the positions of those obstacles only, so layouts that differ elsewhere, or only by
+    ids and faces, share it.
+
+    Entries are stored in whichever symmetry of the motion model (see get_symmetry_group) gives the
+    smallest key, so layouts it maps onto each other share them too, and paths are mapped back on lookup. The start zone
+    exception is not symmetric, so an entry whose obstacles trigger it is only used as it was found.
+    """
+
+    def __init__(self, max_entries=200000):
+        self.max_entries = max_entries
+        # (config, start, end) in the canonical frame -> [(obstacle positions, cost, packed path)]
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_config(maze_solver):
+        return (maze_solver.grid.size_x, maze_solver.grid.size_y, maze_solver.big_turn, maze_solver.allow_45)
+
+    @staticmethod
+    def get_relevant(maze_solver, positions, start: CellState, end: CellState, cost):
+        """Get the obstacle positions that can change the best path between two states of the given cost
+
+        Returns:
+            Tuple[Tuple[int, int]]: the positions, sorted
+        """
+        size_x, size_y = maze_solver.grid.size_x, maze_solver.grid.size_y
+        free_costs = get_free_costs(maze_solver)
+        # [x, y, direction] from the start, and to the end
+        from_start = free_costs[int(start.direction), size_x - 1 - start.x:2 * size_x - 1 - start.x,
+                                size_y - 1 - start.y:2 * size_y - 1 - start.y]
+        to_end = free_costs[:, end.x:end.x + size_x, end.y:end.y + size_y, int(end.direction)][:, ::-1, ::-1]
+        near = (from_start + to_end.transpose(1, 2, 0)).min(axis=2) <= cost + 1e-9
+
+        # Cells an obstacle changes are within EXPANDED_CELL * 2 of it, on both axes
+        reach = EXPANDED_CELL * 2
+        padded = np.pad(near, reach)
+        near = np.zeros_like(near)
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                near |= padded[reach + dx:reach + dx + size_x, reach + dy:reach + dy + size_y]
+        return tuple(sorted((x, y) for x, y in positions
+                            if 0 <= x < size_x and 0 <= y < size_y and near[x, y]))
+
+    @staticmethod
+    def is_usable(symmetry, positions):
+        """Whether obstacles at these positions, and at their image, keep their paths under the symmetry"""
+        if symmetry.matrix == TRANSFORMS["identity"]:
+            return True
+        return not any(Grid.is_start_zone_exception(x, y, 1, 1)
+                       for x, y in positions + [symmetry.apply_position(x, y) for x, y in positions])
+
+    @staticmethod
+    def get_key(config, symmetry, start: CellState, end: CellState):
+        return (config,
+                symmetry.apply_state((start.x, start.y, start.direction)),
+                symmetry.apply_state((end.x, end.y, end.direction)))
+
+    def load(self, maze_solver, states: List[CellState]):
+        """Fill the tables of the solver with the stored costs and paths between the given states
+
+        Returns:
+            List[Tuple[CellState, CellState]]: the pairs of states still without a path, to save once searched
+        """
+        missing = []
+        config = self.get_config(maze_solver)
+        positions = [(ob.x, ob.y) for ob in maze_solver.grid.obstacles]
+        symmetries = get_symmetry_group(maze_solver)
+
+        for i in range(len(states) - 1):
+            for j in range(i + 1, len(states)):
+                start, end = states[i], states[j]
+                if maze_solver.has_path(start, end):
+                    continue
+
+                found = None
+                relevant_by_cost = dict()
+                for symmetry in symmetries:
+                    key = self.get_key(config, symmetry, start, end)
+                    for entry in self.entries.get(key, ()):
+                        stored, cost, _ = entry
+                        if cost not in relevant_by_cost:
+                            relevant_by_cost[cost] = self.get_relevant(maze_solver, positions, start, end, cost)
+                        relevant = relevant_by_cost[cost]
+                        if self.is_usable(symmetry, list(relevant)) and \
+                                tuple(sorted(symmetry.apply_position(x, y) for x, y in relevant)) == stored:
+                            found = (key, symmetry, entry)
+                            break
+                    if found is not None:
+                        break
+
+                if found is None:
+                    self.misses += 1
+                    missing.append((start, end))
+                    continue
+
+                self.hits += 1
+                key, symmetry, (_, cost, canonical_path) = found
+                self.entries.move_to_end(key)
+                inverse = symmetry.inverse()
+                path = [inverse.apply_state(state) for state in canonical_path.decode()]
+                maze_solver.record_path(start, end, cost, path)
+        return missing
+
+    def save(self, maze_solver, pairs):
+        """Store the costs and paths the solver found between the given pairs of states, see load"""
+        config = self.get_config(maze_solver)
+        positions = [(ob.x, ob.y) for ob in maze_solver.grid.obstacles]
+        symmetries = get_symmetry_group(maze_solver)
+
+        for start, end in pairs:
+            if not maze_solver.has_path(start, end):
+                continue
+
+            cost = maze_solver.cost_table[(start, end)]
+            relevant = self.get_relevant(maze_solver, positions, start, end, cost)
+            best = None
+            for symmetry in symmetries:
+                if not self.is_usable(symmetry, list(relevant)):
+                    continue
+                key = self.get_key(config, symmetry, start, end)
+                stored = tuple(sorted(symmetry.apply_position(x, y) for x, y in relevant))
+                if best is None or (key, stored) < best[:2]:
+                    best = (key, stored, symmetry)
+
+            key, stored, symmetry = best
+            entries = self.entries.setdefault(key, [])
+            if any(other == stored for other, _, _ in entries):
+                continue
+            path = maze_solver.get_path(start, end)
+            entries.append((stored, cost, PackedPath.encode([symmetry.apply_state(state) for state in path])))
+            self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
@@ -0,0 +1,135 @@
+from typing import List
+from pathfinding.consts import Direction, MOVE_DIRECTION, FUSED_TURNS
+from pathfinding.entities.Entity import Grid
+from pathfinding.simulator import Simulator, MOVE_CODES, TURNS_90, TURNS_45
+
+# STM commands of Task1._segment_commands -> commands of command_generator
+STM_COMMANDS = {"F": "FW", "R": "BW", "RL": "BL", "RR": "BR"}
+
+
+class PlanValidator:
+    """
+    Replays the segments sent to the RPI against the arena before they go out.
+
+    The clearance maps and move tables of a Simulator are built once per layout and kept as plain
+    lists, so a plan is checked in well under a millisecond.
+    """
+
+    def __init__(self, grid: Grid, big_turn=0, retrying=False):
+        simulator = Simulator(grid, big_turn=big_turn)
+        self.size_x, self.size_y = grid.size_x, grid.size_y
+        self.clear = simulator.clear.tolist()
+        self.turn_clear = simulator.turn_clear.tolist()
+        self.pre_turn_clear = simulator.pre_turn_clear.tolist()
+        self.move_dx = simulator.move_dx.tolist()
+        self.move_dy = simulator.move_dy.tolist()
+        self.move_turn = simulator.move_turn.tolist()
+        self.turns = set(TURNS_90 + TURNS_45)
+        self.obstacles = {ob.obstacle_id: (ob.x, ob.y, int(ob.direction)) for ob in grid.obstacles}
+        # Only obstacles that can be seen from somewhere are expected in a plan, from the view states it was planned with
+        self.visitable = {view_positions[0].screenshot_id for view_positions in grid.get_view_obstacle_positions(retrying)
+                          if view_positions}
+
+    def get_moves(self, command: str):
+        """Unit moves of an STM command, or None if it is not one"""
+        if command[:2] in ("RL", "RR"):
+            command = STM_COMMANDS[command[:2]] + command[2:]
+        elif command[:1] in ("F", "R") and command[1:].isdigit():
+            command = STM_COMMANDS[command[:1]] + command[1:]
+
+        if command[:2] in ("FW", "BW") and command[2:].isdigit():
+            steps = int(command[2:])
+            if steps % 10:
+                return None
+            return [MOVE_CODES[command[:2]]] * (steps // 10)
+        if command in MOVE_CODES:
+            return [MOVE_CODES[command]]
+        for parts, fused in FUSED_TURNS.items():
+            if fused == command:
+                return [MOVE_CODES[part] for part in parts]
+        return None
+
+    def validate(self, path: dict, final=True, start=(1, 1, Direction.NORTH), require_all=False) -> List[str]:
+        """Check a segmented path
+
+        Args:
+            path (dict): "segments" and "obstacle_ids" from Task1._segment_commands
+            final (bool, optional): whether the path covers the whole run, and must end with the stop. Defaults to True.
+            start (Tuple, optional): (x, y, direction) the robot starts from. Defaults to (1, 1, NORTH).
+            require_all (bool, optional): whether every obstacle that can be seen must be pictured. The planner
+                leaves out obstacles it cannot find a path to, so this is off by default. Defaults to False.
+
+        Returns:
+            List[str]: problems found, empty if the path is safe to send
+        """
+        errors = []
+        segments, obstacle_ids = path['segments'], path['obstacle_ids']
+        x, y, d = int(start[0]), int(start[1]), int(start[2])
+        stopped = False
+
+        if len(obstacle_ids) > len(segments):
+            errors.append(f"{len(obstacle_ids)} SNAPs for {len(segments)} segments")
+
+        for index, segment in enumerate(segments):
+            for command in segment:
+                if stopped:
+                    errors.append(f"Segment {index}: {command} after the stop")
+                    return errors
+                if command == "S":
+                    stopped = True
+                    continue
+
+                moves = self.get_moves(command)
+                if moves is None:
+                    errors.append(f"Segment {index}: unknown command {command}")
+                    return errors
+                for code in moves:
+                    new_x, new_y = x + self.move_dx[code][d], y + self.move_dy[code][d]
+                    if not (0 <= new_x < self.size_x and 0 <= new_y < self.size_y):
+                        errors.append(f"Segment {index}: {command} leaves the arena at ({new_x}, {new_y})")
+                        return errors
+                    if code in self.turns:
+                        ok = self.turn_clear[new_x][new_y] and self.pre_turn_clear[x][y]
+                    else:
+                        ok = self.clear[new_x][new_y]
+                    if not ok:
+                        errors.append(f"Segment {index}: {command} collides at ({new_x}, {new_y})")
+                        return errors
+                    x, y, d = new_x, new_y, (d + self.move_turn[code][d]) % 8
+
+            # Every segment but the last ends with a picture
+            if index < len(obstacle_ids):
+                errors.extend(self.validate_snap(index, obstacle_ids[index], x, y, d))
+
+        snapped = [int(obstacle_id) for obstacle_id in obstacle_ids]
+        if len(set(snapped)) != len(snapped):
+            errors.append(f"Obstacles pictured more than once: {snapped}")
+        if len(snapped) > len(self.visitable):
+            errors.append(f"{len(snapped)} SNAPs for {len(self.visitable)} obstacles")
+        if final and not stopped:
+            errors.append("Path does not end with the stop")
+        if final and require_all:
+            missing = self.visitable - set(snapped)
+            if missing:
+                errors.append(f"{len(snapped)} SNAPs for {len(self.visitable)} obstacles, missing {sorted(missing)}")
+        if not self.clear[x][y]:
+            errors.append(f"Final pose ({x}, {y}) is not reachable")
+        return errors
+
+    def validate_snap(self, index, obstacle_id, x, y, d) -> List[str]:
+        """The robot has to face the obstacle's symbol, from in front of it"""
+        ob = self.obstacles.get(int(obstacle_id))
+        if ob is None:
+            return [f"Segment {index}: SNAP of unknown obstacle {obstacle_id}"]
+
+        ob_x, ob_y, ob_direction = ob
+        if (d + 4) % 8 != ob_direction:
+            return [f"Segment {index}: robot faces {Direction(d).name} at the SNAP of obstacle {obstacle_id}"]
+
+        forward_x, forward_y, _ = MOVE_DIRECTION[d]
+        right_x, right_y, _ = MOVE_DIRECTION[(d + 2) % 8]
+        ahead = (ob_x - x) * forward_x + (ob_y - y) * forward_y
+        lateral = (ob_x - x) * right_x + (ob_y - y) * right_y
+        if not (0 < ahead <= 6 and abs(lateral) <= 1):
+            return [f"Segment {index}: obstacle {obstacle_id} is out of view at the SNAP, {ahead} ahead and {lateral} across"]
+        return []
@@ -0,0 +1,145 @@
+from typing import Dict, List, Tuple
+import numpy as np
+from pathfinding.consts import Direction
+from pathfinding.entities.Entity import CellState
+
+INF = float('inf')
+
+
+class WavefrontPlanner:
+    """Vectorized Bellman-Ford relaxation over a dense (x, y, direction) cost tensor.
+
+    Every move of the motion model is turned into a cost array over the cells it can start from
+    (inf where it is blocked by obstacles), one per (direction, dx, dy, new_direction). A sweep
+    relaxes each of them as one shifted-array minimum, for all sources at once, until nothing
+    changes. The result is the exact cost from each source to every state.
+    """
+
+    def __init__(self, maze_solver):
+        self.maze_solver = maze_solver
+        # direction -> [(dx, dy, new_direction, cost array over start cells)]
+        self.moves: Dict[int, List[Tuple]] = dict()
+        # new_direction -> [(direction, dx, dy, cost array over start cells)], for walking paths back
+        self.incoming: Dict[int, List[Tuple]] = dict()
+        # (x, y, direction) of a source -> cost tensor from that source
+        self.costs: Dict[Tuple, np.ndarray] = dict()
+
+    def add_direction(self, direction: int):
+        """Build the cost arrays of every move starting in the given direction"""
+        if direction in self.moves:
+            return
+
+        size_x, size_y = self.maze_solver.grid.size_x, self.maze_solver.grid.size_y
+        move_costs = dict()
+        for x in range(1, size_x - 1):
+            for y in range(1, size_y - 1):
+                for next_x, next_y, new_direction, move_cost in self.maze_solver.get_successors(x, y, direction):
+                    move = (int(next_x - x), int(next_y - y), int(new_direction))
+                    if move not in move_costs:
+                        move_costs[move] = np.full((size_x, size_y), INF)
+                    move_costs[move][x, y] = min(move_costs[move][x, y], move_cost)
+
+        self.moves[direction] = [(dx, dy, new_direction, cost) for (dx, dy, new_direction), cost in move_costs.items()]
+        for dx, dy, new_direction, cost in self.moves[direction]:
+            self.incoming.setdefault(new_direction, []).append((direction, dx, dy, cost))
+            # Moves can lead into directions that have no moves of their own yet
+            self.add_direction(new_direction)
+
+    def sweep(self, sources: List[Tuple]) -> np.ndarray:
+        """Relax the cost tensors of all sources together until they reach the exact costs
+
+        Args:
+            sources (List[Tuple]): (x, y, direction) of each source
+
+        Returns:
+            np.ndarray: costs, of shape (len(sources), size_x, size_y, 8)
+        """
+        size_x, size_y = self.maze_solver.grid.size_x, self.maze_solver.grid.size_y
+        costs = np.full((len(sources), size_x, size_y, 8), INF)
+        for i, (x, y, direction) in enumerate(sources):
+            self.add_direction(int(direction))
+            costs[i, int(x), int(y), int(direction)] = 0
+
+        # Slices of the start cells and of the cells they lead to, for each move
+        shifted_moves = []
+        for direction, moves in self.moves.items():
+            for dx, dy, new_direction, cost in moves:
+                from_x = slice(max(0, -dx), size_x - max(0, dx))
+                from_y = slice(max(0, -dy), size_y - max(0, dy))
+                to_x = slice(max(0, dx), size_x - max(0, -dx))
+                to_y = slice(max(0, dy), size_y - max(0, -dy))
+                shifted_moves.append((direction, new_direction, cost[from_x, from_y], from_x, from_y, to_x, to_y))
+
+        changed = True
+        while changed:
+            changed = False
+            for direction, new_direction, cost, from_x, from_y, to_x, to_y in shifted_moves:
+                candidate = costs[:, from_x, from_y, direction] + cost
+                target = costs[:, to_x, to_y, new_direction]
+                better = candidate < target
+                if better.any():
+                    target[better] = candidate[better]
+                    changed = True
+
+        return costs
+
+    def get_path(self, costs: np.ndarray, source: Tuple, target: Tuple) -> List[Tuple]:
+        """Walk back from the target along moves whose cost accounts exactly for the difference
+
+        Args:
+            costs (np.ndarray): cost tensor of the source, of shape (size_x, size_y, 8)
+
+        Returns:
+            List[Tuple]: (x, y, direction) states from source to target
+        """
+        size_x, size_y = costs.shape[0], costs.shape[1]
+        path = [target]
+        x, y, direction = int(target[0]), int(target[1]), int(target[2])
+        source = (int(source[0]), int(source[1]), int(source[2]))
+        while (x, y, direction) != source:
+            cost = costs[x, y, direction]
+            for prev_direction, dx, dy, move_cost in self.incoming[direction]:
+                prev_x, prev_y = x - dx, y - dy
+                if not (0 <= prev_x < size_x and 0 <= prev_y < size_y):
+                    continue
+                if abs(costs[prev_x, prev_y, prev_direction] + move_cost[prev_x, prev_y] - cost) < 1e-9:
+                    x, y, direction = prev_x, prev_y, prev_direction
+                    break
+            path.append((x, y, Direction(direction)))
+        path[-1] = source
+        return path[::-1]
+
+    def path_cost_generator(self, states: List[CellState]):
+        """Fill the cost and path tables of the solver for every pair of the input states
+
+        All the sources without a cost tensor yet are swept together.
+
+        Args:
+            states (List[CellState]): cell states to visit
+        """
+        keys = [(state.x, state.y, state.direction) for state in states]
+        new_sources = list(dict.fromkeys(key for key in keys[:-1] if key not in self.costs))
+        if new_sources:
+            for key, costs in zip(new_sources, self.sweep(new_sources)):
+                self.costs[key] = costs
+
+        for i in range(len(states) - 1):
+            costs = self.costs[keys[i]]
+            for j in range(i + 1, len(states)):
+                start, end = states[i], states[j]
+                if self.maze_solver.has_path(start, end):
+                    continue
+
+                cost = costs[int(end.x), int(end.y), int(end.direction)]
+                if cost == INF:
+                    continue
+                self.maze_solver.record_path(start, end, float(cost), self.get_path(costs, keys[i], keys[j]))
+
+    def repair(self, positions: List[Tuple[int, int]]):
+        """Obstacles changed: the cost arrays and tensors are rebuilt on the next solve"""
+        self.moves = dict()
+        self.incoming = dict()
+        self.costs = dict()
+
+    def end_solve(self):
+        pass
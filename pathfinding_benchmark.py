@@ -0,0 +1,93 @@
+import argparse
+import random
+import sys
+import time
+import contextlib
+import io
+
+from pathfinding.pathfinding import pathfinding, create_maze_solver
+from pathfinding.simulator import Simulator
+
+ENGINES = ["astar", "incremental", "wavefront"]
+
+
+def random_layout(rng, n_obstacles):
+    """Random obstacles that keep clear of each other and of the start zone"""
+    obstacles = []
+    while len(obstacles) < n_obstacles:
+        ob = {
+            "x": rng.randint(2, 17),
+            "y": rng.randint(2, 17),
+            "d": rng.choice([0, 2, 4, 6]),
+            "id": len(obstacles) + 1,
+        }
+        if ob["x"] < 6 and ob["y"] < 6:
+            continue
+        if all(max(abs(ob["x"] - o["x"]), abs(ob["y"] - o["y"])) > 2 for o in obstacles):
+            obstacles.append(ob)
+    return obstacles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the pathfinding engines on random layouts")
+    parser.add_argument("--layouts", type=int, default=10, help="Number of random layouts")
+    parser.add_argument("--obstacles", type=int, default=6, help="Obstacles per layout")
+    parser.add_argument("--big-turn", type=int, default=0, help="0 for 3-1 turns, 1 for 4-2 turns")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES, help="Engines to compare")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    layouts = [random_layout(rng, args.obstacles) for _ in range(args.layouts)]
+
+    totals = {engine: 0.0 for engine in args.engines}
+    mismatches = 0
+    failures = 0
+    simulated = 0
+    simulate_time = 0.0
+    # A* searches run, and the paths they found: one search per path before searches were shared
+    searches = 0
+    paths = 0
+    for i, obstacles in enumerate(layouts):
+        distances = {}
+        for engine in args.engines:
+            start = time.perf_counter()
+            # pathfinding() prints its own timing, keep the table readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                maze_solver = create_maze_solver(obstacles, big_turn=args.big_turn, engine=engine)
+                result = pathfinding(obstacles, maze_solver=maze_solver)
+            totals[engine] += time.perf_counter() - start
+            distances[engine] = result["distance"]
+            if engine == "astar":
+                searches += maze_solver.searches
+                paths += len(maze_solver.path_table)
+
+            # Replay the commands offline: they must stay clear of the obstacles and end where the path ends
+            start = time.perf_counter()
+            simulation = Simulator(maze_solver.grid, big_turn=args.big_turn).simulate(result["commands"])
+            simulate_time += time.perf_counter() - start
+            simulated += 1
+            end = result["path"][-1]
+            if simulation["collision"] or \
+                    (simulation["final"]["x"], simulation["final"]["y"], simulation["final"]["d"]) != (end["x"], end["y"], end["d"]):
+                failures += 1
+                print(f"[{i:03d}] {engine}: simulated commands collide or end off the path: {simulation['final']}")
+
+        if max(distances.values()) - min(distances.values()) > 1e-6:
+            mismatches += 1
+            print(f"[{i:03d}] distance mismatch: {distances}")
+
+    print(f"{'engine':<12} {'total (s)':>10} {'per layout (ms)':>16} {'speedup':>8}")
+    baseline = totals[args.engines[0]]
+    for engine in args.engines:
+        print(f"{engine:<12} {totals[engine]:>10.3f} {totals[engine] / len(layouts) * 1e3:>16.1f} "
+              f"{baseline / totals[engine]:>8.1f}x")
+    print(f"{mismatches} layout(s) with differing distances")
+    if "astar" in args.engines:
+        print(f"{searches} A* search(es) for {paths} path(s) ({paths / max(searches, 1):.1f} paths per search)")
+    print(f"{failures} of {simulated} plan(s) failed simulation ({simulate_time / simulated * 1e3:.2f} ms per plan)")
+    return 1 if mismatches or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
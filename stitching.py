@@ -6,17 +6,18 @@ import random
 import logging
 logging.basicConfig(level=logging.INFO)
 
-from ultralytics import YOLO
+from inference import create_detector
 from classes import CLASS_IDS
 
 def add_to_stitching_dict(stitching_dict, img_id, conf_level, frame):
+    """frame may be a callable (e.g. Detections.plot), only called when the frame is kept"""
     if img_id not in stitching_dict or (
         conf_level > stitching_dict[img_id][0]
     ):
         # Store the best confidence level and corresponding frame
         stitching_dict[img_id] = (
             conf_level,
-            frame,
+            frame() if callable(frame) else frame,
         )
         logging.info(f"Saw {img_id} with confidence level {conf_level}.")
     
@@ -124,13 +125,14 @@ def add_to_stitching_dict_2(stitching_dict, obstacle_id, img_id, conf_level, fra
               img_id: (best_conf, frame)
           }, ...
       }
+    frame may be a callable (e.g. Detections.plot), only called when the frame is kept.
     """
     if obstacle_id not in stitching_dict:
         stitching_dict[obstacle_id] = {}
 
     cur = stitching_dict[obstacle_id].get(img_id)
     if (cur is None) or (conf_level > cur[0]):
-        stitching_dict[obstacle_id][img_id] = (conf_level, frame)
+        stitching_dict[obstacle_id][img_id] = (conf_level, frame() if callable(frame) else frame)
         logging.info(f"[stitch] Obstacle {obstacle_id} saw {img_id} @ {conf_level:.3f} (updated).")
 
 
@@ -274,34 +276,24 @@ def test_stitch():
 
     frames = {}
         
-    model = YOLO("bestv8n.pt")
+    detector = create_detector("bestv8n.pt")
     stitching_dict = {}
     for img_id, p in paths.items():
         with open(p, "rb") as f:
             jpg_bytes = f.read()
             frame = cv2.imdecode(np.frombuffer(jpg_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
 
-            result = model.predict(
-                frame, save=False, imgsz=frame.shape[1],
-                conf=0.7, verbose=False
-            )[0]
+            result = detector.predict(frame, 0.7)
             
             
             if result is not None:
-                names = result.names
-                
                 max_rec = None  
 
-                for box in result.boxes:
-                    cls_id = int(box.cls[0].item())
-                    detected_img_id = names[cls_id]
+                for detected_img_id, box, conf in zip(result.labels, result.xyxy.tolist(), result.conf.tolist()):
                     if str(detected_img_id) in ["45"]:
                         continue
 
-                    w = float(box.xywh[0][2].item())
-                    h = float(box.xywh[0][3].item())
-                    area = w * h
-                    conf = float(box.conf[0].item()) if getattr(box.conf, "ndim", 0) else float(box.conf.item())
+                    area = (box[2] - box[0]) * (box[3] - box[1])
 
                     if (max_rec is None or
                         area > max_rec["area"] or
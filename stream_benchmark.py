@@ -0,0 +1,166 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from StreamListener import FrameReader
+
+HOST = "127.0.0.1"
+
+
+def load_payloads(photos, width, height, quality):
+    """JPEGs as the Pi sends them: the photos resized to the stream resolution"""
+    payloads = []
+    for path in sorted(glob.glob(os.path.join(photos, "*.jpg"))):
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        image = cv2.resize(image, (width, height))
+        ok, jpg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok:
+            payloads.append(jpg.tobytes())
+    return payloads
+
+
+def serve(port, payloads, frames, fps):
+    """Stand-in for the Pi's stream server: one client, 'OK STREAMING' then length-prefixed frames"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((HOST, port))
+    server.listen(1)
+    client, _ = server.accept()
+    client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    client.makefile("rb").readline()
+    client.sendall(b"OK STREAMING\n")
+
+    interval = 1.0 / fps if fps > 0 else 0.0
+    next_time = time.perf_counter()
+    try:
+        for i in range(frames):
+            payload = payloads[i % len(payloads)]
+            client.sendall(struct.pack("!I", len(payload)))
+            client.sendall(payload)
+            if interval:
+                next_time += interval
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+    except OSError:
+        pass
+    finally:
+        client.close()
+        server.close()
+
+
+# --- framing as StreamListener did it before FrameReader ---
+def baseline_readline(sock, maxlen=256):
+    buf = bytearray()
+    while len(buf) < maxlen:
+        ch = sock.recv(1)
+        if not ch:
+            return None
+        buf += ch
+        if ch == b"\n":
+            break
+    return bytes(buf)
+
+
+def baseline_recv_exact(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+
+def read_baseline(sock, decode=True):
+    baseline_readline(sock)
+    while True:
+        hdr = baseline_recv_exact(sock, 4)
+        if hdr is None:
+            return
+        jpg = baseline_recv_exact(sock, struct.unpack("!I", hdr)[0])
+        if jpg is None:
+            return
+        yield cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR) if decode else jpg
+
+
+def read_zero_copy(sock, decode=True):
+    frames = FrameReader(sock)
+    frames.readline()
+    while True:
+        frame = frames.read_frame()
+        if frame is None:
+            return
+        buffer, size = frame
+        image = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8, count=size), cv2.IMREAD_COLOR) if decode else size
+        frames.release(buffer)
+        yield image
+
+
+READERS = {"baseline": read_baseline, "zero-copy": read_zero_copy}
+
+
+def run(reader, port, payloads, frames, fps, decode=True):
+    server = multiprocessing.Process(target=serve, args=(port, payloads, frames, fps), daemon=True)
+    server.start()
+    for _ in range(50):
+        try:
+            sock = socket.create_connection((HOST, port), timeout=5)
+            break
+        except OSError:
+            time.sleep(0.1)
+    else:
+        raise ConnectionError(f"Benchmark server did not start on port {port}")
+    sock.settimeout(None)
+    sock.sendall(b"stream_request\n")
+
+    # CPU time of this process only: the server runs in its own
+    start_cpu, start_wall = time.process_time(), time.perf_counter()
+    count = 0
+    for image in READERS[reader](sock, decode):
+        if image is None:
+            raise ValueError("Frame failed to decode")
+        count += 1
+    cpu, wall = time.process_time() - start_cpu, time.perf_counter() - start_wall
+
+    sock.close()
+    server.join()
+    return count, cpu, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the CPU cost of reading and decoding stream frames")
+    parser.add_argument("--photos", default=os.path.join("RPI", "photos"), help="Directory of JPEGs to stream")
+    parser.add_argument("--frames", type=int, default=400, help="Frames per run")
+    parser.add_argument("--fps", type=float, default=20, help="Frame rate of the server, 0 for as fast as possible")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--quality", type=int, default=45, help="JPEG quality, as on the Pi")
+    parser.add_argument("--port", type=int, default=50555)
+    parser.add_argument("--no-decode", action="store_true", help="Only read the frames, to time the framing alone")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.photos, args.width, args.height, args.quality)
+    if not payloads:
+        print(f"No images in {args.photos}")
+        return 1
+    print(f"{len(payloads)} image(s), {np.mean([len(p) for p in payloads]) / 1e3:.1f} kB per frame on average, "
+          f"{args.width}x{args.height} @ {args.fps:g} fps")
+
+    print(f"{'reader':<10} {'frames':>7} {'CPU/frame (ms)':>15} {'wall fps':>9}")
+    for i, reader in enumerate(READERS):
+        count, cpu, wall = run(reader, args.port + i, payloads, args.frames, args.fps, not args.no_decode)
+        print(f"{reader:<10} {count:>7} {cpu / max(count, 1) * 1e3:>15.3f} {count / wall:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,7 +26,7 @@ def main():
     last_t = None
     frame_idx = 0
 
-    def on_result(res, annotated_frame):
+    def on_result(res, annotated_frame, raw_frame):
         nonlocal last_t, frame_idx
         frame_idx += 1
         now = time.perf_counter()
@@ -41,7 +41,7 @@ def main():
         else:
             out = measure_arrow_bullseye_distance_planar_cm(
                 results=res,
-                frame_bgr=annotated_frame,                  # use the current frame
+                frame_bgr=raw_frame,                        # use the current frame
                 bullseye_side_cm=args.bullseye_side_cm,
                 min_conf=args.min_conf,
                 annotate_on=draw_on
@@ -40,7 +40,7 @@ def main():
 
     def on_result(res, annotated_frame, raw_frame):
         """
-        res: YOLO result object or None
+        res: inference.Detections or None
         annotated_frame: frame with boxes (may be None if no detections)
         raw_frame: the original frame from the stream (never None)
         """
@@ -58,14 +58,11 @@ def main():
         frame_to_show = annotated_frame if annotated_frame is not None else raw_frame
 
         # Log detections
-        if res is None or getattr(res, "boxes", None) is None or len(res.boxes) == 0:
+        if res is None or len(res) == 0:
             print(f"[{frame_idx:06d}] no detections | fps={fps_live:.1f}", end="\r")
         else:
-            names = getattr(res, "names", {})
-            cls_ids = res.boxes.cls.tolist() if hasattr(res.boxes.cls, "tolist") else res.boxes.cls
-            confs = res.boxes.conf.tolist() if hasattr(res.boxes.conf, "tolist") else res.boxes.conf
-            dets = ", ".join(f"{names.get(int(c), str(int(c)))}:{conf:.2f}" for c, conf in zip(cls_ids, confs))
-            print(f"[{frame_idx:06d}] {len(cls_ids)} det(s): {dets} | fps={fps_live:.1f}   ")
+            dets = ", ".join(f"{name}:{conf:.2f}" for name, conf in zip(res.labels, res.conf.tolist()))
+            print(f"[{frame_idx:06d}] {len(res)} det(s): {dets} | fps={fps_live:.1f}   ")
 
         # Optional per-frame saving (saves what you saw)
         if args.save_dir:
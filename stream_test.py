@@ -16,17 +16,20 @@ def main():
     parser.add_argument("--conf", type=float, default=0.7, help="Confidence threshold")
     parser.add_argument("--no-gui", default=False, help="Disable live window")
     parser.add_argument("--save-dir", default="", help="Directory to save annotated frames")
+    parser.add_argument("--backend", default=None, choices=["torch", "onnx", "openvino"],
+                        help="Inference backend (defaults to YOLO_BACKEND, else torch)")
+    parser.add_argument("--imgsz", default=None, help="Inference size, e.g. 320, 416, 640 or auto (defaults to YOLO_IMGSZ, else 640)")
     args = parser.parse_args()
 
     if args.save_dir:
         os.makedirs(args.save_dir, exist_ok=True)
 
-    listener = StreamListener(weights=args.weights)
+    listener = StreamListener(weights=args.weights, backend=args.backend, imgsz=args.imgsz)
 
     last_t = None
     frame_idx = 0
 
-    def on_result(res, annotated_frame):
+    def on_result(res, frame):
         nonlocal last_t, frame_idx
         frame_idx += 1
         now = time.perf_counter()
@@ -38,17 +41,14 @@ def main():
             print(f"[{frame_idx:06d}] no detections | fps={fps:.1f}", end="\r")
         else:
             # Summarize detections
-            names = res.names
-            cls_ids = res.boxes.cls.tolist() if hasattr(res.boxes.cls, "tolist") else res.boxes.cls
-            confs = res.boxes.conf.tolist() if hasattr(res.boxes.conf, "tolist") else res.boxes.conf
-            dets = ", ".join(f"{names[int(c)]}:{conf:.2f}" for c, conf in zip(cls_ids, confs))
-            print(f"[{frame_idx:06d}] {len(cls_ids)} det(s): {dets} | fps={fps:.1f}   ")
+            dets = ", ".join(f"{name}:{conf:.2f}" for name, conf in zip(res.labels, res.conf.tolist()))
+            print(f"[{frame_idx:06d}] {len(res)} det(s): {dets} | fps={fps:.1f}   ")
 
             # Save if requested
-            if args.save_dir and annotated_frame is not None:
+            if args.save_dir:
                 out_path = os.path.join(args.save_dir, f"frame_{frame_idx:06d}.jpg")
                 try:
-                    cv2.imwrite(out_path, annotated_frame)
+                    cv2.imwrite(out_path, res.plot())
                 except Exception as e:
                     print(f"\nFailed to save {out_path}: {e}")
 
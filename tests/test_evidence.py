@@ -0,0 +1,126 @@
+import socket
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import StreamListener as stream_listener
+from evidence import EvidenceAccumulator
+from inference import Detections, InferenceScheduler
+
+FPS = 20
+FRAMES = 60
+
+
+class CardDetector:
+    """Stands in for inference.Detector: one card in the middle of the frame, on the first `boxes` calls"""
+    model = None
+    roi_hits = 0
+    roi_fallbacks = 0
+
+    def __init__(self, boxes=FRAMES):
+        self.boxes = boxes
+        self.calls = 0
+
+    def predict(self, frame, conf=0.7, roi=None, timestamp=None):
+        self.calls += 1
+        if self.calls > self.boxes:
+            return Detections([], [], [], {0: "11"}, frame, timestamp)
+        height, width = frame.shape[:2]
+        box = [width * 0.4, height * 0.4, width * 0.6, height * 0.6]
+        return Detections([box], [0.9], [0], {0: "11"}, frame, timestamp)
+
+
+def serve(server, payloads):
+    """Stream the JPEGs at FPS, as the RPI would"""
+    client, _ = server.accept()
+    with client:
+        client.makefile("rb").readline()
+        client.sendall(b"OK STREAMING\n")
+        for payload in payloads:
+            client.sendall(struct.pack("!I", len(payload)) + payload)
+            time.sleep(1 / FPS)
+    server.close()
+
+
+def get_frames(shift):
+    """FRAMES frames of a textured scene, moving shift pixels to the side every frame"""
+    texture = np.random.default_rng(0).integers(0, 255, (30, 40, 3), dtype=np.uint8)
+    scene = cv2.resize(texture, (640, 480), interpolation=cv2.INTER_LINEAR)
+    return [cv2.imencode(".jpg", np.roll(scene, shift * i, axis=1))[1].tobytes() for i in range(FRAMES)]
+
+
+def replay(monkeypatch, payloads, boxes=FRAMES, snap=False):
+    """
+    Seconds from the first frame to the card being decided (None if it never is), the frames
+    inference ran on, and the frames the tracker and the scene gate handled instead. With snap, the whole stream is in a SNAP window.
+    """
+    server = socket.create_server(("127.0.0.1", 0))
+    monkeypatch.setenv("RPI_HOST", "127.0.0.1")
+    monkeypatch.setenv("STREAM_PORT", str(server.getsockname()[1]))
+    # The defaults shipped in .env
+    monkeypatch.setenv("SCENE_GATE", "1")
+    monkeypatch.setenv("SCENE_MAX_SKIP", "1.0")
+    monkeypatch.setenv("TRACK_EVERY", "3")
+    detector = CardDetector(boxes)
+    monkeypatch.setattr(stream_listener, "create_detector", lambda *args: detector)
+    scheduler = InferenceScheduler()
+    if snap:
+        scheduler.disarm()
+        scheduler.arm(window=60)
+    threading.Thread(target=serve, args=(server, payloads), daemon=True).start()
+
+    listener = stream_listener.StreamListener("unused.pt", scheduler=scheduler)
+    evidence = EvidenceAccumulator(hit_conf=0.7)
+    times = []
+    decided = []
+
+    def on_result(result, frame):
+        times.append(listener.frame_time)
+        if evidence.update(result, listener.frame_time) and not decided:
+            decided.append(listener.frame_time)
+
+    listener.start_stream_read(on_result, lambda: None, show_video=False)
+    latency = (decided[0] - times[0]) * 1e-9 if decided else None
+    return latency, detector.calls, listener.frames_tracked + listener.frames_skipped
+
+
+# A single false box must not decide a card however many frames the scene gate or the tracker carry it to
+def test_one_box_carried_by_the_gate_is_not_decided(monkeypatch):
+    latency, inferences, carried = replay(monkeypatch, get_frames(shift=0), boxes=1)
+    assert inferences < carried
+    assert latency is None
+
+
+def test_one_box_carried_by_the_tracker_is_not_decided(monkeypatch):
+    latency, _, carried = replay(monkeypatch, get_frames(shift=16), boxes=1)
+    assert carried > 0
+    assert latency is None
+
+
+# In a SNAP window every frame gets a real detection, so two hits decide on the second frame
+def test_snap_window_decides_on_the_second_frame(monkeypatch):
+    latency, _, carried = replay(monkeypatch, get_frames(shift=0), snap=True)
+    assert carried == 0
+    assert latency < 2 / FPS
+
+
+def test_carried_boxes_are_not_new_evidence():
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    result = Detections([[256, 192, 384, 288]], [0.9], [0], {0: "11"}, frame, timestamp=1)
+    evidence = EvidenceAccumulator(hit_conf=0.7)
+
+    assert evidence.update(result, 1) == []
+    assert evidence.update(result, 1) == []
+    assert evidence.update(result.for_frame(frame, 2), 2) == []
+    assert evidence.get("11").last_seen == 2
+    tracked = Detections(result.xyxy, result.conf, result.cls, result.names, frame, timestamp=3, tracked=True)
+    assert evidence.update(tracked, 3) == []
+    assert evidence.update(Detections(result.xyxy, result.conf, result.cls, result.names, frame, timestamp=4), 4) == ["11"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,183 @@
+import os
+
+import cv2
+import numpy as np
+
+
+def box_iou(a, b):
+    """IoU of every box in a (N, 4) with every box in b (M, 4), x1 y1 x2 y2, as an (N, M) array"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+class Track:
+    """A detected card followed across frames"""
+    def __init__(self, box, conf, cls, timestamp):
+        self.box = np.asarray(box, dtype=np.float32) # x1 y1 x2 y2 in frame pixels, at self.time
+        self.conf = conf
+        self.cls = cls
+        self.time = timestamp # time_ns() of the frame self.box is for
+        self.detected_box = self.box.copy() # box of the last real detection
+        self.detected_time = timestamp # time_ns() of the last real detection
+        self.velocity = np.zeros(2, dtype=np.float32) # centroid motion between detections, pixels per second
+        self.template = None # grayscale patch of the last real detection, at Tracker.scale
+        self.score = 1.0 # how well the template matched on the last frame
+
+    def centroid(self, box=None):
+        box = self.box if box is None else box
+        return (box[:2] + box[2:]) / 2
+
+
+class Tracker:
+    """
+    Carries the boxes of the last detection over the frames between detections.
+
+    Detections are associated with the tracks of the same class by IoU, best overlap first; the
+    others start new tracks. Between detections a track moves with the velocity of its centroid
+    between its last two detections and, with template matching on, snaps to where the patch of its
+    last detection matches best around there, on a grayscale frame scaled down by scale. A track
+    whose patch stops matching, that leaves the frame or that has gone max_age seconds without a
+    detection makes the tracker degraded: the caller should run a full detection on the next frame.
+    """
+    def __init__(self, iou_threshold=0.3, max_age=0.5, match_threshold=0.6, template_match=True, scale=0.25):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.match_threshold = match_threshold
+        self.template_match = template_match
+        self.scale = scale
+        self.tracks = []
+        self.degraded = False
+
+    @classmethod
+    def from_env(cls):
+        """Tracker with the TRACK_* settings from the environment"""
+        return cls(iou_threshold=float(os.getenv("TRACK_IOU", 0.3)),
+                   max_age=float(os.getenv("TRACK_MAX_AGE", 0.5)),
+                   match_threshold=float(os.getenv("TRACK_MATCH_THRESHOLD", 0.6)),
+                   template_match=os.getenv("TRACK_TEMPLATE_MATCH", "1").strip() != "0")
+
+    def reset(self):
+        self.tracks = []
+        self.degraded = False
+
+    def _gray(self, frame):
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def _cut_template(self, gray, box):
+        x1, y1, x2, y2 = np.round(box * self.scale).astype(int)
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2, gray.shape[1]), min(y2, gray.shape[0])
+        # Too small to match reliably, the track moves on its velocity alone
+        if x2 - x1 < 4 or y2 - y1 < 4:
+            return None
+        return gray[y1:y2, x1:x2].copy()
+
+    def update(self, boxes, confs, classes, frame, timestamp):
+        """
+        Take in a real detection
+
+        Inputs
+        ------
+        boxes: (N, 4) x1 y1 x2 y2 in frame pixels
+        confs, classes: (N,) confidence and class index of each box
+        frame: BGR frame the detection ran on
+        timestamp: time_ns() of the frame
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        gray = self._gray(frame) if self.template_match else None
+
+        # Greedy association, best overlap first, same class only
+        matched = dict() # detection index -> track
+        taken = set() # indices of the tracks matched
+        if self.tracks and len(boxes):
+            ious = box_iou(boxes, np.array([track.box for track in self.tracks]))
+            for d, t in zip(*np.unravel_index(np.argsort(-ious, axis=None), ious.shape)):
+                if ious[d, t] < self.iou_threshold:
+                    break
+                if d in matched or t in taken or self.tracks[t].cls != int(classes[d]):
+                    continue
+                matched[d] = self.tracks[t]
+                taken.add(t)
+
+        tracks = []
+        for d, box in enumerate(boxes):
+            track = matched.get(d)
+            if track is None:
+                track = Track(box, float(confs[d]), int(classes[d]), timestamp)
+            else:
+                dt = (timestamp - track.detected_time) * 1e-9
+                if dt > 0:
+                    velocity = (track.centroid(box) - track.centroid(track.detected_box)) / dt
+                    track.velocity = 0.5 * track.velocity + 0.5 * velocity
+                track.box = box.copy()
+                track.detected_box = box.copy()
+                track.conf = float(confs[d])
+                track.time = track.detected_time = timestamp
+            track.score = 1.0
+            if gray is not None:
+                track.template = self._cut_template(gray, box)
+            tracks.append(track)
+        self.tracks = tracks
+        self.degraded = False
+
+    def propagate(self, frame, timestamp):
+        """
+        Move the tracks onto a frame no detection ran on
+
+        Inputs
+        ------
+        frame: BGR frame
+        timestamp: time_ns() of the frame
+
+        Returns
+        -------
+        (N, 6) array of x1 y1 x2 y2 conf cls, as a detection would give; degraded tells whether to trust it
+        """
+        height, width = frame.shape[:2]
+        gray = self._gray(frame) if self.template_match and self.tracks else None
+        data = []
+        kept = []
+        for track in self.tracks:
+            box = track.box + np.tile(track.velocity * (timestamp - track.time) * 1e-9, 2)
+
+            if gray is not None and track.template is not None:
+                th, tw = track.template.shape
+                # Search around the box moved by the velocity, by half its size each way
+                x1, y1, x2, y2 = box * self.scale
+                margin_x, margin_y = tw // 2 + 2, th // 2 + 2
+                sx1, sy1 = max(int(x1) - margin_x, 0), max(int(y1) - margin_y, 0)
+                sx2, sy2 = min(int(x2) + margin_x, gray.shape[1]), min(int(y2) + margin_y, gray.shape[0])
+                if sx2 - sx1 >= tw and sy2 - sy1 >= th:
+                    scores = cv2.matchTemplate(gray[sy1:sy2, sx1:sx2], track.template, cv2.TM_CCOEFF_NORMED)
+                    _, track.score, _, (mx, my) = cv2.minMaxLoc(scores)
+                    if track.score >= self.match_threshold:
+                        left, top = (sx1 + mx) / self.scale, (sy1 + my) / self.scale
+                        box = np.array([left, top, left + box[2] - box[0], top + box[3] - box[1]], dtype=np.float32)
+                else:
+                    track.score = 0.0
+                if track.score < self.match_threshold:
+                    self.degraded = True
+
+            track.box, track.time = box, timestamp
+            centre = track.centroid()
+            if not (0 <= centre[0] < width and 0 <= centre[1] < height):
+                # Left the frame
+                self.degraded = True
+                continue
+            if (timestamp - track.detected_time) * 1e-9 > self.max_age:
+                self.degraded = True
+            kept.append(track)
+            data.append([*box, track.conf, track.cls])
+        self.tracks = kept
+        return np.array(data, dtype=np.float32).reshape(-1, 6)
+
+    def get_age(self, timestamp):
+        """Seconds since the last real detection of the oldest track, 0 without any"""
+        if not self.tracks:
+            return 0.0
+        return max((timestamp - track.detected_time) * 1e-9 for track in self.tracks)